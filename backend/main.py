@@ -8,6 +8,9 @@ from routes import course
 from routes import chat
 from routes import xp
 from routes import settings
+from routes import leaderboard
+from routes import analytics
+from routes import search
 
 app = FastAPI()
 
@@ -27,6 +30,9 @@ app.include_router(course.router)
 app.include_router(chat.router)
 app.include_router(xp.router)
 app.include_router(settings.router)
+app.include_router(leaderboard.router)
+app.include_router(analytics.router)
+app.include_router(search.router)
 
 if __name__ == "__main__":
     import uvicorn
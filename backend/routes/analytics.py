@@ -0,0 +1,44 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Dict, Any, Optional
+from services.analytics_service import get_series, get_topic_breakdown, rebuild_rollups
+
+router = APIRouter(prefix="/analytics", tags=["analytics"])
+
+@router.get("/series")
+def get_metric_series(
+    metric: str = Query("xp_earned", description="xp_earned, challenges_attempted, challenges_solved, flashcards_reviewed, lessons_completed or courses_completed"),
+    granularity: str = Query("day", description="'hour', 'day' or 'week'"),
+    user_id: Optional[str] = Query(None, description="User ID (all users if omitted)"),
+    start: Optional[str] = Query(None, alias="from", description="Start time (ISO format)"),
+    end: Optional[str] = Query(None, alias="to", description="End time (ISO format)"),
+    points: int = Query(0, ge=0, le=1000, description="Downsample to at most this many points (0 keeps all)")
+) -> Dict[str, Any]:
+    """Get a chart series from the pre-aggregated rollups"""
+    try:
+        return get_series(metric, granularity, user_id, start, end, points)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get series: {str(e)}")
+
+@router.get("/topics")
+def get_topics(
+    user_id: Optional[str] = Query(None, description="User ID (all users if omitted)"),
+    start: Optional[str] = Query(None, alias="from", description="Start date (ISO format)"),
+    end: Optional[str] = Query(None, alias="to", description="End date (ISO format)")
+) -> Dict[str, Any]:
+    """Get challenges solved per topic"""
+    try:
+        return get_topic_breakdown(user_id, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get topics: {str(e)}")
+
+@router.post("/rebuild")
+def rebuild() -> Dict[str, Any]:
+    """Recompute all rollups from the XP ledger and submission log"""
+    try:
+        return rebuild_rollups()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to rebuild rollups: {str(e)}")
@@ -1,18 +1,140 @@
-from fastapi import APIRouter, HTTPException
+import uuid
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Header, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from services.ai_service import ask_gemma_tutor
+from services.retrieval_service import retrieve_context, retrieval_status, DEFAULT_TOP_K, DEFAULT_TOKEN_BUDGET
+from services.answer_cache_service import lookup_answer, store_answer, replay_answer, clear_cache, cache_stats
+from services.answer_stream_service import persist_stream
+from services.chat_service import append_message
+from services.stream_relay_service import start_stream, get_stream, parse_last_event_id, stream_stats, SSE_HEADERS
 
 router = APIRouter()
 
 class AskRequest(BaseModel):
     prompt: str
+    use_course_material: bool = True
+    top_k: int = DEFAULT_TOP_K
+    context_token_budget: int = DEFAULT_TOKEN_BUDGET
+    use_cache: bool = True
+    chat_id: Optional[str] = None     # save the question and the answer to this chat
+    message_id: Optional[str] = None
+    answer_id: Optional[str] = None
+    sse: bool = False                 # resumable server-sent events instead of plain text
+
+def course_material_context(request: AskRequest) -> str:
+    """Retrieved lesson and challenge excerpts for the prompt; empty if disabled"""
+    if not request.use_course_material:
+        return ''
+    return retrieve_context(request.prompt, request.top_k, request.context_token_budget)
 
 @router.post("/ask")
 async def ask(request: AskRequest):
     if not request.prompt:
         raise HTTPException(status_code=400, detail="No prompt provided.")
+    answer_id = None
+    if request.chat_id:
+        question = {'id': request.message_id or str(uuid.uuid4()), 'content': request.prompt,
+                    'sender': 'user', 'timestamp': datetime.now()}
+        # Saving rewrites chats.json and re-syncs search; like the Ollama calls below it runs in a worker thread
+        if await run_in_threadpool(append_message, request.chat_id, question) is None:
+            raise HTTPException(status_code=404, detail="Chat not found")
+        answer_id = request.answer_id or str(uuid.uuid4())
+
+    def respond(stream, headers):
+        if answer_id:
+            stream = persist_stream(request.chat_id, stream, answer_id)
+            headers = {**headers, "X-Answer-Id": answer_id}
+        if request.sse:
+            relay = start_stream(stream)
+            return StreamingResponse(relay.subscribe(), media_type="text/event-stream",
+                                     headers={**headers, **SSE_HEADERS, "X-Stream-Id": relay.id})
+        return StreamingResponse(stream, media_type="text/plain", headers=headers)
+
+    # Retrieval embeds the question through Ollama
+    context = await run_in_threadpool(course_material_context, request)
+
+    cached = {'entry': None, 'vector': None}
+    if request.use_cache:
+        try:
+            cached = await run_in_threadpool(lookup_answer, request.prompt, context)
+        except Exception as e:
+            print(f"Answer cache lookup failed: {e}")
+    if cached['entry']:
+        return respond(replay_answer(cached['entry']), {"X-Tutor-Cache": "hit"})
+
     def event_stream():
-        for chunk in ask_gemma_tutor(request.prompt):
+        chunks = []
+        for chunk in ask_gemma_tutor(request.prompt, context):
+            chunks.append(chunk)
             yield chunk
-    return StreamingResponse(event_stream(), media_type="text/plain") 
\ No newline at end of file
+        # Only complete answers are cached
+        if request.use_cache and chunks:
+            try:
+                store_answer(request.prompt, context, chunks, cached['vector'])
+            except Exception as e:
+                print(f"Failed to cache answer: {e}")
+    return respond(event_stream(), {"X-Tutor-Cache": "miss" if request.use_cache else "bypass"})
+
+@router.get("/ask/stream/{stream_id}")
+def resume_stream(
+    stream_id: str,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    from_event: Optional[str] = Query(None, alias="last_event_id", description="Used when the header cannot be set")
+):
+    """Reattach to an SSE answer stream, continuing after the last event the client received"""
+    try:
+        resume = parse_last_event_id(last_event_id or from_event)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if resume['stream_id'] and resume['stream_id'] != stream_id:
+        raise HTTPException(status_code=400, detail="Last-Event-ID belongs to another stream")
+    relay = get_stream(stream_id)
+    if not relay:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    return StreamingResponse(relay.subscribe(resume['seq']), media_type="text/event-stream",
+                             headers={**SSE_HEADERS, "X-Stream-Id": relay.id})
+
+@router.delete("/ask/stream/{stream_id}")
+def cancel_stream(stream_id: str):
+    """Stop an SSE answer stream's generation"""
+    relay = get_stream(stream_id)
+    if not relay:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    relay.cancel()
+    return relay.status()
+
+@router.get("/ask/streams")
+def get_streams():
+    """Answer streams currently buffered for reconnects"""
+    try:
+        return stream_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get streams: {str(e)}")
+
+@router.get("/ask/retrieval")
+def get_retrieval_status():
+    """How much course material is indexed for the tutor"""
+    try:
+        return retrieval_status()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get retrieval status: {str(e)}")
+
+@router.get("/ask/cache")
+def get_answer_cache_stats():
+    """Size and hit count of the tutor answer cache"""
+    try:
+        return cache_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get answer cache stats: {str(e)}")
+
+@router.delete("/ask/cache")
+def delete_answer_cache():
+    """Forget all cached tutor answers"""
+    try:
+        return clear_cache()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to clear answer cache: {str(e)}")
@@ -1,12 +1,18 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Query, Request
 from pydantic import BaseModel
 from typing import List, Optional
 from services.challenge_service import (
     load_challenges, save_challenges, generate_challenge, verify_with_model,
     get_solution, get_hints, get_single_hint, get_congrats_feedback, update_user_progress, get_user_progress,
-    mark_challenge_completed, reset_completed_challenges
+    mark_challenge_completed, reset_completed_challenges, evaluate_submission, is_perfect_solution,
+    iter_batch_verification
 )
+from services.test_suite_service import get_test_suite, build_test_cases
+from services.submission_service import record_submission, record_challenge_opened, query_submissions
+from services.sandbox_service import code_execution_allowed, CODE_EXECUTION_DISABLED
+from fastapi.responses import StreamingResponse
 import json
+import time
 
 router = APIRouter(prefix="/challenge")
 
@@ -21,12 +27,37 @@ class VerifyRequest(BaseModel):
     challenge_id: int
     user_code: str
     user_id: str = "default_user"  # Default user ID for now
+    grade_performance: bool = False  # Time the solution on scaled inputs
+
+class BatchSubmission(BaseModel):
+    challenge_id: int
+    user_code: str
+    user_id: str = "default_user"
+
+class BatchVerifyRequest(BaseModel):
+    submissions: List[BatchSubmission]
+    max_concurrency: int = 4  # Verifications running at once
+    grade_performance: bool = False
+
+# Limits for /verify/batch
+MAX_BATCH_SUBMISSIONS = 500
+MAX_BATCH_CONCURRENCY = 16
 
 class GenerateRequest(BaseModel):
     difficulty: str = "easy"
     topic: str = "algorithms"
     language: str = "python"
 
+class ValidatedGenerateRequest(BaseModel):
+    difficulty: str = "easy"
+    topic: str = "algorithms"
+    language: str = "python"
+    count: int = 3  # Candidates to generate
+    max_concurrency: int = 3
+
+# Limits for /generate/validated
+MAX_GENERATE_CANDIDATES = 10
+
 class CongratsRequest(BaseModel):
     title: str
     user_code: str
@@ -34,6 +65,10 @@ class CongratsRequest(BaseModel):
 class ProgressRequest(BaseModel):
     user_id: str = "default_user"
 
+class OpenChallengeRequest(BaseModel):
+    challenge_id: int
+    user_id: str = "default_user"
+
 @router.get("/all")
 def get_all_challenges():
     """Get all available challenges"""
@@ -70,13 +105,52 @@ def generate_new_challenge(request: GenerateRequest):
         challenges.append(challenge)
         save_challenges(challenges)
         
-        return {"challenge": challenge, "message": "Challenge generated successfully"}
+        # Compile the examples once so malformed ones are reported now, not on every submission
+        suite = get_test_suite(challenge)
+        if suite['errors']:
+            print(f"Challenge {challenge['id']} has malformed examples: {suite['errors']}")
+        
+        return {
+            "challenge": challenge,
+            "test_suite_errors": suite['errors'],
+            "message": "Challenge generated successfully"
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate challenge: {str(e)}")
 
+@router.post("/generate/validated")
+def generate_validated_challenges_endpoint(request: ValidatedGenerateRequest, http_request: Request):
+    """
+    Generate several challenges in parallel and publish only those whose examples
+    agree with a reference solution run in the sandbox (model-written code, so only
+    local requests with code execution enabled may ask for it)
+    """
+    if request.count < 1 or request.count > MAX_GENERATE_CANDIDATES:
+        raise HTTPException(status_code=400, detail=f"Count must be between 1 and {MAX_GENERATE_CANDIDATES}")
+    _check_code_execution(http_request)
+    try:
+        from services.publish_service import generate_validated_challenges
+        return generate_validated_challenges(
+            difficulty=request.difficulty,
+            topic=request.topic,
+            language=request.language,
+            count=request.count,
+            max_concurrency=max(1, min(request.max_concurrency, request.count))
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate challenges: {str(e)}")
+
+def _check_code_execution(http_request: Request):
+    """Running submitted or generated code is only allowed for local requests with it enabled"""
+    client_host = http_request.client.host if http_request.client else None
+    if not code_execution_allowed(client_host, http_request.headers.get('origin')):
+        raise HTTPException(status_code=403, detail=CODE_EXECUTION_DISABLED)
+
 @router.post("/verify")
-def verify_solution(request: VerifyRequest):
+def verify_solution(request: VerifyRequest, http_request: Request):
     """Verify user solution using AI model"""
+    if request.grade_performance:
+        _check_code_execution(http_request)
     try:
         challenges = load_challenges()
         challenge = next((c for c in challenges if c["id"] == request.challenge_id), None)
@@ -86,32 +160,19 @@ def verify_solution(request: VerifyRequest):
         
         # Use AI model to verify the solution
         print(f"Verifying challenge {request.challenge_id} with code length: {len(request.user_code)}")
-        result = verify_with_model(challenge, request.user_code, challenge.get('examples', []))
+        started = time.perf_counter()
+        result = evaluate_submission(challenge, request.user_code, request.grade_performance)
+        verification_ms = (time.perf_counter() - started) * 1000
         print(f"AI verification result: {result.get('correct', 'unknown')}")
+        result['perfect_solution'] = result['correct'] and is_perfect_solution(result)
         
-        # Check if the code is actually complete before considering AI verification result
-        user_code_clean = request.user_code.strip()
-        is_complete_code = (
-            user_code_clean and 
-            not user_code_clean.endswith('pass') and
-            not '# Your code here' in user_code_clean and
-            'return ' in user_code_clean and  # Must have a return statement
-            len(user_code_clean.split('\n')) > 5  # Must have more than just template
-        )
-        
-        print(f"Code completeness check: {is_complete_code}")
-        # Only consider AI verification if code is actually complete
-        if is_complete_code and result.get('correct', False):
+        if result['correct']:
             xp_earned = challenge.get('xpReward', 50)
             
-            # Check if all test cases passed (perfect solution)
-            test_results = result.get('test_results', [])
-            all_tests_passed = all(test.get('pass', False) for test in test_results)
-            
-            # Award bonus XP for perfect solution
-            if all_tests_passed:
+            # Award bonus XP for perfect solution (only if it is also efficient when graded)
+            if result['perfect_solution']:
                 from services.xp_service import award_xp_for_perfect_solution
-                perfect_xp_result = award_xp_for_perfect_solution(request.user_id, 25)
+                perfect_xp_result = award_xp_for_perfect_solution(request.user_id, 25, request.challenge_id)
                 perfect_bonus = perfect_xp_result['total_xp_earned']
             else:
                 perfect_bonus = 0
@@ -133,23 +194,87 @@ def verify_solution(request: VerifyRequest):
             result['user_progress'] = progress_result['progress']
             result['new_achievements'] = progress_result['new_achievements']
             result['achievement_xp_earned'] = progress_result['achievement_xp_earned']
-        else:
-            # If code is incomplete, override AI result and mark as failed
-            result['correct'] = False
-            result['feedback'] = 'Code is incomplete. Please implement a complete solution.'
-            result['test_results'] = [{
-                'input': str(test_case['input']),
-                'expected_output': str(test_case['output']),
-                'actual_output': 'Code incomplete',
-                'pass': False
-            } for test_case in challenge.get('examples', [])]
         
+        record_submission(request.user_id, request.challenge_id, request.user_code, result, verification_ms,
+                          topic=challenge.get('topic', ''))
         return result
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to verify solution: {str(e)}")
 
+@router.post("/verify/batch")
+def verify_solutions_batch(request: BatchVerifyRequest, http_request: Request):
+    """
+    Verify many submissions at once (e.g. regrading a class after fixing a challenge).
+    Streams one NDJSON line per submission as it finishes, then a summary line
+    once XP and progress for all accepted submissions are committed together.
+    """
+    if not request.submissions:
+        raise HTTPException(status_code=400, detail="No submissions provided")
+    if len(request.submissions) > MAX_BATCH_SUBMISSIONS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SUBMISSIONS} submissions per batch")
+    if request.grade_performance:
+        _check_code_execution(http_request)
+    
+    submissions = [submission.dict() for submission in request.submissions]
+    max_concurrency = max(1, min(request.max_concurrency, MAX_BATCH_CONCURRENCY))
+    
+    def result_stream():
+        try:
+            for item in iter_batch_verification(submissions, max_concurrency, request.grade_performance):
+                yield json.dumps(item, default=str) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "detail": f"Batch verification failed: {str(e)}"}) + "\n"
+    
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+@router.post("/open")
+def open_challenge(request: OpenChallengeRequest):
+    """Record that a user opened a challenge, so the time to solve it can be measured"""
+    try:
+        opened_at = record_challenge_opened(request.user_id, request.challenge_id)
+        return {"challenge_id": request.challenge_id, "opened_at": opened_at}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to record challenge open: {str(e)}")
+
+@router.get("/submissions")
+def get_submissions(
+    user_id: Optional[str] = Query(None, description="Only submissions by this user"),
+    challenge_id: Optional[int] = Query(None, description="Only submissions for this challenge"),
+    offset: int = Query(0, ge=0, description="Number of newer submissions to skip"),
+    limit: int = Query(20, ge=1, le=100, description="Page size")
+):
+    """Get submission history, newest first"""
+    try:
+        return query_submissions(user_id, challenge_id, offset, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get submissions: {str(e)}")
+
+@router.post("/test-suite")
+def get_test_suite_endpoint(request: ChallengeIdRequest):
+    """Get the compiled test suite for a challenge, including any malformed examples"""
+    try:
+        challenges = load_challenges()
+        challenge = next((c for c in challenges if c["id"] == request.challenge_id), None)
+        
+        if not challenge:
+            raise HTTPException(status_code=404, detail="Challenge not found")
+        
+        suite = get_test_suite(challenge)
+        return {
+            "challenge_id": request.challenge_id,
+            "version": suite['version'],
+            "function_name": suite['function_name'],
+            "params": suite['params'],
+            "test_cases": build_test_cases(challenge, suite),
+            "errors": suite['errors']
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get test suite: {str(e)}")
+
 @router.post("/solution")
 def get_solution_endpoint(request: ChallengeIdRequest):
     """Get AI-generated solution for a challenge"""
@@ -232,6 +357,15 @@ def get_achievements(request: ProgressRequest):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get achievements: {str(e)}")
 
+@router.post("/next-achievements")
+def get_next_achievements_endpoint(request: ProgressRequest):
+    """Get the next achievement per metric and the user's progress towards it"""
+    try:
+        from services.achievement_service import get_next_achievements
+        return get_next_achievements(request.user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get next achievements: {str(e)}")
+
 @router.post("/level-info")
 def get_level_info(request: ProgressRequest):
     """Get detailed level information for the user"""
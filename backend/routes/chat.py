@@ -1,9 +1,16 @@
+import uuid
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Any, Dict, List, Optional
 from services.chat_service import (
     get_all_chats, get_chat_by_id, create_chat, update_chat, delete_chat
 )
+from services.conversation_service import start_chat_turn, HISTORY_TOKEN_BUDGET
+from services.retrieval_service import retrieve_context
+from services.tutor_session_service import stream_chat_answer, end_session, session_stats
+from services.answer_stream_service import persist_stream
+from services.stream_relay_service import start_stream, SSE_HEADERS
 
 router = APIRouter(prefix="/chat")
 
@@ -13,6 +20,7 @@ class ChatMessage(BaseModel):
     sender: str  # "user" or "tutor"
     timestamp: str
     threadId: Optional[str] = None
+    status: Optional[str] = None  # "interrupted" or "error" for answers that did not finish
 
 class ChatSession(BaseModel):
     id: str
@@ -30,6 +38,15 @@ class UpdateChatRequest(BaseModel):
     name: Optional[str] = None
     messages: Optional[List[Dict[str, Any]]] = None
 
+class ChatAskRequest(BaseModel):
+    prompt: str
+    message_id: Optional[str] = None  # id for the stored question, so it matches the client's copy
+    answer_id: Optional[str] = None   # id for the stored answer
+    use_course_material: bool = True
+    history_token_budget: int = HISTORY_TOKEN_BUDGET
+    use_session: bool = True  # reuse the model state of the previous turn
+    sse: bool = False         # resumable server-sent events (see GET /ask/stream/{stream_id})
+
 @router.get("/")
 def get_chats():
     """Get all chat sessions"""
@@ -96,6 +113,52 @@ def delete_existing_chat(chat_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete chat: {str(e)}")
 
+@router.post("/{chat_id}/ask")
+def ask_in_chat(chat_id: str, request: ChatAskRequest):
+    """
+    Ask the tutor within a chat. The question is stored in the chat and answered with
+    the chat's rolling summary and latest messages, kept under a token budget. The
+    answer is saved to the chat as it streams, so the client does not need to send it back.
+    """
+    if not request.prompt:
+        raise HTTPException(status_code=400, detail="No prompt provided.")
+    try:
+        turn = start_chat_turn(chat_id, request.prompt, request.message_id, max(0, request.history_token_budget))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to prepare chat turn: {str(e)}")
+
+    context = retrieve_context(request.prompt) if request.use_course_material else ''
+    answer = stream_chat_answer(chat_id, request.prompt, context, turn, request.use_session)
+    answer_id = request.answer_id or str(uuid.uuid4())
+    stream = persist_stream(chat_id, answer['stream'], answer_id)
+    headers = {
+        "X-Message-Id": turn['message']['id'],
+        "X-Answer-Id": answer_id,
+        "X-Prompt-Tokens": str(answer['prompt_tokens']),
+        "X-History-Messages": str(turn['verbatim_messages']),
+        "X-Tutor-Mode": answer['mode']
+    }
+    if request.sse:
+        relay = start_stream(stream)
+        return StreamingResponse(relay.subscribe(), media_type="text/event-stream",
+                                 headers={**headers, **SSE_HEADERS, "X-Stream-Id": relay.id})
+    return StreamingResponse(stream, media_type="text/plain", headers=headers)
+
+@router.get("/sessions/stats")
+def get_session_stats():
+    """Live tutor sessions and time to first token with and without them"""
+    try:
+        return session_stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get session stats: {str(e)}")
+
+@router.delete("/{chat_id}/session")
+def delete_session(chat_id: str):
+    """Drop a chat's tutor session; the next turn starts a fresh one"""
+    return {"detail": "Session ended" if end_session(chat_id) else "No active session"}
+
 @router.post("/bulk")
 def save_all_chats(chats: List[Dict[str, Any]]):
     """Save all chat sessions (bulk operation for migration)"""
@@ -1,4 +1,4 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from typing import List, Optional
 from pydantic import BaseModel
 import json
@@ -6,6 +6,8 @@ import os
 import datetime
 import uuid
 from services.ai_service import generate_lesson_content
+from services.search_service import sync_source
+from services.enrollment_service import strip_progress, extract_progress, merge_courses, set_lesson_progress, buffer_lesson_progress, user_enrollments
 
 router = APIRouter(prefix="/course", tags=["courses"])
 
@@ -50,22 +52,28 @@ def load_courses():
     return []
 
 def save_courses(courses):
-    """Save courses to JSON file"""
+    """Save courses to JSON file (shared content only; progress lives in enrollments)"""
     os.makedirs(os.path.dirname(COURSES_FILE), exist_ok=True)
     with open(COURSES_FILE, 'w') as f:
         json.dump(courses, f, indent=2)
+    sync_source('courses', courses)
+
+class LessonProgressRequest(BaseModel):
+    user_id: str = "default_user"
+    progress: int
+    completed: Optional[bool] = None
 
 @router.get("/")
-async def get_all_courses():
+async def get_all_courses(user_id: str = Query("default_user", description="User whose progress is shown")):
     """Get all courses"""
     try:
-        courses = load_courses()
+        courses = merge_courses(load_courses(), user_id)
         return {"courses": courses}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to load courses: {str(e)}")
 
 @router.get("/{course_id}")
-async def get_course(course_id: str):
+async def get_course(course_id: str, user_id: str = Query("default_user", description="User whose progress is shown")):
     """Get a specific course by ID"""
     try:
         courses = load_courses()
@@ -74,7 +82,7 @@ async def get_course(course_id: str):
         if not course:
             raise HTTPException(status_code=404, detail="Course not found")
         
-        return course
+        return merge_courses([course], user_id)[0]
     except HTTPException:
         raise
     except Exception as e:
@@ -112,7 +120,7 @@ async def create_course(course: Course):
         
         # Convert to dict for storage
         course_dict = course.dict()
-        courses.append(course_dict)
+        courses.append(strip_progress(json.loads(json.dumps(course_dict))))
         save_courses(courses)
         
         return course_dict
@@ -120,8 +128,12 @@ async def create_course(course: Course):
         raise HTTPException(status_code=500, detail=f"Failed to create course: {str(e)}")
 
 @router.put("/{course_id}")
-async def update_course(course_id: str, course: Course):
-    """Update an existing course"""
+async def update_course(course_id: str, course: Course, user_id: str = Query("default_user", description="User whose progress is sent")):
+    """
+    Update an existing course.
+    Lesson progress in the body goes to the user's enrollment; the shared content is
+    only rewritten when something other than progress changed.
+    """
     try:
         courses = load_courses()
         course_index = next((i for i, c in enumerate(courses) if c.get("id") == course_id), None)
@@ -130,11 +142,31 @@ async def update_course(course_id: str, course: Course):
             raise HTTPException(status_code=404, detail="Course not found")
         
         course.id = course_id
-        course.updatedAt = str(datetime.datetime.now())
-        courses[course_index] = course.dict()
-        save_courses(courses)
+        course_dict = course.dict()
         
-        return course
+        # Only lessons whose state changed are written: completions right away,
+        # plain progress through the write-behind buffer
+        current = user_enrollments(user_id).get(course_id, {}).get("lessons", {})
+        immediate = {}
+        for lesson_id, update in extract_progress(course_dict).items():
+            state = current.get(lesson_id, {"progress": 0, "completed": False})
+            if update["completed"] != state["completed"] or (update["progress"] >= 100 and state["progress"] < 100):
+                immediate[lesson_id] = update
+            elif update["progress"] > state["progress"]:
+                buffer_lesson_progress(user_id, course_id, lesson_id, update["progress"])
+        if immediate:
+            set_lesson_progress(user_id, course_dict, immediate)
+        
+        content = strip_progress(json.loads(json.dumps(course_dict)))
+        stored = strip_progress(json.loads(json.dumps(courses[course_index])))
+        content.pop("updatedAt", None)
+        stored.pop("updatedAt", None)
+        if content != stored:
+            content["updatedAt"] = str(datetime.datetime.now())
+            courses[course_index] = content
+            save_courses(courses)
+        
+        return merge_courses([courses[course_index]], user_id)[0]
     except HTTPException:
         raise
     except Exception as e:
@@ -159,6 +191,21 @@ async def delete_course(course_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to delete course: {str(e)}")
 
+@router.put("/{course_id}/lessons/{lesson_id}/progress")
+async def update_lesson_progress(course_id: str, lesson_id: str, request: LessonProgressRequest):
+    """Update one user's progress on a lesson, awarding XP when it is completed"""
+    try:
+        from services.course_service import CourseService
+        
+        result = CourseService().update_lesson_progress(course_id, lesson_id, request.progress, request.completed, request.user_id)
+        if not result:
+            raise HTTPException(status_code=404, detail="Course or lesson not found")
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to update lesson progress: {str(e)}")
+
 # Request model for lesson generation
 class GenerateLessonRequest(BaseModel):
     lesson_title: str
@@ -187,7 +234,7 @@ async def generate_lesson(request: GenerateLessonRequest):
         raise HTTPException(status_code=500, detail=f"Failed to generate lesson: {str(e)}")
 
 @router.post("/{course_id}/lessons/{lesson_id}/generate-content")
-async def generate_lesson_content_for_course(course_id: str, lesson_id: str):
+async def generate_lesson_content_for_course(course_id: str, lesson_id: str, user_id: str = Query("default_user", description="User whose progress is shown")):
     """Generate content for a specific lesson in a course"""
     try:
         from services.course_service import CourseService
@@ -197,6 +244,7 @@ async def generate_lesson_content_for_course(course_id: str, lesson_id: str):
         
         if not updated_course:
             raise HTTPException(status_code=404, detail="Course or lesson not found")
+        updated_course = merge_courses([updated_course], user_id)[0]
         
         # Find the updated lesson
         lesson = next((l for l in updated_course.get("lessons", []) if l.get("id") == lesson_id), None)
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
-from typing import Any, Dict
+from typing import Any, Dict, Optional
 from services.flashcard_service import (
-    get_all_flashcards, add_flashcard, update_flashcard, delete_flashcard, mark_flashcard_learned
+    get_all_flashcards, get_flashcard, query_flashcards, add_flashcard, update_flashcard, delete_flashcard,
+    mark_flashcard_learned, DEFAULT_PAGE_SIZE
 )
+from services.review_service import get_due_flashcards, review_flashcard
+from services.flashcard_generation_service import generate_flashcards_from_course
 
 router = APIRouter(prefix="/flashcard")
 
@@ -18,15 +21,79 @@ class MarkLearnedRequest(BaseModel):
     user_id: str = "default_user"
     flashcard_id: int
 
+class ReviewRequest(BaseModel):
+    user_id: str = "default_user"
+    flashcard_id: int
+    quality: int  # 0 (forgot) to 5 (perfect recall)
+
+class GenerateFlashcardsRequest(BaseModel):
+    course_id: str
+    lesson_id: Optional[str] = None  # every lesson of the course when omitted
+    max_concurrency: int = 3
+
 @router.get("/")
-def get_flashcards():
-    return get_all_flashcards()
+def get_flashcards(
+    language: Optional[str] = Query(None, description="Filter by language"),
+    topic: Optional[str] = Query(None, description="Filter by topic"),
+    difficulty: Optional[str] = Query(None, description="Filter by difficulty"),
+    cursor: Optional[int] = Query(None, description="Return cards after this id"),
+    limit: Optional[int] = Query(None, ge=1, le=500, description="Page size")
+):
+    """
+    Get flashcards. Without parameters the whole deck is returned as a list;
+    with filters, a cursor or a limit a page is returned with the next cursor.
+    """
+    if language is None and topic is None and difficulty is None and cursor is None and limit is None:
+        return get_all_flashcards()
+    return query_flashcards(language, topic, difficulty, cursor, limit or DEFAULT_PAGE_SIZE)
+
+@router.get("/due")
+def get_due(
+    user_id: str = Query("default_user", description="User ID"),
+    limit: int = Query(20, ge=1, le=100, description="Maximum number of cards"),
+    include_new: bool = Query(True, description="Fill up with cards never reviewed")
+):
+    """Get the next cards to review, most overdue first."""
+    try:
+        return get_due_flashcards(user_id, limit, include_new)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get due flashcards: {str(e)}")
+
+@router.post("/review")
+def review(request: ReviewRequest):
+    """Grade a review and reschedule the card (SM-2)."""
+    try:
+        return review_flashcard(request.user_id, request.flashcard_id, request.quality)
+    except ValueError as e:
+        status_code = 404 if str(e) == 'Flashcard not found' else 400
+        raise HTTPException(status_code=status_code, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to review flashcard: {str(e)}")
+
+@router.post("/generate")
+def generate_flashcards(request: GenerateFlashcardsRequest):
+    """Extract flashcards from a lesson (or a whole course) with the AI model."""
+    try:
+        return generate_flashcards_from_course(request.course_id, request.lesson_id,
+                                               max(1, min(request.max_concurrency, 8)))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate flashcards: {str(e)}")
 
 @router.post("/")
 def create_flashcard(flashcard: FlashcardModel):
     return add_flashcard(flashcard.dict())
 
+@router.get("/{flashcard_id}")
+def get_flashcard_by_id(flashcard_id: int):
+    flashcard = get_flashcard(flashcard_id)
+    if flashcard is None:
+        raise HTTPException(status_code=404, detail="Flashcard not found")
+    return flashcard
+
 @router.put("/{flashcard_id}")
+@router.patch("/{flashcard_id}")
 def edit_flashcard(flashcard_id: int, flashcard: Dict[str, Any]):
     try:
         return update_flashcard(flashcard_id, flashcard)
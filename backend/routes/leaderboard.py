@@ -0,0 +1,54 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Dict, Any
+from services.leaderboard_service import get_top, get_rank, get_around, snapshot_leaderboard
+
+router = APIRouter(prefix="/leaderboard", tags=["leaderboard"])
+
+@router.get("/top")
+def get_top_users(
+    board: str = Query("total_xp", description="Board: 'total_xp', 'weekly_xp' or 'streak'"),
+    limit: int = Query(10, ge=1, le=100),
+    offset: int = Query(0, ge=0)
+) -> Dict[str, Any]:
+    """Get the top users on a leaderboard"""
+    try:
+        return get_top(board, limit, offset)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get leaderboard: {str(e)}")
+
+@router.get("/rank")
+def get_user_rank(
+    user_id: str = Query("default_user", description="User ID"),
+    board: str = Query("total_xp", description="Board: 'total_xp', 'weekly_xp' or 'streak'")
+) -> Dict[str, Any]:
+    """Get a user's rank on a leaderboard"""
+    try:
+        return get_rank(user_id, board)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get rank: {str(e)}")
+
+@router.get("/around")
+def get_users_around(
+    user_id: str = Query("default_user", description="User ID"),
+    board: str = Query("total_xp", description="Board: 'total_xp', 'weekly_xp' or 'streak'"),
+    radius: int = Query(5, ge=0, le=50, description="Users shown above and below")
+) -> Dict[str, Any]:
+    """Get the users ranked around a user"""
+    try:
+        return get_around(user_id, board, radius)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get leaderboard: {str(e)}")
+
+@router.post("/snapshot")
+def create_snapshot() -> Dict[str, Any]:
+    """Write a leaderboard snapshot now"""
+    try:
+        return snapshot_leaderboard()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to snapshot leaderboard: {str(e)}")
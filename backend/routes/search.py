@@ -0,0 +1,27 @@
+from fastapi import APIRouter, HTTPException, Query
+from typing import Dict, Any
+from services.search_service import search, rebuild_index
+
+router = APIRouter(prefix="/search", tags=["search"])
+
+@router.get("")
+def search_content(
+    q: str = Query(..., min_length=1, description="Search text; words also match as prefixes"),
+    types: str = Query("", description="Comma-separated types: course, lesson, challenge, flashcard, chat"),
+    limit: int = Query(20, ge=1, le=100)
+) -> Dict[str, Any]:
+    """Search courses, lessons, challenges, flashcards and chats, best matches first"""
+    try:
+        return search(q, [t.strip().lower() for t in types.split(',')], limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Search failed: {str(e)}")
+
+@router.post("/rebuild")
+def rebuild_search_index() -> Dict[str, Any]:
+    """Rebuild the search index from the data files"""
+    try:
+        return rebuild_index()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to rebuild search index: {str(e)}")
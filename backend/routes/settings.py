@@ -2,7 +2,9 @@ from fastapi import APIRouter, HTTPException, Query
 from pydantic import BaseModel
 from typing import Dict, Any, Optional
 from services.export_service import export_all_data, export_user_progress_only, import_data_from_export
-from services.reset_service import reset_user_progress, reset_all_users_progress
+from services.reset_service import reset_user_progress, reset_all_users_progress, undo_reset
+from services.epoch_service import compact_progress
+from services.repair_service import repair_progress
 
 router = APIRouter(prefix="/settings", tags=["settings"])
 
@@ -58,6 +60,38 @@ def reset_progress(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/undo-reset")
+def undo_reset_endpoint(
+    user_id: str = Query("default_user", description="User ID"),
+    reset_all: bool = Query(False, description="Undo the last reset of all users")
+):
+    """Undo the last progress reset while it is inside the undo window."""
+    try:
+        return undo_reset(None if reset_all else user_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/compact-progress")
+def compact_progress_endpoint():
+    """Drop progress records from reset epochs that can no longer be undone."""
+    try:
+        return compact_progress()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/repair-progress")
+def repair_progress_endpoint(
+    user_id: Optional[str] = Query(None, description="User ID (all users if omitted)"),
+    dry_run: bool = Query(False, description="Report changes without saving")
+):
+    """Recompute achievement progress and stats from raw progress data."""
+    try:
+        return repair_progress(user_id, dry_run)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @router.get("/user-progress")
 def get_user_progress(
     user_id: str = Query("default_user", description="User ID")
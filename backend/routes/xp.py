@@ -1,13 +1,16 @@
-from fastapi import APIRouter, HTTPException
-from typing import Dict, Any
+from fastapi import APIRouter, HTTPException, Query
+from typing import Dict, List, Any, Optional
 from pydantic import BaseModel
 from services.xp_service import (
     award_xp_for_flashcard,
     deduct_xp_for_flashcard,
     award_xp_for_lesson_completion,
     award_xp_for_course_completion,
+    apply_activity_batch,
     get_user_progress
 )
+from services.ledger_service import query_ledger, audit_ledger
+from services.activity_service import get_activity, set_timezone
 
 router = APIRouter(prefix="/xp", tags=["xp"])
 
@@ -36,6 +39,25 @@ class CourseXPRequest(BaseModel):
 class ProgressRequest(BaseModel):
     user_id: str = "default_user"
 
+class ActivityEvent(BaseModel):
+    type: str  # flashcard_learned, flashcard_forgotten, lesson_completed, course_completed, perfect_solution
+    flashcard_id: Optional[int] = None
+    course_id: Optional[str] = None
+    lesson_id: Optional[str] = None
+    challenge_id: Optional[int] = None
+    xp_amount: Optional[int] = None
+
+class TimezoneRequest(BaseModel):
+    user_id: str = "default_user"
+    timezone: str
+
+class BatchActivityRequest(BaseModel):
+    user_id: str = "default_user"
+    events: List[ActivityEvent]
+
+# Upper bound on events in one /xp/batch request
+MAX_BATCH_EVENTS = 500
+
 @router.post("/flashcard")
 def award_flashcard_xp(request: FlashcardXPRequest) -> Dict[str, Any]:
     """Award XP for learning a flashcard"""
@@ -46,6 +68,7 @@ def award_flashcard_xp(request: FlashcardXPRequest) -> Dict[str, Any]:
             "xp_earned": result['total_xp_earned'],
             "new_achievements": result['new_achievements'],
             "achievement_xp_earned": result['achievement_xp_earned'],
+            "duplicate": result['duplicate'],
             "user_progress": result['progress']
         }
     except Exception as e:
@@ -61,6 +84,7 @@ def deduct_flashcard_xp(request: FlashcardDeductRequest) -> Dict[str, Any]:
             "xp_earned": result['total_xp_earned'],
             "new_achievements": result['new_achievements'],
             "achievement_xp_earned": result['achievement_xp_earned'],
+            "duplicate": result['duplicate'],
             "user_progress": result['progress']
         }
     except Exception as e:
@@ -76,6 +100,7 @@ def award_lesson_xp(request: LessonXPRequest) -> Dict[str, Any]:
             "xp_earned": result['total_xp_earned'],
             "new_achievements": result['new_achievements'],
             "achievement_xp_earned": result['achievement_xp_earned'],
+            "duplicate": result['duplicate'],
             "user_progress": result['progress']
         }
     except Exception as e:
@@ -91,11 +116,34 @@ def award_course_xp(request: CourseXPRequest) -> Dict[str, Any]:
             "xp_earned": result['total_xp_earned'],
             "new_achievements": result['new_achievements'],
             "achievement_xp_earned": result['achievement_xp_earned'],
+            "duplicate": result['duplicate'],
             "user_progress": result['progress']
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to award course XP: {str(e)}")
 
+@router.post("/batch")
+def award_batch_xp(request: BatchActivityRequest) -> Dict[str, Any]:
+    """Apply a batch of activity events (e.g. a flashcard review session) in one transaction"""
+    if len(request.events) > MAX_BATCH_EVENTS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_EVENTS} events per batch")
+    try:
+        result = apply_activity_batch(request.user_id, [event.dict() for event in request.events])
+        return {
+            "success": True,
+            "xp_earned": result['total_xp_earned'],
+            "applied": result['applied'],
+            "duplicates": result['duplicates'],
+            "results": result['results'],
+            "new_achievements": result['new_achievements'],
+            "achievement_xp_earned": result['achievement_xp_earned'],
+            "user_progress": result['progress']
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to apply activity batch: {str(e)}")
+
 @router.post("/progress")
 def get_user_progress_endpoint(request: ProgressRequest) -> Dict[str, Any]:
     """Get user progress with updated streak"""
@@ -106,4 +154,48 @@ def get_user_progress_endpoint(request: ProgressRequest) -> Dict[str, Any]:
             "progress": progress
         }
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to get user progress: {str(e)}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Failed to get user progress: {str(e)}") 
+
+@router.get("/ledger")
+def get_xp_ledger(
+    user_id: str = Query("default_user", description="User ID"),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500)
+) -> Dict[str, Any]:
+    """Get a page of a user's XP ledger entries, newest first"""
+    try:
+        return query_ledger(user_id, offset, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get XP ledger: {str(e)}")
+
+@router.post("/ledger/audit")
+def audit_xp_ledger(fix: bool = Query(False, description="Rewrite balances and total XP from the ledger")) -> Dict[str, Any]:
+    """Replay the XP ledger and report (or fix) balances that disagree with it"""
+    try:
+        return audit_ledger(fix)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to audit XP ledger: {str(e)}")
+
+@router.get("/activity")
+def get_activity_calendar(
+    user_id: str = Query("default_user", description="User ID"),
+    start: Optional[str] = Query(None, alias="from", description="First day (YYYY-MM-DD), default one year ago"),
+    end: Optional[str] = Query(None, alias="to", description="Last day (YYYY-MM-DD), default today")
+) -> Dict[str, Any]:
+    """Get a user's active days and daily XP for an activity heatmap"""
+    try:
+        return get_activity(user_id, start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to get activity: {str(e)}")
+
+@router.post("/timezone")
+def set_user_timezone(request: TimezoneRequest) -> Dict[str, Any]:
+    """Set the timezone used to decide which day an activity falls on"""
+    try:
+        return {"success": True, **set_timezone(request.user_id, request.timezone)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to set timezone: {str(e)}")
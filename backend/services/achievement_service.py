@@ -1,7 +1,9 @@
 import json
+from bisect import bisect_right
 from typing import Dict, List, Any, Optional
 from datetime import datetime, date, timedelta
-import os
+from .activity_service import mark_active, current_streak, user_now
+from .epoch_service import resolve_progress, write_progress
 
 # Achievement definitions
 ACHIEVEMENTS = {
@@ -249,19 +251,76 @@ ACHIEVEMENTS = {
     }
 }
 
+def _compile_achievement_index(achievements: Dict[str, Any]) -> Dict[str, Dict[str, List[Any]]]:
+    """
+    Group achievements by the metrics they depend on, sorted by required value,
+    so a metric change only has to look at the thresholds it crossed.
+    """
+    index = {}
+    for achievement in achievements.values():
+        for metric, required_value in achievement['requirement'].items():
+            index.setdefault(metric, []).append((required_value, achievement['id']))
+    
+    return {
+        metric: {
+            'thresholds': [required for required, _ in sorted(entries)],
+            'achievement_ids': [achievement_id for _, achievement_id in sorted(entries)]
+        }
+        for metric, entries in index.items()
+    }
+
+# Per-metric threshold arrays, built once at import
+ACHIEVEMENT_INDEX = _compile_achievement_index(ACHIEVEMENTS)
+
 def load_progress() -> Dict[str, Any]:
     """Load user progress from JSON file."""
     try:
         with open('data/progress.json', 'r') as f:
-            return json.load(f)
+            return resolve_progress(json.load(f))
     except FileNotFoundError:
         return {}
 
 def save_progress(progress: Dict[str, Any]):
     """Save user progress to JSON file."""
-    os.makedirs('data', exist_ok=True)
-    with open('data/progress.json', 'w') as f:
-        json.dump(progress, f, indent=2)
+    write_progress(progress)
+
+def new_user_progress() -> Dict[str, Any]:
+    """Default progress record for a user with no activity yet."""
+    return {
+        'total_xp': 0,
+        'completed_challenges': [],
+        'completed_courses': [],
+        'completed_lessons': [],
+        'level': 1,
+        'streak': 0,
+        'longest_streak': 0,
+        'last_active_date': '',
+        'achievements': [],
+        'achievement_progress': {
+            'challenges_completed': 0,
+            'flashcards_learned': 0,
+            'courses_completed': 0,
+            'lessons_completed': 0,
+            'streak_days': 0,
+            'perfect_solutions': 0,
+            'different_topics': 0,
+            'different_difficulties': 0
+        },
+        'stats': {
+            'total_challenges_completed': 0,
+            'total_flashcards_learned': 0,
+            'total_courses_completed': 0,
+            'total_lessons_completed': 0,
+            'total_perfect_solutions': 0,
+            'total_topics_covered': 0,
+            'total_difficulties_tried': 0,
+            'average_challenge_time': 0,
+            'favorite_topic': '',
+            'favorite_difficulty': '',
+            'topics_covered': [],
+            'difficulties_tried': []
+        }
+    }
 
 def calculate_level(total_xp: int) -> int:
     """Calculate level based on total XP using a progressive formula."""
@@ -331,41 +390,22 @@ def update_streak(user_id: str) -> Dict[str, Any]:
         }
     
     user_progress = progress[user_id]
-    now = datetime.now()
-    today = now.date()
-    last_active_str = user_progress.get('last_active_date', '')
-    
-    # Check if user was already active today
-    if last_active_str:
-        try:
-            last_active_date = datetime.fromisoformat(last_active_str).date()
-            if last_active_date == today:
-                # Already updated today, just return current progress
-                return user_progress
-        except (ValueError, TypeError):
-            pass
-    
-    # Calculate streak
-    if last_active_str:
-        try:
-            last_active_date = datetime.fromisoformat(last_active_str).date()
-            yesterday = today - timedelta(days=1)
-            
-            if last_active_date == yesterday:
-                # Consecutive day - increment streak
-                user_progress['streak'] += 1
-            elif last_active_date < yesterday:
-                # Streak broken - reset to 1
-                user_progress['streak'] = 1
-            else:
-                # Same day (shouldn't happen due to check above) or future date
-                pass
-        except (ValueError, TypeError):
-            # First time or invalid date - start streak
-            user_progress['streak'] = 1
-    else:
-        # First time user - start streak
-        user_progress['streak'] = 1
+    if apply_streak(user_progress, user_id=user_id):
+        save_progress(progress)
+    return user_progress
+
+def apply_streak(user_progress: Dict[str, Any], now: Optional[datetime] = None, user_id: Optional[str] = None,
+                 xp: int = 0) -> bool:
+    """
+    Record activity at 'now' (and the XP earned) in the user's activity calendar and
+    derive the streak from it. Returns False if the user was already active today.
+    Pass user_id to keep the streak leaderboard in step.
+    """
+    now = now or user_now(user_progress)
+    if not mark_active(user_progress, now.date(), xp):
+        return False
+    
+    user_progress['streak'] = current_streak(user_progress, now.date())
     
     # Update longest streak
     if user_progress['streak'] > user_progress.get('longest_streak', 0):
@@ -375,11 +415,13 @@ def update_streak(user_id: str) -> Dict[str, Any]:
     user_progress['last_active_date'] = now.isoformat()
     user_progress['achievement_progress']['streak_days'] = user_progress['streak']
     
-    save_progress(progress)
-    return user_progress
+    if user_id is not None:
+        from .leaderboard_service import record_streak
+        record_streak(user_id, user_progress)
+    return True
 
 def check_achievements(user_id: str, progress_data: Dict[str, Any]) -> List[Dict[str, Any]]:
-    """Check for newly unlocked achievements."""
+    """Check every achievement for new unlocks (full scan; updates use check_changed_achievements)."""
     user_progress = progress_data.get(user_id, {})
     current_achievements = set(user_progress.get('achievements', []))
     achievement_progress = user_progress.get('achievement_progress', {})
@@ -404,6 +446,76 @@ def check_achievements(user_id: str, progress_data: Dict[str, Any]) -> List[Dict
     
     return newly_unlocked
 
+def _requirements_met(achievement: Dict[str, Any], achievement_progress: Dict[str, Any]) -> bool:
+    return all(achievement_progress.get(key, 0) >= required for key, required in achievement['requirement'].items())
+
+def achievements_crossed(metric: str, old_value: int, new_value: int) -> List[Dict[str, Any]]:
+    """Achievements whose threshold for 'metric' lies in (old_value, new_value], found by bisection."""
+    entry = ACHIEVEMENT_INDEX.get(metric)
+    if not entry or new_value <= old_value:
+        return []
+    start = bisect_right(entry['thresholds'], old_value)
+    end = bisect_right(entry['thresholds'], new_value)
+    return [ACHIEVEMENTS[achievement_id] for achievement_id in entry['achievement_ids'][start:end]]
+
+def check_changed_achievements(user_progress: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Check only the metrics that changed since the last check.
+    The values seen at the last check are kept in 'achievement_checked', so changes made
+    elsewhere (e.g. streak updates) are picked up on the next check too.
+    """
+    achievement_progress = user_progress.get('achievement_progress', {})
+    checked = user_progress.setdefault('achievement_checked', {})
+    current_achievements = set(user_progress.get('achievements', []))
+    
+    newly_unlocked = []
+    for metric in ACHIEVEMENT_INDEX:
+        new_value = achievement_progress.get(metric, 0)
+        old_value = checked.get(metric, 0)
+        if new_value == old_value:
+            continue
+        checked[metric] = new_value
+        for achievement in achievements_crossed(metric, old_value, new_value):
+            if achievement['id'] not in current_achievements and _requirements_met(achievement, achievement_progress):
+                current_achievements.add(achievement['id'])
+                newly_unlocked.append(achievement)
+    
+    return newly_unlocked
+
+def get_next_achievements(user_id: str) -> Dict[str, Any]:
+    """
+    Get the next locked achievement for each metric and how close the user is to it.
+    'closest' is the one with the highest completion percentage.
+    """
+    progress = load_progress()
+    user_progress = progress.get(user_id, {})
+    achievement_progress = user_progress.get('achievement_progress', {})
+    unlocked = set(user_progress.get('achievements', []))
+    
+    next_achievements = []
+    for metric, entry in ACHIEVEMENT_INDEX.items():
+        value = achievement_progress.get(metric, 0)
+        position = bisect_right(entry['thresholds'], value)
+        # Skip thresholds already unlocked by other means (e.g. multi-metric requirements)
+        while position < len(entry['thresholds']) and entry['achievement_ids'][position] in unlocked:
+            position += 1
+        if position == len(entry['thresholds']):
+            continue
+        
+        achievement = ACHIEVEMENTS[entry['achievement_ids'][position]].copy()
+        required = entry['thresholds'][position]
+        achievement['metric'] = metric
+        achievement['current_value'] = value
+        achievement['required_value'] = required
+        achievement['progress_percentage'] = min(100.0, round(value / required * 100, 1)) if required else 100.0
+        next_achievements.append(achievement)
+    
+    closest = max(next_achievements, key=lambda a: a['progress_percentage'], default=None)
+    return {
+        'next_achievements': next_achievements,
+        'closest': closest
+    }
+
 def unlock_achievements(user_id: str, achievements: List[Dict[str, Any]]) -> int:
     """Unlock achievements and return total XP earned."""
     if not achievements:
@@ -472,6 +584,28 @@ def update_achievement_progress(user_id: str, progress_type: str, value: int = 1
         }
     
     user_progress = progress[user_id]
+    new_achievements = apply_achievement_progress(user_id, user_progress, progress_type, value, additional_data)
+    
+    save_progress(progress)
+    
+    return {
+        'new_achievements': new_achievements,
+        'xp_earned': 0,  # No XP from achievements
+        'updated_progress': user_progress
+    }
+
+def apply_achievement_progress(user_id: str, user_progress: Dict[str, Any], progress_type: str, value: int = 1,
+                               additional_data: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Update a user's achievement progress in memory and return newly unlocked achievements."""
+    apply_progress_counters(user_progress, progress_type, value, additional_data)
+    return unlock_changed_achievements(user_progress)
+
+def apply_progress_counters(user_progress: Dict[str, Any], progress_type: str, value: int = 1,
+                            additional_data: Optional[Dict[str, Any]] = None):
+    """
+    Update achievement counters and stats for one activity without checking for unlocks.
+    Batches call this per activity and unlock_changed_achievements once at the end.
+    """
     achievement_progress = user_progress['achievement_progress']
     stats = user_progress['stats']
     
@@ -504,6 +638,16 @@ def update_achievement_progress(user_id: str, progress_type: str, value: int = 1
                 stats['difficulties_tried'] = list(current_difficulties)
                 stats['total_difficulties_tried'] = len(current_difficulties)
                 achievement_progress['different_difficulties'] = len(current_difficulties)
+            
+            # Count completions per topic and difficulty to keep the favorites current
+            if topic:
+                topic_counts = stats.setdefault('topic_counts', {})
+                topic_counts[topic] = topic_counts.get(topic, 0) + value
+                stats['favorite_topic'] = max(topic_counts, key=topic_counts.get)
+            if difficulty:
+                difficulty_counts = stats.setdefault('difficulty_counts', {})
+                difficulty_counts[difficulty] = difficulty_counts.get(difficulty, 0) + value
+                stats['favorite_difficulty'] = max(difficulty_counts, key=difficulty_counts.get)
     
     elif progress_type == 'flashcard_learned':
         achievement_progress['flashcards_learned'] += value
@@ -531,97 +675,34 @@ def update_achievement_progress(user_id: str, progress_type: str, value: int = 1
     elif progress_type == 'perfect_solution':
         achievement_progress['perfect_solutions'] += value
         stats['total_perfect_solutions'] += value
-    
+
+def unlock_changed_achievements(user_progress: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Unlock achievements reached since the last check and return them."""
     # Check for new achievements (but don't award XP - achievements are cosmetic)
-    new_achievements = check_achievements(user_id, progress)
+    new_achievements = check_changed_achievements(user_progress)
     # Don't call unlock_achievements to avoid adding XP
     # Just add achievements to the list without XP
     for achievement in new_achievements:
         if achievement['id'] not in user_progress.get('achievements', []):
             user_progress.setdefault('achievements', []).append(achievement['id'])
     
-    save_progress(progress)
-    
-    return {
-        'new_achievements': new_achievements,
-        'xp_earned': 0,  # No XP from achievements
-        'updated_progress': user_progress
-    }
-
-def fix_achievement_progress(user_id: str):
-    """Fix achievement progress by recalculating based on actual data."""
-    progress = load_progress()
-    
-    if user_id not in progress:
-        return
-    
-    user_progress = progress[user_id]
-    achievement_progress = user_progress['achievement_progress']
-    stats = user_progress['stats']
-    
-    # Recalculate challenges completed based on actual completed_challenges array
-    actual_challenges_completed = len(user_progress.get('completed_challenges', []))
-    achievement_progress['challenges_completed'] = actual_challenges_completed
-    stats['total_challenges_completed'] = actual_challenges_completed
-    
-    # Recalculate flashcards learned
-    flashcards_learned = user_progress.get('achievement_progress', {}).get('flashcards_learned', 0)
-    stats['total_flashcards_learned'] = flashcards_learned
-    
-    # Recalculate perfect solutions
-    perfect_solutions = user_progress.get('achievement_progress', {}).get('perfect_solutions', 0)
-    stats['total_perfect_solutions'] = perfect_solutions
-    
-    # Recalculate topics and difficulties
-    topics_covered = set()
-    difficulties_tried = set()
-    
-    # Get all challenges to check topics and difficulties
-    from .challenge_service import load_challenges
-    challenges = load_challenges()
-    
-    for challenge_id in user_progress.get('completed_challenges', []):
-        challenge = next((c for c in challenges if c.get('id') == challenge_id), None)
-        if challenge:
-            topic = challenge.get('topic', '')
-            difficulty = challenge.get('difficulty', '')
-            if topic:
-                topics_covered.add(topic)
-            if difficulty:
-                difficulties_tried.add(difficulty)
-    
-    stats['topics_covered'] = list(topics_covered)
-    stats['total_topics_covered'] = len(topics_covered)
-    achievement_progress['different_topics'] = len(topics_covered)
-    
-    stats['difficulties_tried'] = list(difficulties_tried)
-    stats['total_difficulties_tried'] = len(difficulties_tried)
-    achievement_progress['different_difficulties'] = len(difficulties_tried)
-    
-    # Save the fixed progress
-    save_progress(progress)
+    return new_achievements
 
 def get_user_achievements(user_id: str) -> Dict[str, Any]:
-    """Get user's achievements and progress."""
-    progress = load_progress()
-    user_progress = progress.get(user_id, {})
-    
-    # Update streak first
-    user_progress = update_streak(user_id)
-    
-    # Fix achievement progress by recalculating based on actual data
-    fix_achievement_progress(user_id)
-    
-    # Reload progress after fixing
+    """
+    Get user's achievements and progress.
+    Achievement progress is kept up to date as activities happen, so this only reads.
+    """
     progress = load_progress()
     user_progress = progress.get(user_id, {})
+    unlocked_ids = set(user_progress.get('achievements', []))
     
     unlocked_achievements = []
     locked_achievements = []
     
     for achievement_id, achievement in ACHIEVEMENTS.items():
         achievement_copy = achievement.copy()
-        achievement_copy['unlocked'] = achievement_id in user_progress.get('achievements', [])
+        achievement_copy['unlocked'] = achievement_id in unlocked_ids
         
         if achievement_copy['unlocked']:
             unlocked_achievements.append(achievement_copy)
@@ -0,0 +1,182 @@
+from bisect import bisect_right
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Any, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Heatmap range served when the caller gives none
+DEFAULT_ACTIVITY_DAYS = 365
+
+# A user's active days are stored in their progress record as
+#   'activity': {'origin': 'YYYY-MM-DD', 'runs': [[start, length], ...], 'xp': [int, ...]}
+# 'runs' are consecutive active days as offsets from 'origin', in order; 'xp' holds the
+# XP earned on each active day, in the same order as the days in 'runs'.
+
+def get_timezone(user_progress: Dict[str, Any]) -> Optional[ZoneInfo]:
+    """The user's timezone, or None for server local time"""
+    name = user_progress.get('timezone')
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+def user_now(user_progress: Dict[str, Any]) -> datetime:
+    """Current time in the user's timezone"""
+    tz = get_timezone(user_progress)
+    return datetime.now(tz) if tz else datetime.now()
+
+def _calendar(user_progress: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Get the user's activity calendar, creating it if needed.
+    Users from before the calendar existed get their current streak as one run
+    ending on their last active day, so the streak carries over.
+    """
+    calendar = user_progress.get('activity')
+    if calendar is not None:
+        return calendar
+
+    calendar = {'origin': '', 'runs': [], 'xp': []}
+    streak = user_progress.get('streak', 0)
+    last_active = user_progress.get('last_active_date', '')
+    if streak and last_active:
+        try:
+            last_day = datetime.fromisoformat(last_active).date()
+            first_day = last_day - timedelta(days=streak - 1)
+            calendar = {'origin': first_day.isoformat(), 'runs': [[0, streak]], 'xp': [0] * streak}
+        except (ValueError, TypeError):
+            pass
+    user_progress['activity'] = calendar
+    return calendar
+
+def _offset(calendar: Dict[str, Any], day: date) -> int:
+    return (day - date.fromisoformat(calendar['origin'])).days
+
+def mark_active(user_progress: Dict[str, Any], day: date, xp: int = 0) -> bool:
+    """
+    Record activity (and XP) on a day. Returns True if the day was not active before.
+    Days are normally appended at the end, which is O(1); days before the last run are ignored.
+    """
+    calendar = _calendar(user_progress)
+    if not calendar['runs']:
+        calendar['origin'] = day.isoformat()
+        calendar['runs'].append([0, 1])
+        calendar['xp'].append(max(0, xp))
+        return True
+
+    offset = _offset(calendar, day)
+    start, length = calendar['runs'][-1]
+    last = start + length - 1
+    if offset == last:
+        calendar['xp'][-1] = max(0, calendar['xp'][-1] + xp)
+        return False
+    if offset < last:
+        # Clock went backwards (e.g. timezone change); count it on the latest day
+        calendar['xp'][-1] = max(0, calendar['xp'][-1] + xp)
+        return False
+
+    if offset == last + 1:
+        calendar['runs'][-1][1] += 1
+    else:
+        calendar['runs'].append([offset, 1])
+    calendar['xp'].append(max(0, xp))
+    return True
+
+def add_day_xp(user_progress: Dict[str, Any], xp: int):
+    """Add XP to the most recent active day"""
+    calendar = _calendar(user_progress)
+    if calendar['xp']:
+        calendar['xp'][-1] = max(0, calendar['xp'][-1] + xp)
+
+def current_streak(user_progress: Dict[str, Any], today: Optional[date] = None) -> int:
+    """Consecutive active days ending today or yesterday (a streak lasts until a full day is missed)"""
+    calendar = _calendar(user_progress)
+    if not calendar['runs']:
+        return 0
+    today = today or user_now(user_progress).date()
+    start, length = calendar['runs'][-1]
+    last_day = date.fromisoformat(calendar['origin']) + timedelta(days=start + length - 1)
+    return length if (today - last_day).days <= 1 else 0
+
+def streak_lapses_at(user_progress: Dict[str, Any]) -> Optional[float]:
+    """Timestamp at which the current streak drops to 0: the start of the second day after the last active day"""
+    calendar = _calendar(user_progress)
+    if not calendar['runs']:
+        return None
+    start, length = calendar['runs'][-1]
+    lapse_day = date.fromisoformat(calendar['origin']) + timedelta(days=start + length + 1)
+    return datetime.combine(lapse_day, time.min, tzinfo=get_timezone(user_progress)).timestamp()
+
+def longest_run(user_progress: Dict[str, Any]) -> int:
+    calendar = _calendar(user_progress)
+    return max((length for _, length in calendar['runs']), default=0)
+
+def get_activity_days(user_progress: Dict[str, Any], start_day: date, end_day: date) -> List[Dict[str, Any]]:
+    """Active days between start_day and end_day (inclusive) with the XP earned on each"""
+    calendar = _calendar(user_progress)
+    if not calendar['runs'] or end_day < start_day:
+        return []
+
+    origin = date.fromisoformat(calendar['origin'])
+    first = (start_day - origin).days
+    last = (end_day - origin).days
+
+    # Index of the first active day of each run, to find positions in 'xp'
+    starts = [run[0] for run in calendar['runs']]
+    run_index = max(0, bisect_right(starts, first) - 1)
+    xp_index = sum(length for _, length in calendar['runs'][:run_index])
+
+    days = []
+    for start, length in calendar['runs'][run_index:]:
+        if start > last:
+            break
+        for offset in range(max(start, first), min(start + length - 1, last) + 1):
+            days.append({
+                'date': (origin + timedelta(days=offset)).isoformat(),
+                'xp': calendar['xp'][xp_index + offset - start]
+            })
+        xp_index += length
+    return days
+
+def get_activity(user_id: str, start: Optional[str] = None, end: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Heatmap data for a user between two ISO dates (inclusive); defaults to the last year.
+    Raises ValueError for malformed dates.
+    """
+    from .achievement_service import load_progress
+
+    user_progress = load_progress().get(user_id, {})
+    today = user_now(user_progress).date()
+    end_day = date.fromisoformat(end) if end else today
+    start_day = date.fromisoformat(start) if start else end_day - timedelta(days=DEFAULT_ACTIVITY_DAYS - 1)
+
+    days = get_activity_days(user_progress, start_day, end_day) if user_progress else []
+    return {
+        'user_id': user_id,
+        'from': start_day.isoformat(),
+        'to': end_day.isoformat(),
+        'timezone': user_progress.get('timezone') or 'local',
+        'days': days,
+        'active_days': len(days),
+        'xp_earned': sum(day['xp'] for day in days),
+        'streak': current_streak(user_progress, today) if user_progress else 0,
+        'longest_streak': user_progress.get('longest_streak', 0)
+    }
+
+def set_timezone(user_id: str, timezone: str) -> Dict[str, Any]:
+    """
+    Set the IANA timezone (e.g. 'Europe/Paris') used for a user's day boundaries.
+    Raises ValueError for an unknown timezone.
+    """
+    from .achievement_service import load_progress, save_progress, new_user_progress
+
+    try:
+        ZoneInfo(timezone)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone '{timezone}'")
+
+    progress = load_progress()
+    user_progress = progress.setdefault(user_id, new_user_progress())
+    user_progress['timezone'] = timezone
+    save_progress(progress)
+    return {'user_id': user_id, 'timezone': timezone}
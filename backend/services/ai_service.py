@@ -1,11 +1,23 @@
 import time
-from ollama import chat
+from typing import Any, Dict, List, Optional
+from ollama import chat, embeddings, generate
 
 MODEL = "gemma3n"
+EMBEDDING_MODEL = "nomic-embed-text"
+
+# How long Ollama keeps the tutor model (and its cached prompt state) loaded between requests
+KEEP_ALIVE = "30m"
+
+# Context window for every call to MODEL. Ollama reloads the model when num_ctx changes,
+# which would drop the cached state tutor sessions reuse, so all calls use the same one
+# (sized for sessions, whose state grows with every turn).
+NUM_CTX = 8192
+MODEL_OPTIONS = {"num_ctx": NUM_CTX}
 
 def ask_gemma(prompt: str):
     response = chat(
         model=MODEL,
+        options=MODEL_OPTIONS,
         messages=[
             {"role": "system", "content": (
                 "You are a highly skilled and friendly tutor who provides clear, well-formatted responses. "
@@ -42,37 +54,56 @@ def ask_gemma(prompt: str):
             if content:
                 yield content
 
-def ask_gemma_tutor(prompt: str):
-    """Specialized function for AI tutor with explicit non-course formatting"""
+def tutor_user_message(prompt: str, context: Optional[str] = None) -> str:
+    """The tutor's user turn: the question, preceded by retrieved course material if any"""
+    if not context:
+        return prompt
+    return (
+        "Excerpts from the student's own lessons and challenges (use them when relevant, "
+        "and prefer their terminology and examples; ignore them if they do not help):\n\n"
+        f"{context}\n\n"
+        f"Question: {prompt}"
+    )
+
+TUTOR_SYSTEM_PROMPT = (
+    "You are a helpful, concise tutor who provides clear, well-formatted responses. "
+    "You provide direct answers without course-style formatting. "
+    "\n\n"
+    "**FORMATTING RULES:**\n"
+    "1. Use proper markdown formatting for better readability\n"
+    "2. Use **bold** for emphasis and important points\n"
+    "3. Use `code` for code snippets, variables, and technical terms\n"
+    "4. Use ```code blocks``` for multi-line code examples\n"
+    "5. Use bullet points (• or -) for lists\n"
+    "6. Use numbered lists for step-by-step instructions\n"
+    "7. Add proper spacing between sections\n"
+    "8. Use headers (##) to organize content when appropriate\n"
+    "\n\n"
+    "**RESPONSE RULES:**\n"
+    "1. NEVER use progress checkpoints, part divisions, or completion percentages\n"
+    "2. Keep responses short and conversational\n"
+    "3. ALWAYS end with a **TLDR** section in bold\n"
+    "4. Be direct and helpful\n"
+    "5. Ensure proper spacing and newlines for clean formatting\n"
+    "6. Make code examples clear and well-commented\n"
+    "7. Use proper markdown syntax throughout"
+)
+
+def ask_gemma_tutor(prompt: str, context: Optional[str] = None, history: Optional[List[Dict[str, str]]] = None):
+    """
+    Specialized function for AI tutor with explicit non-course formatting.
+    history holds earlier turns as chat messages ({'role', 'content'}), oldest first.
+    """
     response = chat(
         model=MODEL,
+        options=MODEL_OPTIONS,
         messages=[
-            {"role": "system", "content": (
-                "You are a helpful, concise tutor who provides clear, well-formatted responses. "
-                "You provide direct answers without course-style formatting. "
-                "\n\n"
-                "**FORMATTING RULES:**\n"
-                "1. Use proper markdown formatting for better readability\n"
-                "2. Use **bold** for emphasis and important points\n"
-                "3. Use `code` for code snippets, variables, and technical terms\n"
-                "4. Use ```code blocks``` for multi-line code examples\n"
-                "5. Use bullet points (• or -) for lists\n"
-                "6. Use numbered lists for step-by-step instructions\n"
-                "7. Add proper spacing between sections\n"
-                "8. Use headers (##) to organize content when appropriate\n"
-                "\n\n"
-                "**RESPONSE RULES:**\n"
-                "1. NEVER use progress checkpoints, part divisions, or completion percentages\n"
-                "2. Keep responses short and conversational\n"
-                "3. ALWAYS end with a **TLDR** section in bold\n"
-                "4. Be direct and helpful\n"
-                "5. Ensure proper spacing and newlines for clean formatting\n"
-                "6. Make code examples clear and well-commented\n"
-                "7. Use proper markdown syntax throughout"
-            )},
-            {"role": "user", "content": prompt}
+            {"role": "system", "content": TUTOR_SYSTEM_PROMPT},
+            *(history or []),
+            {"role": "user", "content": tutor_user_message(prompt, context)}
         ],
-        stream=True
+        stream=True,
+        keep_alive=KEEP_ALIVE
     )
     for chunk in response:
         if chunk and isinstance(chunk, dict):
@@ -80,6 +111,35 @@ def ask_gemma_tutor(prompt: str):
             if content:
                 yield content
 
+def ask_gemma_tutor_session(prompt: str, state: Dict[str, Any], context_tokens: Optional[List[int]] = None):
+    """
+    Tutor turn through Ollama's generate endpoint, continuing from context_tokens (the
+    'context' returned by the previous turn) so earlier turns are not processed again.
+    When the stream ends, state receives the new 'context' and Ollama's prompt/eval counts.
+    """
+    response = generate(
+        model=MODEL,
+        options=MODEL_OPTIONS,
+        prompt=prompt,
+        system=TUTOR_SYSTEM_PROMPT,
+        context=context_tokens,
+        stream=True,
+        keep_alive=KEEP_ALIVE
+    )
+    for chunk in response:
+        if not chunk or not isinstance(chunk, dict):
+            continue
+        content = chunk.get("response", "")
+        if content:
+            yield content
+        if chunk.get("done"):
+            state.update({
+                "context": chunk.get("context") or [],
+                "prompt_eval_count": chunk.get("prompt_eval_count", 0),
+                "prompt_eval_duration_ms": round(chunk.get("prompt_eval_duration", 0) / 1e6, 1),
+                "eval_count": chunk.get("eval_count", 0)
+            })
+
 def generate_lesson_content(lesson_title: str, lesson_description: str, subject_area: str = "general", difficulty: str = "beginner"):
     """
     Generate comprehensive lesson content using AI with progress breakpoints
@@ -137,6 +197,7 @@ def generate_lesson_content(lesson_title: str, lesson_description: str, subject_
         # Use non-streaming version for lesson generation
         response = chat(
             model=MODEL,
+            options=MODEL_OPTIONS,
             messages=[
                 {"role": "system", "content": (
                     "You are an expert instructor who creates engaging, comprehensive lesson content with clear progress tracking. "
@@ -175,4 +236,80 @@ def generate_lesson_content(lesson_title: str, lesson_description: str, subject_
             
     except Exception as e:
         print(f"Error generating lesson content: {e}")
-        return f"Error generating lesson content: {str(e)}" 
\ No newline at end of file
+        return f"Error generating lesson content: {str(e)}"
+
+def extract_flashcards(lesson_title: str, lesson_content: str, subject: str = "general", max_cards: int = 10) -> str:
+    """
+    Extract term/definition pairs from a lesson in one JSON-mode call.
+    Returns the raw JSON text: {"flashcards": [{"term": ..., "definition": ...}]}
+    """
+    prompt = f"""
+    Extract the {max_cards} most important terms from this {subject} lesson as flashcards.
+    
+    Lesson Title: {lesson_title}
+    
+    Lesson Content:
+    {lesson_content}
+    
+    Respond with JSON only, in exactly this shape:
+    {{"flashcards": [{{"term": "short term or concept", "definition": "one or two sentence definition"}}]}}
+    
+    Use terms that actually appear in the lesson. Keep definitions self-contained and under 40 words.
+    """
+    
+    response = chat(
+        model=MODEL,
+        options=MODEL_OPTIONS,
+        messages=[
+            {"role": "system", "content": (
+                "You are an expert instructor who writes concise, accurate study flashcards. "
+                "You always answer with valid JSON and nothing else."
+            )},
+            {"role": "user", "content": prompt}
+        ],
+        format="json",
+        stream=False
+    )
+    
+    if response and isinstance(response, dict):
+        return response.get("message", {}).get("content", "")
+    return ""
+
+def embed_text(text: str, model: str = EMBEDDING_MODEL) -> List[float]:
+    """Embedding vector of a text from a local Ollama embedding model"""
+    response = embeddings(model=model, prompt=text)
+    return list(response.get("embedding", [])) if isinstance(response, dict) else []
+
+def summarize_conversation(previous_summary: str, messages: List[Dict[str, str]], max_words: int = 200) -> str:
+    """
+    Fold older chat turns into a running summary of the conversation (non-streaming).
+    messages are chat messages ({'role', 'content'}), oldest first.
+    """
+    transcript = "\n\n".join(f"{message['role'].upper()}: {message['content']}" for message in messages)
+    prompt = f"""
+    Update the summary of a tutoring conversation with the new turns below.
+    
+    Current summary:
+    {previous_summary or "(none yet)"}
+    
+    New turns:
+    {transcript}
+    
+    Write the updated summary in at most {max_words} words. Keep what the student is working on,
+    what they asked, what was explained (names, code, definitions) and anything they still struggle with.
+    Respond with the summary only.
+    """
+    
+    response = chat(
+        model=MODEL,
+        options=MODEL_OPTIONS,
+        messages=[
+            {"role": "system", "content": "You write short, factual summaries of tutoring conversations."},
+            {"role": "user", "content": prompt}
+        ],
+        stream=False
+    )
+    
+    if response and isinstance(response, dict):
+        return response.get("message", {}).get("content", "").strip()
+    return ""
@@ -0,0 +1,264 @@
+import atexit
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Any, Optional
+
+# Path to data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+ROLLUPS_FILE = os.path.join(DATA_DIR, 'analytics_rollups.json')
+
+# Scope name for totals across all users
+GLOBAL_SCOPE = '__global__'
+
+# Counters kept in every bucket (plus 'topics': {topic: challenges solved})
+METRICS = ('xp_earned', 'challenges_attempted', 'challenges_solved', 'flashcards_reviewed',
+           'lessons_completed', 'courses_completed')
+
+# How long buckets of each granularity are kept (None keeps them forever)
+RETENTION_DAYS = {'hour': 14, 'day': 730, 'week': None}
+GRANULARITIES = tuple(RETENTION_DAYS)
+
+# Longest range a query may cover, in buckets (e.g. about 7 months of hours)
+MAX_BUCKETS = 5000
+
+# Rollups are written to disk at most this often; they can be rebuilt from the
+# XP ledger and the submission log if the last few seconds are lost
+FLUSH_INTERVAL_SECONDS = 30
+
+_lock = threading.Lock()
+_rollups = None
+_dirty = False
+_last_flush = 0.0
+
+def bucket_start(timestamp: datetime, granularity: str) -> datetime:
+    """Start of the bucket a timestamp falls into"""
+    if granularity == 'hour':
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    day = timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == 'day':
+        return day
+    return day - timedelta(days=day.weekday())
+
+def _bucket_key(start: datetime, granularity: str) -> str:
+    return start.strftime('%Y-%m-%dT%H') if granularity == 'hour' else start.strftime('%Y-%m-%d')
+
+def _step(granularity: str) -> timedelta:
+    return {'hour': timedelta(hours=1), 'day': timedelta(days=1), 'week': timedelta(weeks=1)}[granularity]
+
+def _new_rollups() -> Dict[str, Any]:
+    return {granularity: {} for granularity in GRANULARITIES}
+
+def _load_rollups() -> Dict[str, Any]:
+    """Load rollups from disk the first time they are needed"""
+    global _rollups, _last_flush
+    if _rollups is None:
+        rollups = _new_rollups()
+        if os.path.exists(ROLLUPS_FILE):
+            try:
+                with open(ROLLUPS_FILE, 'r') as f:
+                    rollups.update(json.load(f))
+            except json.JSONDecodeError:
+                pass
+        _rollups = rollups
+        _last_flush = time.time()
+    return _rollups
+
+def _prune(rollups: Dict[str, Any], now: datetime):
+    for granularity, days in RETENTION_DAYS.items():
+        if days is None:
+            continue
+        cutoff = _bucket_key(bucket_start(now - timedelta(days=days), granularity), granularity)
+        for scope in rollups[granularity].values():
+            for key in [key for key in scope if key < cutoff]:
+                del scope[key]
+
+def _flush(force: bool = False):
+    global _dirty, _last_flush
+    if not _dirty or (not force and time.time() - _last_flush < FLUSH_INTERVAL_SECONDS):
+        return
+    _prune(_rollups, datetime.now())
+    os.makedirs(DATA_DIR, exist_ok=True)
+    temp_file = ROLLUPS_FILE + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(_rollups, f)
+    os.replace(temp_file, ROLLUPS_FILE)
+    _dirty = False
+    _last_flush = time.time()
+
+def flush_rollups():
+    """Write pending rollup changes to disk now"""
+    with _lock:
+        if _rollups is not None:
+            _flush(force=True)
+
+atexit.register(flush_rollups)
+
+def _add(rollups: Dict[str, Any], user_id: str, timestamp: datetime, counts: Dict[str, int], topic: str = ''):
+    """Add counts to the user's and the global bucket of every granularity"""
+    for granularity in GRANULARITIES:
+        key = _bucket_key(bucket_start(timestamp, granularity), granularity)
+        for scope in (user_id, GLOBAL_SCOPE):
+            bucket = rollups[granularity].setdefault(scope, {}).setdefault(key, {})
+            for metric, value in counts.items():
+                bucket[metric] = bucket.get(metric, 0) + value
+            if topic and counts.get('challenges_solved'):
+                topics = bucket.setdefault('topics', {})
+                topics[topic] = topics.get(topic, 0) + counts['challenges_solved']
+
+def _ledger_counts(entry: Dict[str, Any]) -> Dict[str, int]:
+    """Rollup counters for one XP ledger entry (bookkeeping entries count nothing)"""
+    from .ledger_service import BOOKKEEPING_ACTIONS
+
+    if entry['action'] in BOOKKEEPING_ACTIONS:
+        return {}
+    counts = {'xp_earned': entry['amount']}
+    if entry['source_type'] == 'flashcard':
+        counts['flashcards_reviewed'] = 1
+    elif entry['source_type'] == 'lesson':
+        counts['lessons_completed'] = 1
+    elif entry['source_type'] == 'course':
+        counts['courses_completed'] = 1
+    return counts
+
+def _submission_counts(record: Dict[str, Any], first_solve: bool) -> Dict[str, int]:
+    counts = {'challenges_attempted': 1}
+    if first_solve:
+        counts['challenges_solved'] = 1
+    return counts
+
+def record_ledger_entry(entry: Dict[str, Any]):
+    """Roll up one XP ledger entry (called by the ledger for every entry it writes)"""
+    global _dirty
+    counts = _ledger_counts(entry)
+    if not counts:
+        return
+    with _lock:
+        _add(_load_rollups(), entry['user_id'], datetime.fromisoformat(entry['timestamp']), counts)
+        _dirty = True
+        _flush()
+
+def record_submission_event(record: Dict[str, Any], first_solve: bool):
+    """Roll up one challenge submission (called by the submission log)"""
+    global _dirty
+    with _lock:
+        _add(_load_rollups(), record['user_id'], datetime.fromisoformat(record['timestamp']),
+             _submission_counts(record, first_solve), record.get('topic', ''))
+        _dirty = True
+        _flush()
+
+def rebuild_rollups() -> Dict[str, Any]:
+    """Recompute all rollups from the XP ledger and the submission log"""
+    from .ledger_service import iter_entries
+    from .submission_service import iter_submissions
+
+    global _rollups, _dirty
+    rollups = _new_rollups()
+    entries = iter_entries()
+    for entry in entries:
+        counts = _ledger_counts(entry)
+        if counts:
+            _add(rollups, entry['user_id'], datetime.fromisoformat(entry['timestamp']), counts)
+
+    solved = set()
+    submissions = 0
+    for record in iter_submissions():
+        key = (record['user_id'], record['challenge_id'])
+        first_solve = record.get('verdict') == 'accepted' and key not in solved
+        if first_solve:
+            solved.add(key)
+        _add(rollups, record['user_id'], datetime.fromisoformat(record['timestamp']),
+             _submission_counts(record, first_solve), record.get('topic', ''))
+        submissions += 1
+
+    with _lock:
+        _rollups = rollups
+        _dirty = True
+        _flush(force=True)
+    return {'success': True, 'ledger_entries': len(entries), 'submissions': submissions}
+
+def _parse_time(value: str) -> datetime:
+    """An ISO timestamp as naive local time, like the bucket keys (offsets are converted)"""
+    timestamp = datetime.fromisoformat(value)
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone().replace(tzinfo=None)
+    return timestamp
+
+def _parse_range(granularity: str, start: Optional[str], end: Optional[str]) -> tuple:
+    """Bucket starts of a range; raises ValueError if it is malformed or spans more than MAX_BUCKETS"""
+    try:
+        end_time = _parse_time(end) if end else datetime.now()
+        default_span = {'hour': timedelta(days=1), 'day': timedelta(days=30), 'week': timedelta(weeks=26)}[granularity]
+        start_time = _parse_time(start) if start else end_time - default_span
+        start_time, end_time = bucket_start(start_time, granularity), bucket_start(end_time, granularity)
+    except OverflowError:
+        raise ValueError('Date range is out of bounds')
+    if (end_time - start_time) // _step(granularity) + 1 > MAX_BUCKETS:
+        raise ValueError(f"Range spans more than {MAX_BUCKETS} {granularity} buckets; narrow it or use a coarser granularity")
+    return start_time, end_time
+
+def _downsample(points: List[Dict[str, Any]], max_points: int) -> List[Dict[str, Any]]:
+    """Merge adjacent buckets so at most max_points remain; each point is labelled by its first bucket"""
+    if max_points <= 0 or len(points) <= max_points:
+        return points
+    size = math.ceil(len(points) / max_points)
+    merged = []
+    for i in range(0, len(points), size):
+        group = points[i:i + size]
+        merged.append({'bucket': group[0]['bucket'], 'value': sum(point['value'] for point in group)})
+    return merged
+
+def get_series(metric: str = 'xp_earned', granularity: str = 'day', user_id: Optional[str] = None,
+               start: Optional[str] = None, end: Optional[str] = None, max_points: int = 0) -> Dict[str, Any]:
+    """
+    A time series of one metric from the pre-aggregated buckets, with empty buckets as 0.
+    Global totals are returned when no user is given. Raises ValueError for bad arguments.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}' (expected one of {', '.join(METRICS)})")
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity '{granularity}' (expected one of {', '.join(GRANULARITIES)})")
+
+    start_time, end_time = _parse_range(granularity, start, end)
+    step = _step(granularity)
+    with _lock:
+        buckets = _load_rollups()[granularity].get(user_id or GLOBAL_SCOPE, {})
+        points = []
+        current = start_time
+        while current <= end_time:
+            key = _bucket_key(current, granularity)
+            points.append({'bucket': key, 'value': buckets.get(key, {}).get(metric, 0)})
+            current += step
+
+    return {
+        'metric': metric,
+        'granularity': granularity,
+        'user_id': user_id,
+        'from': _bucket_key(start_time, granularity),
+        'to': _bucket_key(end_time, granularity),
+        'total': sum(point['value'] for point in points),
+        'points': _downsample(points, max_points)
+    }
+
+def get_topic_breakdown(user_id: Optional[str] = None, start: Optional[str] = None,
+                        end: Optional[str] = None) -> Dict[str, Any]:
+    """Challenges solved per topic, summed over the daily buckets in a range"""
+    start_time, end_time = _parse_range('day', start, end)
+    topics = {}
+    with _lock:
+        buckets = _load_rollups()['day'].get(user_id or GLOBAL_SCOPE, {})
+        current = start_time
+        while current <= end_time:
+            for topic, count in buckets.get(_bucket_key(current, 'day'), {}).get('topics', {}).items():
+                topics[topic] = topics.get(topic, 0) + count
+            current += timedelta(days=1)
+
+    return {
+        'user_id': user_id,
+        'from': _bucket_key(start_time, 'day'),
+        'to': _bucket_key(end_time, 'day'),
+        'topics': dict(sorted(topics.items(), key=lambda item: item[1], reverse=True))
+    }
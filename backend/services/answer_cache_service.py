@@ -0,0 +1,233 @@
+import atexit
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    # Optional: lookups fall back to pure Python, which is fine for a few hundred entries
+    np = None
+
+from .retrieval_service import embedding_model, embeddings_available, mark_embeddings_failed
+
+# Path to data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+ANSWER_CACHE_FILE = os.path.join(DATA_DIR, 'answer_cache.json')
+SETTINGS_FILE = os.path.join(DATA_DIR, 'settings.json')
+
+# Defaults; data/settings.json may override them with the keys in _setting calls below
+DEFAULT_SIMILARITY_THRESHOLD = 0.92
+DEFAULT_MAX_ENTRIES = 500
+DEFAULT_MAX_BYTES = 5 * 1024 * 1024
+
+# Hits only update recency in memory; the file is rewritten at most this often for them
+FLUSH_INTERVAL_SECONDS = 60
+
+_FILLER = re.compile(r'^(hey|hi|hello|please|can you|could you|would you|tell me|explain)\s+')
+
+def _setting(key: str, default: Any) -> Any:
+    try:
+        with open(SETTINGS_FILE, 'r') as f:
+            return type(default)(json.load(f).get(key, default))
+    except (FileNotFoundError, json.JSONDecodeError, ValueError, TypeError):
+        return default
+
+def similarity_threshold() -> float:
+    return _setting('tutor_cache_similarity', DEFAULT_SIMILARITY_THRESHOLD)
+
+def normalize_question(question: str) -> str:
+    """Lowercase, punctuation and leading pleasantries removed, spaces collapsed"""
+    text = re.sub(r'\s+', ' ', re.sub(r'[^\w\s+#]', ' ', question.lower())).strip()
+    previous = None
+    while previous != text:
+        previous, text = text, _FILLER.sub('', text)
+    return text
+
+def context_fingerprint(context: str) -> str:
+    """Answers are only reused for the same retrieved course material"""
+    return hashlib.sha1((context or '').encode('utf-8')).hexdigest()
+
+_lock = threading.RLock()
+_entries = None     # entry id -> entry, in least recently used first order
+_matrix = None      # (model, ids, unit vectors) of the entries embedded with the current model
+_dirty = False
+_last_flush = 0.0
+
+def _load_entries() -> Dict[str, Dict[str, Any]]:
+    global _entries, _last_flush
+    if _entries is None:
+        try:
+            with open(ANSWER_CACHE_FILE, 'r') as f:
+                stored = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            stored = []
+        _entries = {entry['id']: entry for entry in sorted(stored, key=lambda entry: entry['last_hit'])}
+        _last_flush = time.time()
+    return _entries
+
+def _flush(force: bool = False):
+    global _dirty, _last_flush
+    if not _dirty or (not force and time.time() - _last_flush < FLUSH_INTERVAL_SECONDS):
+        return
+    os.makedirs(DATA_DIR, exist_ok=True)
+    temp_file = ANSWER_CACHE_FILE + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(list(_entries.values()), f)
+    os.replace(temp_file, ANSWER_CACHE_FILE)
+    _dirty = False
+    _last_flush = time.time()
+
+def flush_cache():
+    with _lock:
+        if _entries is not None:
+            _flush(force=True)
+
+atexit.register(flush_cache)
+
+def _normalized(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(x * x for x in vector))
+    return [x / norm for x in vector] if norm else vector
+
+def _get_matrix(model: str) -> Tuple[List[str], Any]:
+    """Unit vectors of all entries embedded with model, as one matrix when NumPy is available"""
+    global _matrix
+    if _matrix is None or _matrix[0] != model:
+        entries = [entry for entry in _load_entries().values() if entry.get('model') == model and entry.get('vector')]
+        ids = [entry['id'] for entry in entries]
+        vectors = [_normalized(entry['vector']) for entry in entries]
+        if np is not None and vectors:
+            vectors = np.array(vectors, dtype=np.float32)
+        _matrix = (model, ids, vectors)
+    return _matrix[1], _matrix[2]
+
+def _nearest(model: str, vector: List[float], context: str) -> Tuple[Optional[str], float]:
+    """Brute-force nearest neighbour by cosine similarity among entries for the same course material"""
+    ids, vectors = _get_matrix(model)
+    if not ids:
+        return None, 0.0
+    query = _normalized(vector)
+    if np is not None:
+        similarities = (vectors @ np.array(query, dtype=np.float32)).tolist()
+    else:
+        similarities = [sum(x * y for x, y in zip(row, query)) for row in vectors]
+    best_id, best = None, 0.0
+    for entry_id, similarity in zip(ids, similarities):
+        if similarity > best and _entries[entry_id]['context'] == context:
+            best_id, best = entry_id, similarity
+    return best_id, best
+
+def _touch(entry: Dict[str, Any]):
+    global _dirty
+    entry['hits'] = entry.get('hits', 0) + 1
+    entry['last_hit'] = time.time()
+    # Move to the most recently used end
+    _entries.pop(entry['id'])
+    _entries[entry['id']] = entry
+    _dirty = True
+    _flush()
+
+def lookup_answer(question: str, context: str = '') -> Dict[str, Any]:
+    """
+    Find a cached answer to an equivalent question asked with the same course material.
+    Returns {'entry': entry or None, 'similarity', 'vector'}; the question's vector is
+    passed back so store_answer does not embed it again.
+    """
+    from .ai_service import embed_text
+
+    normalized = normalize_question(question)
+    fingerprint = context_fingerprint(context)
+    with _lock:
+        for entry in reversed(list(_load_entries().values())):
+            if entry['normalized'] == normalized and entry['context'] == fingerprint:
+                _touch(entry)
+                return {'entry': entry, 'similarity': 1.0, 'vector': entry.get('vector')}
+
+    model = embedding_model()
+    vector = None
+    if embeddings_available():
+        try:
+            vector = embed_text(normalized, model)
+        except Exception as e:
+            print(f"Question embedding failed, answer cache uses exact matches only: {e}")
+            mark_embeddings_failed()
+    if not vector:
+        return {'entry': None, 'similarity': 0.0, 'vector': None}
+
+    with _lock:
+        entry_id, similarity = _nearest(model, vector, fingerprint)
+        entry = _entries.get(entry_id)
+        if entry and similarity >= similarity_threshold():
+            _touch(entry)
+            return {'entry': entry, 'similarity': similarity, 'vector': vector}
+    return {'entry': None, 'similarity': similarity, 'vector': vector}
+
+def _evict():
+    """Drop least recently used entries beyond the entry and size limits"""
+    global _matrix
+    max_entries = _setting('tutor_cache_max_entries', DEFAULT_MAX_ENTRIES)
+    max_bytes = _setting('tutor_cache_max_bytes', DEFAULT_MAX_BYTES)
+    total_bytes = sum(entry['size'] for entry in _entries.values())
+    while _entries and (len(_entries) > max_entries or total_bytes > max_bytes):
+        oldest = next(iter(_entries))
+        total_bytes -= _entries.pop(oldest)['size']
+        _matrix = None
+
+def store_answer(question: str, context: str, chunks: List[str], vector: Optional[List[float]] = None) -> Dict[str, Any]:
+    """Cache a completed streamed answer, keeping its chunks so it can be replayed as a stream"""
+    global _matrix, _dirty
+    now = time.time()
+    entry = {
+        'id': str(uuid.uuid4()),
+        'question': question,
+        'normalized': normalize_question(question),
+        'context': context_fingerprint(context),
+        'model': embedding_model() if vector else None,
+        'vector': vector,
+        'chunks': chunks,
+        'size': sum(len(chunk.encode('utf-8')) for chunk in chunks) + len(question) + 8 * len(vector or []),
+        'created': now,
+        'last_hit': now,
+        'hits': 0
+    }
+    with _lock:
+        _load_entries()[entry['id']] = entry
+        _matrix = None
+        _evict()
+        _dirty = True
+        _flush(force=True)
+    return entry
+
+def replay_answer(entry: Dict[str, Any]) -> Iterator[str]:
+    """The cached answer, chunk by chunk as it was streamed"""
+    for chunk in entry['chunks']:
+        yield chunk
+
+def clear_cache() -> Dict[str, Any]:
+    global _entries, _matrix, _dirty
+    with _lock:
+        removed = len(_load_entries())
+        _entries = {}
+        _matrix = None
+        _dirty = True
+        _flush(force=True)
+    return {'success': True, 'removed': removed}
+
+def cache_stats() -> Dict[str, Any]:
+    with _lock:
+        entries = list(_load_entries().values())
+        return {
+            'entries': len(entries),
+            'bytes': sum(entry['size'] for entry in entries),
+            'hits': sum(entry.get('hits', 0) for entry in entries),
+            'similarity_threshold': similarity_threshold(),
+            'max_entries': _setting('tutor_cache_max_entries', DEFAULT_MAX_ENTRIES),
+            'max_bytes': _setting('tutor_cache_max_bytes', DEFAULT_MAX_BYTES),
+            'vector_backend': 'numpy' if np is not None else 'python'
+        }
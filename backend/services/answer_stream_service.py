@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Iterator, Any, Optional
+
+from .chat_service import append_message
+
+# Path to data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+DRAFTS_DIR = os.path.join(DATA_DIR, 'answer_drafts')
+
+# While an answer streams, the text so far is written to a small draft file at most
+# this often; chats.json itself is written once, when the stream ends
+FLUSH_INTERVAL_MS = 500
+
+# Answers that did not finish keep what was streamed, marked with a 'status'
+INTERRUPTED = 'interrupted'
+ERROR = 'error'
+
+_recovered = False
+_recover_lock = threading.Lock()
+
+def _draft_path(message_id: str) -> str:
+    return os.path.join(DRAFTS_DIR, f"{message_id}.json")
+
+def _write_draft(chat_id: str, message: Dict[str, Any], content: str):
+    os.makedirs(DRAFTS_DIR, exist_ok=True)
+    path = _draft_path(message['id'])
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'chat_id': chat_id, 'message': {**message, 'content': content}}, f)
+    os.replace(path + '.tmp', path)
+
+def _remove_draft(message_id: str):
+    try:
+        os.remove(_draft_path(message_id))
+    except FileNotFoundError:
+        pass
+
+def _finish(chat_id: str, message: Dict[str, Any], content: str, status: Optional[str]):
+    final = {**message, 'content': content}
+    if status:
+        final['status'] = status
+    try:
+        append_message(chat_id, final)
+    finally:
+        _remove_draft(message['id'])
+
+def persist_stream(chat_id: str, stream: Iterator[str], message_id: Optional[str] = None,
+                   flush_interval_ms: int = FLUSH_INTERVAL_MS) -> Iterator[str]:
+    """
+    Pass a tutor answer stream through while saving it as a 'tutor' message of the chat.
+    The text so far is flushed to a draft every flush_interval_ms; when the stream ends
+    the message is added to the chat in one write. If the client disconnects or the model
+    fails midway, the partial answer is saved with status 'interrupted' or 'error', and a
+    draft left behind by a crash is recovered into its chat on the next start.
+    """
+    recover_drafts()
+    message = {
+        'id': message_id or str(uuid.uuid4()),
+        'content': '',
+        'sender': 'tutor',
+        'timestamp': datetime.now().isoformat()
+    }
+    parts = []
+    last_flush = time.monotonic()
+    status = INTERRUPTED
+    try:
+        for chunk in stream:
+            parts.append(chunk)
+            if (time.monotonic() - last_flush) * 1000 >= flush_interval_ms:
+                _write_draft(chat_id, message, ''.join(parts))
+                last_flush = time.monotonic()
+            yield chunk
+        status = None
+    except Exception:
+        status = ERROR
+        raise
+    finally:
+        # Also reached when the client goes away (GeneratorExit at the last yield)
+        if parts or status is None:
+            _finish(chat_id, message, ''.join(parts), status)
+        else:
+            _remove_draft(message['id'])
+
+def recover_drafts() -> int:
+    """Add answers whose stream was cut off by a server stop to their chats (once per process)"""
+    global _recovered
+    with _recover_lock:
+        if _recovered:
+            return 0
+        _recovered = True
+    if not os.path.isdir(DRAFTS_DIR):
+        return 0
+    recovered = 0
+    for name in os.listdir(DRAFTS_DIR):
+        path = os.path.join(DRAFTS_DIR, name)
+        if not name.endswith('.json'):
+            os.remove(path)
+            continue
+        try:
+            with open(path, 'r') as f:
+                draft = json.load(f)
+            message = draft['message']
+            _finish(draft['chat_id'], message, message.get('content', ''), INTERRUPTED)
+            recovered += 1
+        except (json.JSONDecodeError, KeyError, OSError) as e:
+            print(f"Failed to recover answer draft {name}: {e}")
+    return recovered
@@ -1,14 +1,24 @@
 import sys
 import json
 import os
+import re
+import time
 from services.ai_service import ask_gemma
 from services.verification_service import verify_code_with_ai
-from typing import Dict, List, Any
+from services.test_suite_service import get_test_suite, build_test_cases
+from services.submission_service import record_submission
+from services.ledger_service import record_xp
+from services.activity_service import add_day_xp
+from services.epoch_service import resolve_progress, write_progress
+from services.search_service import sync_source
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Any, Iterator
 
 # Path to data files
 DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
 CHALLENGES_FILE = os.path.join(DATA_DIR, 'challenges.json')
 PROGRESS_FILE = os.path.join(DATA_DIR, 'progress.json')
+REFERENCE_SOLUTIONS_FILE = os.path.join(DATA_DIR, 'reference_solutions.json')
 
 def load_challenges() -> List[Dict[str, Any]]:
     """Load challenges from JSON file and update completion status based on user progress"""
@@ -88,19 +98,18 @@ def save_challenges(challenges: List[Dict[str, Any]]):
     os.makedirs(DATA_DIR, exist_ok=True)
     with open(CHALLENGES_FILE, 'w') as f:
         json.dump(challenges, f, indent=2)
+    sync_source('challenges', challenges)
 
 def load_progress() -> Dict[str, Any]:
     """Load user progress from JSON file"""
     if not os.path.exists(PROGRESS_FILE):
         return {}
     with open(PROGRESS_FILE, 'r') as f:
-        return json.load(f)
+        return resolve_progress(json.load(f))
 
 def save_progress(progress: Dict[str, Any]):
     """Save user progress to JSON file"""
-    os.makedirs(DATA_DIR, exist_ok=True)
-    with open(PROGRESS_FILE, 'w') as f:
-        json.dump(progress, f, indent=2)
+    write_progress(progress)
 
 def collect_ai_response(generator) -> str:
     """Collect all chunks from the AI generator into a single string"""
@@ -463,6 +472,54 @@ def verify_with_model(problem: Dict[str, Any], user_code: str, test_cases: List[
     """
     return verify_code_with_ai(problem, user_code, test_cases)
 
+def is_complete_code(user_code: str) -> bool:
+    """Check that a submission is more than the bare template"""
+    user_code_clean = user_code.strip()
+    return bool(
+        user_code_clean and 
+        not user_code_clean.endswith('pass') and
+        not '# Your code here' in user_code_clean and
+        'return ' in user_code_clean and  # Must have a return statement
+        len(user_code_clean.split('\n')) > 5  # Must have more than just template
+    )
+
+def evaluate_submission(challenge: Dict[str, Any], user_code: str, grade_performance: bool = False) -> Dict[str, Any]:
+    """
+    Grade a submission without touching user progress.
+    Adds 'all_tests_passed' and, when requested, 'performance' to accepted results.
+    """
+    # Use the compiled test suite instead of re-parsing the raw examples
+    test_cases = build_test_cases(challenge, get_test_suite(challenge))
+    result = verify_with_model(challenge, user_code, test_cases)
+    
+    # Only consider AI verification if code is actually complete
+    if is_complete_code(user_code) and result.get('correct', False):
+        test_results = result.get('test_results', [])
+        result['all_tests_passed'] = all(test.get('pass', False) for test in test_results)
+        
+        # Optionally time the solution against the reference on scaled inputs
+        if grade_performance:
+            from services.performance_service import grade_challenge_submission
+            result['performance'] = grade_challenge_submission(challenge, user_code)
+    else:
+        # If code is incomplete, override AI result and mark as failed
+        result['correct'] = False
+        result['all_tests_passed'] = False
+        result['feedback'] = 'Code is incomplete. Please implement a complete solution.'
+        result['test_results'] = [{
+            'input': str(test_case['input']),
+            'expected_output': str(test_case['output']),
+            'actual_output': 'Code incomplete',
+            'pass': False
+        } for test_case in test_cases]
+    
+    return result
+
+def is_perfect_solution(result: Dict[str, Any]) -> bool:
+    """A perfect solution passes every test and, if it was timed, is not less efficient than the reference"""
+    performance = result.get('performance')
+    return bool(result.get('all_tests_passed')) and (performance is None or performance.get('efficient') is not False)
+
 def get_solution(problem: Dict[str, Any]) -> str:
     """
     Generate a solution for the given problem using the AI model.
@@ -514,6 +571,42 @@ Provide a clear explanation of your approach, why it works, and how it handles t
     except Exception as e:
         return f"Error generating solution: {str(e)}"
 
+def extract_code_block(response: str) -> str:
+    """Extract the first fenced code block from an AI response"""
+    match = re.search(r"```[\w+-]*\n(.*?)```", response, re.DOTALL)
+    if match:
+        return match.group(1).strip()
+    return response.strip()
+
+def load_reference_solutions() -> Dict[str, Any]:
+    """Load cached reference solutions from JSON file"""
+    if not os.path.exists(REFERENCE_SOLUTIONS_FILE):
+        return {}
+    with open(REFERENCE_SOLUTIONS_FILE, 'r') as f:
+        return json.load(f)
+
+def save_reference_solutions(solutions: Dict[str, Any]):
+    """Save reference solutions to JSON file"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(REFERENCE_SOLUTIONS_FILE, 'w') as f:
+        json.dump(solutions, f, indent=2)
+
+def get_reference_solution(problem: Dict[str, Any], fingerprint: str = '') -> str:
+    """
+    Get runnable reference code for a challenge, generating it with the AI model on first use.
+    The cached code is regenerated when the challenge's test suite fingerprint changes.
+    """
+    solutions = load_reference_solutions()
+    cached = solutions.get(str(problem.get('id')))
+    if cached and cached.get('fingerprint') == fingerprint:
+        return cached['code']
+    
+    code = extract_code_block(get_solution(problem))
+    if problem.get('id') is not None and not code.startswith('Error generating solution'):
+        solutions[str(problem['id'])] = {'code': code, 'fingerprint': fingerprint}
+        save_reference_solutions(solutions)
+    return code
+
 def get_hints(problem: Dict[str, Any]) -> str:
     """
     Generate hints for the given problem using the AI model.
@@ -655,110 +748,172 @@ Congratulate the user, and provide a brief, constructive review of their code st
 def update_user_progress(user_id: str, challenge_id: int, xp_earned: int, challenge_data: Dict[str, Any] = None):
     """
     Update user progress when they complete a challenge.
+    Streak, XP, completion and achievement progress are applied to one record and saved once.
     """
-    from .achievement_service import update_achievement_progress, update_streak, calculate_level
+    from .achievement_service import apply_streak, apply_achievement_progress, calculate_level, new_user_progress
     
     progress = load_progress()
+    user_progress = progress.setdefault(user_id, new_user_progress())
     
-    if user_id not in progress:
-        progress[user_id] = {
-            'total_xp': 0,
-            'completed_challenges': [],
-            'completed_courses': [],
-            'completed_lessons': [],
-            'level': 1,
-            'streak': 0,
-            'longest_streak': 0,
-            'last_active_date': '',
-            'achievements': [],
-            'achievement_progress': {
-                'challenges_completed': 0,
-                'flashcards_learned': 0,
-                'courses_completed': 0,
-                'lessons_completed': 0,
-                'streak_days': 0,
-                'perfect_solutions': 0,
-                'different_topics': 0,
-                'different_difficulties': 0
-            },
-            'stats': {
-                'total_challenges_completed': 0,
-                'total_flashcards_learned': 0,
-                'total_courses_completed': 0,
-                'total_lessons_completed': 0,
-                'total_perfect_solutions': 0,
-                'total_topics_covered': 0,
-                'total_difficulties_tried': 0,
-                'average_challenge_time': 0,
-                'favorite_topic': '',
-                'favorite_difficulty': '',
-                'topics_covered': [],
-                'difficulties_tried': []
-            }
-        }
-    
-    # Get current user progress
-    user_progress = progress[user_id]
+    # XP is awarded once per challenge; the ledger rejects repeat completions
+    entry = record_xp(user_id, 'challenge', challenge_id, 'completed', xp_earned, user_progress['total_xp'])
+    if entry:
+        user_progress['total_xp'] = entry['balance']
     
-    # Update streak first
-    updated_progress = update_streak(user_id)
+    # Update streak and today's XP in the activity calendar
+    apply_streak(user_progress, user_id=user_id, xp=entry['amount'] if entry else 0)
     
-    # Merge the updated progress with current progress
-    user_progress.update(updated_progress)
-    
-    # Add XP
-    user_progress['total_xp'] += xp_earned
-    
-    # Add challenge to completed list if not already there
+    # Only a first completion counts towards challenge achievements, so the
+    # counters always match the completed_challenges list
+    new_achievements = []
     if challenge_id not in user_progress['completed_challenges']:
         user_progress['completed_challenges'].append(challenge_id)
-    
-    # Save progress before calling achievement service
-    progress[user_id] = user_progress
-    save_progress(progress)
-    
-    # Update achievement progress
-    additional_data = {}
-    if challenge_data:
-        additional_data = {
-            'topic': challenge_data.get('topic', ''),
-            'difficulty': challenge_data.get('difficulty', '')
-        }
-    
-    achievement_result = update_achievement_progress(
-        user_id, 
-        'challenge_completed', 
-        1, 
-        additional_data
-    )
-    
-    # Ensure achievements are unlocked (but don't add XP - achievements are cosmetic)
-    if achievement_result['new_achievements']:
-        # Add achievements to user_progress
-        for achievement in achievement_result['new_achievements']:
-            if achievement['id'] not in user_progress.get('achievements', []):
-                user_progress.setdefault('achievements', []).append(achievement['id'])
         
-        # Save the updated progress
-        progress[user_id] = user_progress
-        save_progress(progress)
+        additional_data = {}
+        if challenge_data:
+            additional_data = {
+                'topic': challenge_data.get('topic', ''),
+                'difficulty': challenge_data.get('difficulty', '')
+            }
+        new_achievements = apply_achievement_progress(user_id, user_progress, 'challenge_completed', 1, additional_data)
     
     # Recalculate level with new XP
     user_progress['level'] = calculate_level(user_progress['total_xp'])
     
-    # Save the final progress with updated level
-    progress[user_id] = user_progress
     save_progress(progress)
     
-    # Reload progress to get the updated data
-    progress = load_progress()
-    user_progress = progress[user_id]
-    
     return {
         'progress': user_progress,
-        'new_achievements': achievement_result['new_achievements'],
-        'achievement_xp_earned': achievement_result['xp_earned'],
-        'total_xp_earned': xp_earned + achievement_result['xp_earned']
+        'new_achievements': new_achievements,
+        'achievement_xp_earned': 0,  # Achievements are cosmetic
+        'total_xp_earned': entry['amount'] if entry else 0
+    }
+
+def apply_submission_results(accepted: List[Dict[str, Any]], perfect_xp: int = 25) -> Dict[str, Dict[str, Any]]:
+    """
+    Apply XP and progress for many accepted submissions with a single progress write.
+    Each entry has 'user_id', 'challenge' and 'perfect'. Challenges a user already
+    completed earn nothing again, so regrading a batch is safe to repeat.
+    Returns a per-user summary of what was awarded.
+    """
+    from .achievement_service import apply_streak, apply_achievement_progress, calculate_level, new_user_progress
+    
+    progress = load_progress()
+    summary = {}
+    
+    for item in accepted:
+        user_id = item['user_id']
+        challenge = item['challenge']
+        user_progress = progress.setdefault(user_id, new_user_progress())
+        user_summary = summary.setdefault(user_id, {
+            'xp_earned': 0,
+            'completed_challenges': [],
+            'new_achievements': []
+        })
+        
+        apply_streak(user_progress, user_id=user_id)
+        if challenge['id'] in user_progress['completed_challenges']:
+            continue
+        entry = record_xp(user_id, 'challenge', challenge['id'], 'completed', challenge.get('xpReward', 50),
+                          user_progress['total_xp'])
+        if entry is None:
+            continue
+        
+        xp_earned = entry['amount']
+        user_progress['completed_challenges'].append(challenge['id'])
+        new_achievements = apply_achievement_progress(user_id, user_progress, 'challenge_completed', 1, {
+            'topic': challenge.get('topic', ''),
+            'difficulty': challenge.get('difficulty', '')
+        })
+        
+        if item.get('perfect'):
+            perfect_entry = record_xp(user_id, 'perfect_solution', challenge['id'], 'awarded', perfect_xp)
+            if perfect_entry:
+                entry = perfect_entry
+                xp_earned += perfect_entry['amount']
+                new_achievements += apply_achievement_progress(user_id, user_progress, 'perfect_solution', 1)
+        
+        user_progress['total_xp'] = entry['balance']
+        user_progress['level'] = calculate_level(user_progress['total_xp'])
+        add_day_xp(user_progress, xp_earned)
+        
+        user_summary['xp_earned'] += xp_earned
+        user_summary['completed_challenges'].append(challenge['id'])
+        user_summary['new_achievements'] += new_achievements
+    
+    if summary:
+        save_progress(progress)
+    return summary
+
+def iter_batch_verification(submissions: List[Dict[str, Any]], max_concurrency: int = 4,
+                            grade_performance: bool = False) -> Iterator[Dict[str, Any]]:
+    """
+    Verify many submissions with a bounded worker pool, yielding each result as it finishes.
+    Progress for accepted submissions is committed once at the end (or when the consumer stops early),
+    and a final 'summary' item reports what was awarded.
+    """
+    challenges = {c['id']: c for c in load_challenges()}
+    accepted = []
+    counts = {'accepted': 0, 'failed': 0, 'errors': 0}
+    
+    def verify_one(submission: Dict[str, Any]) -> Dict[str, Any]:
+        challenge = challenges.get(submission['challenge_id'])
+        if not challenge:
+            raise ValueError("Challenge not found")
+        started = time.perf_counter()
+        result = evaluate_submission(challenge, submission['user_code'], grade_performance)
+        result['verification_ms'] = (time.perf_counter() - started) * 1000
+        return result
+    
+    executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+    futures = {executor.submit(verify_one, submission): index for index, submission in enumerate(submissions)}
+    finished = False
+    try:
+        for future in as_completed(futures):
+            index = futures[future]
+            submission = submissions[index]
+            item = {
+                'type': 'result',
+                'index': index,
+                'user_id': submission['user_id'],
+                'challenge_id': submission['challenge_id']
+            }
+            try:
+                result = future.result()
+            except Exception as e:
+                counts['errors'] += 1
+                item['error'] = str(e)
+                yield item
+                continue
+            
+            result['perfect_solution'] = result['correct'] and is_perfect_solution(result)
+            record_submission(submission['user_id'], submission['challenge_id'], submission['user_code'],
+                              result, result.pop('verification_ms'), source='batch', timed=False,
+                              topic=challenges[submission['challenge_id']].get('topic', ''))
+            if result['correct']:
+                counts['accepted'] += 1
+                accepted.append({
+                    'user_id': submission['user_id'],
+                    'challenge': challenges[submission['challenge_id']],
+                    'perfect': result['perfect_solution']
+                })
+            else:
+                counts['failed'] += 1
+            item.update(result)
+            yield item
+        finished = True
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+        if not finished:
+            # The consumer went away; still keep what was already graded
+            apply_submission_results(accepted)
+    
+    users = apply_submission_results(accepted)
+    yield {
+        'type': 'summary',
+        'total': len(submissions),
+        **counts,
+        'users': users
     }
 
 def mark_challenge_completed(challenge_id: int) -> bool:
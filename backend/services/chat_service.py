@@ -1,14 +1,22 @@
 import json
 import os
+import threading
 from typing import List, Dict, Any, Optional
 from datetime import datetime
+from .search_service import sync_source
 
 # Path to data files
 DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
 CHATS_FILE = os.path.join(DATA_DIR, 'chats.json')
 
+# Serializes read-modify-write of chats.json between requests and background summaries
+_lock = threading.RLock()
+
 def load_chats() -> List[Dict[str, Any]]:
     """Load all chat sessions from JSON file"""
+    from .answer_stream_service import recover_drafts
+    recover_drafts()
+    
     if not os.path.exists(CHATS_FILE):
         # Create the file with empty list if it doesn't exist
         os.makedirs(DATA_DIR, exist_ok=True)
@@ -36,35 +44,37 @@ def load_chats() -> List[Dict[str, Any]]:
 
 def save_chats(chats: List[Dict[str, Any]]) -> bool:
     """Save all chat sessions to JSON file"""
-    try:
-        os.makedirs(DATA_DIR, exist_ok=True)
+    with _lock:
+        try:
+            os.makedirs(DATA_DIR, exist_ok=True)
         
-        # Convert datetime objects to ISO strings for JSON serialization
-        chats_serializable = []
-        for chat in chats:
-            chat_copy = chat.copy()
-            if isinstance(chat_copy.get('createdAt'), datetime):
-                chat_copy['createdAt'] = chat_copy['createdAt'].isoformat()
-            if isinstance(chat_copy.get('updatedAt'), datetime):
-                chat_copy['updatedAt'] = chat_copy['updatedAt'].isoformat()
+            # Convert datetime objects to ISO strings for JSON serialization
+            chats_serializable = []
+            for chat in chats:
+                chat_copy = chat.copy()
+                if isinstance(chat_copy.get('createdAt'), datetime):
+                    chat_copy['createdAt'] = chat_copy['createdAt'].isoformat()
+                if isinstance(chat_copy.get('updatedAt'), datetime):
+                    chat_copy['updatedAt'] = chat_copy['updatedAt'].isoformat()
             
-            # Convert message timestamps
-            messages_serializable = []
-            for message in chat_copy.get('messages', []):
-                message_copy = message.copy()
-                if isinstance(message_copy.get('timestamp'), datetime):
-                    message_copy['timestamp'] = message_copy['timestamp'].isoformat()
-                messages_serializable.append(message_copy)
+                # Convert message timestamps
+                messages_serializable = []
+                for message in chat_copy.get('messages', []):
+                    message_copy = message.copy()
+                    if isinstance(message_copy.get('timestamp'), datetime):
+                        message_copy['timestamp'] = message_copy['timestamp'].isoformat()
+                    messages_serializable.append(message_copy)
             
-            chat_copy['messages'] = messages_serializable
-            chats_serializable.append(chat_copy)
+                chat_copy['messages'] = messages_serializable
+                chats_serializable.append(chat_copy)
         
-        with open(CHATS_FILE, 'w') as f:
-            json.dump(chats_serializable, f, indent=2)
-        return True
-    except Exception as e:
-        print(f"Error saving chats: {e}")
-        return False
+            with open(CHATS_FILE, 'w') as f:
+                json.dump(chats_serializable, f, indent=2)
+            sync_source('chats', chats_serializable)
+            return True
+        except Exception as e:
+            print(f"Error saving chats: {e}")
+            return False
 
 def get_chat_by_id(chat_id: str) -> Optional[Dict[str, Any]]:
     """Get a specific chat session by ID"""
@@ -75,8 +85,6 @@ def get_chat_by_id(chat_id: str) -> Optional[Dict[str, Any]]:
     return None
 
 def create_chat(chat_data: Dict[str, Any]) -> Dict[str, Any]:
-    chats = load_chats()
-    
     # Convert message timestamps to datetime objects if they are strings
     messages = []
     for msg in chat_data.get('messages', []):
@@ -94,37 +102,64 @@ def create_chat(chat_data: Dict[str, Any]) -> Dict[str, Any]:
         'updatedAt': datetime.now()
     }
 
-    chats.append(new_chat)
-    save_chats(chats)
+    with _lock:
+        chats = load_chats()
+        chats.append(new_chat)
+        save_chats(chats)
     return new_chat
 
 def update_chat(chat_id: str, chat_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """Update an existing chat session"""
-    chats = load_chats()
-    
-    for i, chat in enumerate(chats):
-        if chat.get('id') == chat_id:
-            # Update fields
-            chats[i].update({
-                'name': chat_data.get('name', chat['name']),
-                'messages': chat_data.get('messages', chat['messages']),
-                'updatedAt': datetime.now()
-            })
-            save_chats(chats)
-            return chats[i]
+    with _lock:
+        chats = load_chats()
+        
+        for i, chat in enumerate(chats):
+            if chat.get('id') == chat_id:
+                # Update fields
+                chats[i].update({
+                    'name': chat_data.get('name', chat['name']),
+                    'messages': chat_data.get('messages', chat['messages']),
+                    'updatedAt': datetime.now()
+                })
+                save_chats(chats)
+                return chats[i]
     
     return None
 
+def append_message(chat_id: str, message: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Add one message to the end of a chat; returns the updated chat or None if it does not exist"""
+    with _lock:
+        chats = load_chats()
+        for chat in chats:
+            if chat.get('id') == chat_id:
+                chat.setdefault('messages', []).append(message)
+                chat['updatedAt'] = datetime.now()
+                save_chats(chats)
+                return chat
+    return None
+
+def set_chat_summary(chat_id: str, summary: Dict[str, Any]) -> bool:
+    """Store the rolling summary of a chat's older messages"""
+    with _lock:
+        chats = load_chats()
+        for chat in chats:
+            if chat.get('id') == chat_id:
+                chat['summary'] = summary
+                save_chats(chats)
+                return True
+    return False
+
 def delete_chat(chat_id: str) -> bool:
     """Delete a chat session"""
-    chats = load_chats()
-    initial_count = len(chats)
-    
-    chats = [chat for chat in chats if chat.get('id') != chat_id]
-    
-    if len(chats) < initial_count:
-        save_chats(chats)
-        return True
+    with _lock:
+        chats = load_chats()
+        initial_count = len(chats)
+        
+        chats = [chat for chat in chats if chat.get('id') != chat_id]
+        
+        if len(chats) < initial_count:
+            save_chats(chats)
+            return True
     return False
 
 def get_all_chats() -> List[Dict[str, Any]]:
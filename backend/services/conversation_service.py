@@ -0,0 +1,144 @@
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Any, Optional
+
+from .chat_service import get_chat_by_id, append_message, set_chat_summary
+from .retrieval_service import estimate_tokens, CHARS_PER_TOKEN
+
+# The last RECENT_MESSAGES messages of a chat are sent verbatim; everything before
+# them is represented by a rolling summary stored on the chat as
+#   'summary': {'text', 'through_id', 'messages', 'updatedAt'}
+# where 'through_id' is the id of the last message the summary covers.
+RECENT_MESSAGES = 6
+
+# Estimated tokens of history (summary plus recent messages) sent with each question
+HISTORY_TOKEN_BUDGET = 1500
+MAX_MESSAGE_TOKENS = 500
+SUMMARY_WORDS = 200
+SUMMARY_TOKEN_LIMIT = 400
+
+# The summary is refreshed once this many messages have left the verbatim window unsummarized
+SUMMARY_BATCH_MESSAGES = 2
+
+# Chats with a summary refresh running
+_refreshing = set()
+_lock = threading.Lock()
+
+def _role(message: Dict[str, Any]) -> str:
+    return 'assistant' if message.get('sender') == 'tutor' else 'user'
+
+def _truncate(text: str, max_tokens: int) -> str:
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max_tokens * CHARS_PER_TOKEN].rstrip() + ' …'
+
+def _summary_coverage(chat: Dict[str, Any]) -> int:
+    """How many leading messages the stored summary covers (0 if there is none or the messages were rewritten)"""
+    through_id = (chat.get('summary') or {}).get('through_id')
+    for position, message in enumerate(chat.get('messages', [])):
+        if message.get('id') == through_id:
+            return position + 1
+    return 0
+
+def build_history(chat: Dict[str, Any], token_budget: int = HISTORY_TOKEN_BUDGET) -> Dict[str, Any]:
+    """
+    The history sent with the next question: the rolling summary, then verbatim (each capped
+    at MAX_MESSAGE_TOKENS) the most recent messages and any older ones the summary does not
+    cover yet, dropping the oldest of them until everything fits token_budget. Its size does
+    not grow with the chat's length.
+    """
+    messages = chat.get('messages', [])
+    covered = _summary_coverage(chat)
+    summary = _truncate(chat['summary']['text'], SUMMARY_TOKEN_LIMIT) if covered and chat['summary'].get('text') else ''
+
+    # Messages that left the window stay verbatim until a refresh folds them into the summary
+    window_start = min(covered, max(0, len(messages) - RECENT_MESSAGES))
+    tokens = estimate_tokens(summary) if summary else 0
+    recent = []
+    for message in reversed(messages[window_start:]):
+        content = _truncate(str(message.get('content', '')), MAX_MESSAGE_TOKENS)
+        if tokens + estimate_tokens(content) > token_budget:
+            break
+        tokens += estimate_tokens(content)
+        recent.append({'role': _role(message), 'content': content})
+    recent.reverse()
+
+    history = [{'role': 'system', 'content': f"Summary of the conversation so far:\n{summary}"}] if summary else []
+    return {
+        'history': history + recent,
+        'tokens': tokens,
+        'summary_covers': covered,
+        'verbatim_messages': len(recent),
+        'total_messages': len(messages)
+    }
+
+def _refresh_summary(chat_id: str):
+    """Fold the messages that left the verbatim window into the summary (runs on a worker thread)"""
+    from .ai_service import summarize_conversation
+
+    try:
+        chat = get_chat_by_id(chat_id)
+        if not chat:
+            return
+        messages = chat.get('messages', [])
+        covered = _summary_coverage(chat)
+        previous = chat['summary'].get('text', '') if covered else ''
+        target = len(messages) - RECENT_MESSAGES
+        if target - covered < SUMMARY_BATCH_MESSAGES:
+            return
+        turns = [{'role': _role(message), 'content': _truncate(str(message.get('content', '')), MAX_MESSAGE_TOKENS)}
+                 for message in messages[covered:target]]
+        started = time.perf_counter()
+        text = summarize_conversation(previous, turns, SUMMARY_WORDS)
+        if text:
+            set_chat_summary(chat_id, {
+                'text': text,
+                'through_id': messages[target - 1].get('id'),
+                'messages': target,
+                'updatedAt': datetime.now().isoformat(),
+                'elapsed_seconds': round(time.perf_counter() - started, 2)
+            })
+    except Exception as e:
+        print(f"Failed to refresh summary of chat {chat_id}: {e}")
+    finally:
+        with _lock:
+            _refreshing.discard(chat_id)
+
+def schedule_summary_refresh(chat: Dict[str, Any]) -> bool:
+    """Start a background summary refresh if enough messages are waiting; returns True if one was started"""
+    waiting = len(chat.get('messages', [])) - RECENT_MESSAGES - _summary_coverage(chat)
+    if waiting < SUMMARY_BATCH_MESSAGES:
+        return False
+    with _lock:
+        if chat['id'] in _refreshing:
+            return False
+        _refreshing.add(chat['id'])
+    threading.Thread(target=_refresh_summary, args=(chat['id'],), name=f"chat-summary-{chat['id']}", daemon=True).start()
+    return True
+
+def start_chat_turn(chat_id: str, prompt: str, message_id: Optional[str] = None,
+                    token_budget: int = HISTORY_TOKEN_BUDGET) -> Dict[str, Any]:
+    """
+    Record the user's question in the chat and build the history to answer it with.
+    Raises ValueError if the chat does not exist.
+    """
+    chat = get_chat_by_id(chat_id)
+    if not chat:
+        raise ValueError('Chat not found')
+    history = build_history(chat, token_budget)
+
+    message = {
+        'id': message_id or str(uuid.uuid4()),
+        'content': prompt,
+        'sender': 'user',
+        'timestamp': datetime.now()
+    }
+    chat = append_message(chat_id, message)
+    if chat is None:
+        raise ValueError('Chat not found')
+    history['summary_refresh_started'] = schedule_summary_refresh(chat)
+    history['message'] = message
+    history['messages'] = chat['messages']
+    return history
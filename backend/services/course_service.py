@@ -2,6 +2,8 @@ import json
 import os
 from datetime import datetime
 from typing import List, Dict, Any, Optional
+from .enrollment_service import strip_progress, merge_course, set_lesson_progress, buffer_lesson_progress, user_enrollments
+from .search_service import sync_source
 
 class CourseService:
     def __init__(self):
@@ -23,9 +25,12 @@ class CourseService:
             return []
     
     def _save_courses(self, courses: List[Dict[str, Any]]):
-        """Save courses to JSON file"""
+        """Save courses to JSON file (shared content only; progress lives in enrollments)"""
+        courses = [strip_progress(dict(course, lessons=[dict(l) for l in course.get('lessons', [])]))
+                   for course in courses]
         with open(self.data_file, 'w') as f:
             json.dump(courses, f, indent=2, default=str)
+        sync_source('courses', courses)
     
     def get_all_courses(self) -> List[Dict[str, Any]]:
         """Get all courses"""
@@ -102,13 +107,6 @@ class CourseService:
                     if key != 'id':  # Don't allow ID changes
                         course[key] = value
                 
-                # Recalculate course progress based on lesson progress
-                if course.get('lessons'):
-                    total_progress = sum(l.get('progress', 0) for l in course['lessons'])
-                    total_lessons = len(course['lessons'])
-                    course['progress'] = int(total_progress / total_lessons) if total_lessons > 0 else 0
-                    course['completed'] = course['progress'] == 100
-                
                 course['updatedAt'] = datetime.now().isoformat()
                 courses[i] = course
                 self._save_courses(courses)
@@ -129,65 +127,54 @@ class CourseService:
         return False
     
     def update_lesson_progress(self, course_id: str, lesson_id: str, progress: int, completed: Optional[bool] = None, user_id: str = "default_user") -> Optional[Dict[str, Any]]:
-        """Update lesson progress and completion status"""
+        """
+        Update a user's lesson progress and completion status.
+        Only the user's enrollment record is written; the shared course content is not touched.
+        Progress reports that don't complete the lesson are buffered and written in batches.
+        """
         course = self.get_course_by_id(course_id)
-        if not course:
+        if not course or not any(lesson['id'] == lesson_id for lesson in course['lessons']):
             return None
+        lesson = next(lesson for lesson in course['lessons'] if lesson['id'] == lesson_id)
+        
+        if completed is None and progress < 100:
+            return {
+                'buffered': True,
+                'progress': buffer_lesson_progress(user_id, course_id, lesson_id, progress),
+                'lesson_completed': False,
+                'course_completed': False,
+                'lesson_xp_earned': 0,
+                'course_xp_earned': 0
+            }
         
-        lesson_completed = False
-        course_completed = False
-        
-        for lesson in course['lessons']:
-            if lesson['id'] == lesson_id:
-                # Check if lesson was just completed
-                was_completed = lesson.get('completed', False)
-                
-                # Update progress (0-100)
-                lesson['progress'] = max(0, min(100, progress))
-                lesson['updatedAt'] = datetime.now().isoformat()
-                
-                # Update completion status if provided
-                if completed is not None:
-                    lesson['completed'] = completed
-                
-                # Check if lesson was just completed
-                if not was_completed and lesson['completed']:
-                    lesson_completed = True
-                
-                # Update course progress based on average of all lesson progress
-                total_progress = sum(l.get('progress', 0) for l in course['lessons'])
-                total_lessons = len(course['lessons'])
-                course['progress'] = int(total_progress / total_lessons) if total_lessons > 0 else 0
-                
-                # Check if course was just completed
-                was_course_completed = course.get('completed', False)
-                course['completed'] = course['progress'] == 100
-                if not was_course_completed and course['completed']:
-                    course_completed = True
-                
-                course['updatedAt'] = datetime.now().isoformat()
-                
-                self.update_course(course_id, course)
-                
-                # Award XP for lesson completion
-                if lesson_completed:
-                    from .xp_service import award_xp_for_lesson_completion
-                    xp_result = award_xp_for_lesson_completion(user_id, course_id, lesson_id, lesson.get('xpReward', 100))
-                
-                # Award XP for course completion
-                if course_completed:
-                    from .xp_service import award_xp_for_course_completion
-                    course_xp_result = award_xp_for_course_completion(user_id, course_id, 200)  # Bonus XP for course completion
-                
-                return {
-                    'course': course,
-                    'lesson_completed': lesson_completed,
-                    'course_completed': course_completed,
-                    'lesson_xp_earned': xp_result['total_xp_earned'] if lesson_completed else 0,
-                    'course_xp_earned': course_xp_result['total_xp_earned'] if course_completed else 0
-                }
-        
-        return None
+        result = set_lesson_progress(user_id, course, {lesson_id: {'progress': progress, 'completed': completed}})
+        lesson_completed = lesson_id in result['completed_lessons']
+        course_completed = result['course_completed']
+        
+        # Award XP for lesson completion
+        if lesson_completed:
+            from .xp_service import award_xp_for_lesson_completion
+            xp_result = award_xp_for_lesson_completion(user_id, course_id, lesson_id, lesson.get('xpReward', 100))
+        
+        # Award XP for course completion
+        if course_completed:
+            from .xp_service import award_xp_for_course_completion
+            course_xp_result = award_xp_for_course_completion(user_id, course_id, 200)  # Bonus XP for course completion
+        
+        return {
+            'course': merge_course(course, result['enrollment']),
+            'lesson_completed': lesson_completed,
+            'course_completed': course_completed,
+            'lesson_xp_earned': xp_result['total_xp_earned'] if lesson_completed else 0,
+            'course_xp_earned': course_xp_result['total_xp_earned'] if course_completed else 0
+        }
+    
+    def get_course_for_user(self, course_id: str, user_id: str = "default_user") -> Optional[Dict[str, Any]]:
+        """Get a course with one user's progress merged in"""
+        course = self.get_course_by_id(course_id)
+        if not course:
+            return None
+        return merge_course(course, user_enrollments(user_id).get(course_id))
     
     def generate_lesson_content(self, course_id: str, lesson_id: str) -> Optional[Dict[str, Any]]:
         """Generate lesson content using AI (on-demand)"""
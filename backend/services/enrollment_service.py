@@ -0,0 +1,297 @@
+import atexit
+import copy
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+from urllib.parse import quote, unquote
+
+from .epoch_service import INITIAL_EPOCH, current_epoch, resolve_record, compact_record
+
+# Path to data files: one small progress file per user
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+ENROLLMENTS_DIR = os.path.join(DATA_DIR, 'enrollments')
+COURSES_FILE = os.path.join(DATA_DIR, 'courses.json')
+
+# Before enrollments existed, progress was stored inside courses.json for this user
+LEGACY_PROGRESS_USER = "default_user"
+
+# Per-user fields that used to live in the shared course documents
+COURSE_PROGRESS_FIELDS = ('progress', 'completed')
+LESSON_PROGRESS_FIELDS = ('progress', 'completed')
+
+# Progress reports below 100% are buffered and written at most this often
+PROGRESS_FLUSH_SECONDS = 2.0
+
+# Serializes read-modify-write of enrollment files (direct updates, buffer flushes, resets)
+_write_lock = threading.RLock()
+
+# Write-behind buffer: user_id -> {course_id: {lesson_id: highest progress reported}}
+_buffer_lock = threading.Lock()
+_pending = {}
+_flush_timer = None
+
+def _enrollment_file(user_id: str) -> str:
+    return os.path.join(ENROLLMENTS_DIR, f"{quote(user_id, safe='')}.json")
+
+def _progress_from_courses(courses: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Build an enrollment record from progress embedded in course documents"""
+    enrollments = {}
+    for course in courses:
+        lessons = {
+            lesson['id']: {'progress': lesson.get('progress', 0), 'completed': lesson.get('completed', False)}
+            for lesson in course.get('lessons', [])
+            if lesson.get('id') and (lesson.get('progress') or lesson.get('completed'))
+        }
+        if lessons:
+            enrollments[course['id']] = {
+                'lessons': lessons,
+                'completed': course.get('completed', False),
+                'updatedAt': course.get('updatedAt', datetime.now().isoformat())
+            }
+    return enrollments
+
+def _read_file(path: str) -> Optional[Dict[str, Any]]:
+    """A stored enrollment document; files from before epochs hold just the courses"""
+    try:
+        with open(path, 'r') as f:
+            stored = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    if 'courses' not in stored:
+        stored = {'epoch': INITIAL_EPOCH, 'courses': stored}
+    return stored
+
+def _load_document(user_id: str) -> Dict[str, Any]:
+    """
+    A user's enrollment document for their current epoch: {'epoch', 'courses', '_previous'?}.
+    The legacy user's first load imports the progress embedded in courses.json.
+    """
+    path = _enrollment_file(user_id)
+    stored = _read_file(path)
+    if stored is None:
+        if user_id != LEGACY_PROGRESS_USER or os.path.exists(path) or not os.path.exists(COURSES_FILE):
+            return {'epoch': current_epoch(user_id), 'courses': {}}
+        with open(COURSES_FILE, 'r') as f:
+            stored = {'epoch': INITIAL_EPOCH, 'courses': _progress_from_courses(json.load(f))}
+        _save_document(user_id, stored)
+    return resolve_record(stored, user_id, lambda: {'courses': {}})
+
+def _save_document(user_id: str, document: Dict[str, Any]):
+    os.makedirs(ENROLLMENTS_DIR, exist_ok=True)
+    path = _enrollment_file(user_id)
+    temp_file = path + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(document, f, indent=2)
+    os.replace(temp_file, path)
+
+def load_enrollments(user_id: str) -> Dict[str, Any]:
+    """Load a user's course progress: {course_id: {'lessons': {lesson_id: {progress, completed}}, 'completed', 'updatedAt'}}"""
+    return _load_document(user_id)['courses']
+
+def save_enrollments(user_id: str, enrollments: Dict[str, Any]):
+    """Save a user's course progress"""
+    with _write_lock:
+        document = _load_document(user_id)
+        document['courses'] = enrollments
+        _save_document(user_id, document)
+
+def strip_progress(course: Dict[str, Any]) -> Dict[str, Any]:
+    """Remove per-user progress fields from a course document before it is stored as shared content"""
+    for field in COURSE_PROGRESS_FIELDS:
+        course.pop(field, None)
+    for lesson in course.get('lessons', []):
+        for field in LESSON_PROGRESS_FIELDS:
+            lesson.pop(field, None)
+    return course
+
+def extract_progress(course: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Lesson progress sent inside a course document: {lesson_id: {progress, completed}}"""
+    return {
+        lesson['id']: {
+            'progress': max(0, min(100, int(lesson.get('progress') or 0))),
+            'completed': bool(lesson.get('completed'))
+        }
+        for lesson in course.get('lessons', []) if lesson.get('id')
+    }
+
+def course_progress(course: Dict[str, Any], enrollment: Optional[Dict[str, Any]]) -> int:
+    """Course progress as the average progress of its lessons"""
+    lessons = course.get('lessons', [])
+    if not lessons:
+        return 0
+    lesson_progress = (enrollment or {}).get('lessons', {})
+    total = sum(lesson_progress.get(lesson.get('id'), {}).get('progress', 0) for lesson in lessons)
+    return int(total / len(lessons))
+
+def merge_course(course: Dict[str, Any], enrollment: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """A copy of a course with one user's progress filled in"""
+    merged = copy.deepcopy(course)
+    lesson_progress = (enrollment or {}).get('lessons', {})
+    for lesson in merged.get('lessons', []):
+        state = lesson_progress.get(lesson.get('id'), {})
+        lesson['progress'] = state.get('progress', 0)
+        lesson['completed'] = state.get('completed', False)
+    merged['progress'] = course_progress(course, enrollment)
+    merged['completed'] = merged['progress'] == 100
+    return merged
+
+def pending_progress(user_id: str) -> Dict[str, Dict[str, int]]:
+    """Buffered progress of a user that has not been written yet"""
+    with _buffer_lock:
+        return {course_id: dict(lessons) for course_id, lessons in _pending.get(user_id, {}).items()}
+
+def user_enrollments(user_id: str) -> Dict[str, Any]:
+    """A user's enrollments including buffered progress, so reads see the latest reports"""
+    enrollments = load_enrollments(user_id)
+    for course_id, lessons in pending_progress(user_id).items():
+        enrollment = enrollments.setdefault(course_id, {'lessons': {}, 'completed': False})
+        for lesson_id, progress in lessons.items():
+            state = enrollment['lessons'].setdefault(lesson_id, {'progress': 0, 'completed': False})
+            state['progress'] = max(state['progress'], progress)
+    return enrollments
+
+def merge_courses(courses: List[Dict[str, Any]], user_id: str) -> List[Dict[str, Any]]:
+    """Course views for one user (their enrollments are read once)"""
+    enrollments = user_enrollments(user_id)
+    return [merge_course(course, enrollments.get(course.get('id'))) for course in courses]
+
+def _apply_lesson_updates(enrollment: Dict[str, Any], course: Dict[str, Any], updates: Dict[str, Dict[str, Any]],
+                          keep_max: bool = False) -> List[str]:
+    """Apply lesson updates to one enrollment in place; returns the lessons that became completed"""
+    lesson_ids = {lesson.get('id') for lesson in course.get('lessons', [])}
+    newly_completed = []
+    for lesson_id, update in updates.items():
+        if lesson_id not in lesson_ids:
+            continue
+        state = enrollment['lessons'].setdefault(lesson_id, {'progress': 0, 'completed': False})
+        was_completed = state['completed']
+        if update.get('progress') is not None:
+            progress = max(0, min(100, int(update['progress'])))
+            state['progress'] = max(state['progress'], progress) if keep_max else progress
+        if update.get('completed') is not None:
+            state['completed'] = bool(update['completed'])
+        if state['completed'] and not was_completed:
+            newly_completed.append(lesson_id)
+
+    enrollment['completed'] = course_progress(course, enrollment) == 100
+    enrollment['updatedAt'] = datetime.now().isoformat()
+    return newly_completed
+
+def set_lesson_progress(user_id: str, course: Dict[str, Any], updates: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Apply lesson progress updates ({lesson_id: {'progress'?, 'completed'?}}) to a user's
+    enrollment in one write. Returns which lessons and whether the course became completed.
+    """
+    with _write_lock:
+        document = _load_document(user_id)
+        enrollment = document['courses'].setdefault(course['id'], {'lessons': {}, 'completed': False})
+        was_course_completed = enrollment.get('completed', False)
+        newly_completed = _apply_lesson_updates(enrollment, course, updates)
+        _save_document(user_id, document)
+
+    return {
+        'enrollment': enrollment,
+        'completed_lessons': newly_completed,
+        'course_completed': enrollment['completed'] and not was_course_completed
+    }
+
+def buffer_lesson_progress(user_id: str, course_id: str, lesson_id: str, progress: int) -> int:
+    """
+    Record a progress report without writing it. Reports for the same lesson are
+    coalesced to the highest value and written by the next flush. Completions must
+    go through set_lesson_progress so they are written (and rewarded) right away.
+    Returns the buffered progress.
+    """
+    global _flush_timer
+    progress = max(0, min(100, int(progress)))
+    with _buffer_lock:
+        lessons = _pending.setdefault(user_id, {}).setdefault(course_id, {})
+        lessons[lesson_id] = max(lessons.get(lesson_id, 0), progress)
+        if _flush_timer is None:
+            _flush_timer = threading.Timer(PROGRESS_FLUSH_SECONDS, flush_lesson_progress)
+            _flush_timer.daemon = True
+            _flush_timer.start()
+        return lessons[lesson_id]
+
+def _load_course_content() -> Dict[str, Dict[str, Any]]:
+    if not os.path.exists(COURSES_FILE):
+        return {}
+    with open(COURSES_FILE, 'r') as f:
+        return {course['id']: course for course in json.load(f)}
+
+def flush_lesson_progress() -> Dict[str, int]:
+    """
+    Write all buffered progress: courses.json is read once and each user's file is
+    written once, however many reports were coalesced. Progress never goes down here.
+    """
+    global _pending, _flush_timer
+    with _write_lock:
+        with _buffer_lock:
+            pending, _pending = _pending, {}
+            if _flush_timer is not None:
+                _flush_timer.cancel()
+                _flush_timer = None
+        if not pending:
+            return {'users': 0, 'lessons': 0}
+
+        courses = _load_course_content()
+        lessons_written = 0
+        for user_id, by_course in pending.items():
+            document = _load_document(user_id)
+            for course_id, lessons in by_course.items():
+                course = courses.get(course_id)
+                if not course:
+                    continue
+                enrollment = document['courses'].setdefault(course_id, {'lessons': {}, 'completed': False})
+                updates = {lesson_id: {'progress': progress} for lesson_id, progress in lessons.items()}
+                _apply_lesson_updates(enrollment, course, updates, keep_max=True)
+                lessons_written += len(lessons)
+            _save_document(user_id, document)
+
+    return {'users': len(pending), 'lessons': lessons_written}
+
+atexit.register(flush_lesson_progress)
+
+def discard_pending_progress(user_id: Optional[str] = None):
+    """
+    Drop buffered progress reports of a user (or of everyone). Used by resets, which
+    make stored enrollments stale by moving to a new epoch rather than deleting them.
+    """
+    with _buffer_lock:
+        if user_id is None:
+            _pending.clear()
+        else:
+            _pending.pop(user_id, None)
+
+def compact_enrollments(kept_epochs) -> int:
+    """
+    Rewrite or delete enrollment files holding epochs no undo can bring back
+    (kept_epochs(user_id) gives the epochs to keep). Returns how many files changed.
+    """
+    if not os.path.isdir(ENROLLMENTS_DIR):
+        return 0
+    changed = 0
+    for name in os.listdir(ENROLLMENTS_DIR):
+        if not name.endswith('.json'):
+            continue
+        user_id = unquote(name[:-len('.json')])
+        with _write_lock:
+            stored = _read_file(os.path.join(ENROLLMENTS_DIR, name))
+            if stored is None:
+                continue
+            document = compact_record(stored, kept_epochs(user_id))
+            if document is None:
+                if user_id == LEGACY_PROGRESS_USER:
+                    # An empty file keeps the legacy import from running again
+                    if not stored['courses'] and not stored.get('_previous'):
+                        continue
+                    _save_document(user_id, {'epoch': INITIAL_EPOCH, 'courses': {}})
+                else:
+                    os.remove(os.path.join(ENROLLMENTS_DIR, name))
+                changed += 1
+            elif document is not stored:
+                _save_document(user_id, document)
+                changed += 1
+    return changed
@@ -0,0 +1,297 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Callable
+
+# Path to data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+EPOCHS_FILE = os.path.join(DATA_DIR, 'progress_epochs.json')
+SETTINGS_FILE = os.path.join(DATA_DIR, 'settings.json')
+PROGRESS_FILE = os.path.join(DATA_DIR, 'progress.json')
+
+# How long a reset can be undone; data/settings.json may override it
+# with "reset_undo_window_seconds"
+DEFAULT_UNDO_WINDOW_SECONDS = 24 * 3600
+
+# How often the background compactor drops records from old epochs
+COMPACT_INTERVAL_SECONDS = 3600
+
+# Epoch of records written before epochs existed
+INITIAL_EPOCH = '0.0'
+
+# A reset does not touch stored progress: it moves the user (or everyone) to a new
+# epoch, and records tagged with an older epoch read as empty from then on.
+# A record's epoch is "<global epoch>.<user epoch>"; both numbers come from one
+# increasing sequence, so an epoch that was undone is never handed out again.
+# When a stale record is replaced, it is kept under '_previous' for undo until
+# the compactor drops it.
+_lock = threading.Lock()
+_epochs = None
+_compactor = None
+
+# Taken for every write of progress.json (write_progress) and by compaction from its read
+# to its write, so compaction never overwrites a save. Acquire it before _lock.
+progress_lock = threading.Lock()
+
+def _load_epochs() -> Dict[str, Any]:
+    global _epochs
+    if _epochs is None:
+        epochs = {'sequence': 0, 'global': 0, 'users': {}, 'resets': []}
+        if os.path.exists(EPOCHS_FILE):
+            try:
+                with open(EPOCHS_FILE, 'r') as f:
+                    epochs.update(json.load(f))
+            except json.JSONDecodeError:
+                pass
+        _epochs = epochs
+        if epochs['resets']:
+            # Resets from an earlier run may still have records to compact
+            _ensure_compactor()
+    return _epochs
+
+def _save_epochs(epochs: Dict[str, Any]):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    temp_file = EPOCHS_FILE + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(epochs, f, indent=2)
+    os.replace(temp_file, EPOCHS_FILE)
+
+def undo_window_seconds() -> int:
+    """How long a reset can be undone (settings.json "reset_undo_window_seconds")"""
+    try:
+        with open(SETTINGS_FILE, 'r') as f:
+            return int(json.load(f).get('reset_undo_window_seconds', DEFAULT_UNDO_WINDOW_SECONDS))
+    except (FileNotFoundError, json.JSONDecodeError, ValueError, TypeError):
+        return DEFAULT_UNDO_WINDOW_SECONDS
+
+def _epoch_tag(epochs: Dict[str, Any], user_id: str) -> str:
+    return f"{epochs['global']}.{epochs['users'].get(user_id, 0)}"
+
+def current_epoch(user_id: str) -> str:
+    """The epoch a user's records must carry to count as current"""
+    with _lock:
+        return _epoch_tag(_load_epochs(), user_id)
+
+def resolve_record(record: Dict[str, Any], user_id: str, new_record: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    The record to use for a user: the stored one if it is current, the one kept
+    under '_previous' if a reset was undone, otherwise a fresh record that keeps
+    the stale one for undo.
+    """
+    epoch = current_epoch(user_id)
+    stored_epoch = record.get('epoch', INITIAL_EPOCH)
+    if stored_epoch == epoch:
+        return record
+
+    previous = record.get('_previous')
+    if previous and previous.get('epoch', INITIAL_EPOCH) == epoch:
+        return previous
+
+    fresh = new_record()
+    fresh['epoch'] = epoch
+    stale = {key: value for key, value in record.items() if key != '_previous'}
+    stale['epoch'] = stored_epoch
+    fresh['_previous'] = stale
+    return fresh
+
+def resolve_progress(progress: Dict[str, Any]) -> Dict[str, Any]:
+    """Resolve every user's record in a freshly loaded progress.json"""
+    from .achievement_service import new_user_progress
+
+    for user_id, record in progress.items():
+        if isinstance(record, dict):
+            progress[user_id] = resolve_record(record, user_id, new_user_progress)
+    return progress
+
+def stamp_new_records(progress: Dict[str, Any]) -> Dict[str, Any]:
+    """Tag records created since progress.json was loaded with their user's current epoch"""
+    for user_id, record in progress.items():
+        if isinstance(record, dict) and 'epoch' not in record:
+            record['epoch'] = current_epoch(user_id)
+    return progress
+
+def stamp_record(record: Dict[str, Any], user_id: str) -> Dict[str, Any]:
+    """Mark a record (e.g. an imported one) as belonging to the user's current epoch"""
+    record = strip_epoch(record)
+    record['epoch'] = current_epoch(user_id)
+    return record
+
+def _write_progress_file(progress: Dict[str, Any]):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    temp_file = PROGRESS_FILE + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(progress, f, indent=2)
+    os.replace(temp_file, PROGRESS_FILE)
+
+def write_progress(progress: Dict[str, Any]):
+    """Stamp new records and write progress.json; every writer goes through here"""
+    with progress_lock:
+        _write_progress_file(stamp_new_records(progress))
+
+def strip_epoch(record: Dict[str, Any]) -> Dict[str, Any]:
+    """A copy of a record without epoch bookkeeping, for exports"""
+    return {key: value for key, value in record.items() if key not in ('epoch', '_previous')}
+
+def _ensure_compactor():
+    """Start the background compactor if it is not running"""
+    global _compactor
+    if _compactor is None or not _compactor.is_alive():
+        _compactor = threading.Thread(target=_compact_loop, name='epoch-compactor', daemon=True)
+        _compactor.start()
+
+def bump_user_epoch(user_id: str) -> Dict[str, Any]:
+    """Move a user to a new epoch; their existing records read as empty from now on"""
+    with _lock:
+        epochs = _load_epochs()
+        epochs['sequence'] += 1
+        reset = {
+            'user_id': user_id,
+            'previous': epochs['users'].get(user_id, 0),
+            'epoch': epochs['sequence'],
+            'at': datetime.now().isoformat()
+        }
+        epochs['users'][user_id] = epochs['sequence']
+        epochs['resets'].append(reset)
+        _save_epochs(epochs)
+    _ensure_compactor()
+    return reset
+
+def bump_global_epoch() -> Dict[str, Any]:
+    """Move everyone to a new epoch"""
+    with _lock:
+        epochs = _load_epochs()
+        epochs['sequence'] += 1
+        reset = {
+            'user_id': None,
+            'previous': epochs['global'],
+            'epoch': epochs['sequence'],
+            'at': datetime.now().isoformat()
+        }
+        epochs['global'] = epochs['sequence']
+        epochs['resets'].append(reset)
+        _save_epochs(epochs)
+    _ensure_compactor()
+    return reset
+
+def undo_deadline(reset: Dict[str, Any]) -> datetime:
+    return datetime.fromisoformat(reset['at']) + timedelta(seconds=undo_window_seconds())
+
+def _undoable_reset(epochs: Dict[str, Any], user_id: Optional[str]) -> Optional[Dict[str, Any]]:
+    """The latest reset of a scope if it is still in effect and inside the undo window"""
+    for reset in reversed(epochs['resets']):
+        if reset['user_id'] != user_id:
+            continue
+        in_effect = (epochs['global'] if user_id is None else epochs['users'].get(user_id, 0)) == reset['epoch']
+        if in_effect and datetime.now() <= undo_deadline(reset):
+            return reset
+        return None
+    return None
+
+def restore_epoch(user_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Put a user (or everyone, with user_id None) back in the epoch before their last reset.
+    Raises ValueError if there is no reset to undo or the undo window has passed.
+    """
+    with _lock:
+        epochs = _load_epochs()
+        reset = _undoable_reset(epochs, user_id)
+        if not reset:
+            raise ValueError("No reset to undo" + (f" for user {user_id}" if user_id else "")
+                             + " (it may be older than the undo window)")
+        if user_id is None:
+            epochs['global'] = reset['previous']
+        else:
+            epochs['users'][user_id] = reset['previous']
+        epochs['resets'].remove(reset)
+        _save_epochs(epochs)
+        return reset
+
+def _kept_epochs(epochs: Dict[str, Any], user_id: str) -> set:
+    """Epochs of a user whose records must still be kept: the current one and one an undo would restore"""
+    kept = {_epoch_tag(epochs, user_id)}
+    user_reset = _undoable_reset(epochs, user_id)
+    if user_reset:
+        kept.add(f"{epochs['global']}.{user_reset['previous']}")
+    global_reset = _undoable_reset(epochs, None)
+    if global_reset:
+        kept.add(f"{global_reset['previous']}.{epochs['users'].get(user_id, 0)}")
+    return kept
+
+def compact_record(record: Dict[str, Any], kept: set) -> Optional[Dict[str, Any]]:
+    """
+    Drop what no undo can bring back from one stored record.
+    Returns the record to store, or None if it can be deleted.
+    """
+    previous = record.get('_previous')
+    if record.get('epoch', INITIAL_EPOCH) not in kept:
+        # After an undo the kept record is the one saved under '_previous'
+        if previous and previous.get('epoch', INITIAL_EPOCH) in kept:
+            return previous
+        return None
+    if previous and previous.get('epoch', INITIAL_EPOCH) not in kept:
+        return {key: value for key, value in record.items() if key != '_previous'}
+    return record
+
+def compact_progress() -> Dict[str, Any]:
+    """Physically drop progress records from epochs that can no longer be restored"""
+    from .enrollment_service import compact_enrollments
+
+    with _lock:
+        epochs = _load_epochs()
+        cutoff = datetime.now() - timedelta(seconds=undo_window_seconds())
+        expired = [reset for reset in epochs['resets'] if datetime.fromisoformat(reset['at']) < cutoff]
+
+    def kept_by_user(user_id: str) -> set:
+        with _lock:
+            return _kept_epochs(epochs, user_id)
+
+    # Held from the read to the write, so no save lands in between
+    removed = 0
+    compacted = 0
+    with progress_lock:
+        if os.path.exists(PROGRESS_FILE):
+            with open(PROGRESS_FILE, 'r') as f:
+                progress = json.load(f)
+            for user_id in list(progress):
+                record = compact_record(progress[user_id], kept_by_user(user_id))
+                if record is None:
+                    del progress[user_id]
+                    removed += 1
+                elif record is not progress[user_id]:
+                    progress[user_id] = record
+                    compacted += 1
+            if removed or compacted:
+                _write_progress_file(progress)
+
+    enrollments = compact_enrollments(kept_by_user)
+
+    with _lock:
+        if expired:
+            epochs['resets'] = [reset for reset in epochs['resets'] if reset not in expired]
+            _save_epochs(epochs)
+
+    return {
+        'success': True,
+        'progress_removed': removed,
+        'progress_compacted': compacted,
+        'enrollments_compacted': enrollments,
+        'resets_expired': len(expired)
+    }
+
+def _compact_loop():
+    """Compact until no reset is waiting for its undo window to pass"""
+    while True:
+        time.sleep(COMPACT_INTERVAL_SECONDS)
+        try:
+            compact_progress()
+        except Exception as e:
+            print(f"Error compacting progress: {e}")
+        with _lock:
+            if not _load_epochs()['resets']:
+                return
+
+if __name__ == '__main__':
+    # python -m services.epoch_service
+    print(json.dumps(compact_progress(), indent=2))
@@ -2,22 +2,23 @@ import json
 from typing import Dict, Any, List
 from datetime import datetime
 import os
+from .ledger_service import set_balance
+from .epoch_service import resolve_progress, strip_epoch, stamp_record, write_progress
+from .review_service import invalidate_due_index
+from .search_service import sync_source
 
 def load_progress() -> Dict[str, Any]:
     """Load user progress from JSON file."""
     try:
         with open('data/progress.json', 'r') as f:
-            return json.load(f)
+            return resolve_progress(json.load(f))
     except FileNotFoundError:
         return {}
 
 def load_flashcards() -> List[Dict[str, Any]]:
-    """Load flashcards from JSON file."""
-    try:
-        with open('data/flashcards.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return []
+    """Load flashcards from the flashcard repository."""
+    from .flashcard_service import load_flashcards as load_deck
+    return load_deck()
 
 def load_challenges() -> List[Dict[str, Any]]:
     """Load challenges from JSON file."""
@@ -57,7 +58,7 @@ def export_all_data(user_id: str = "default_user") -> Dict[str, Any]:
     """
     # Get all data
     progress_data = load_progress()
-    user_progress = progress_data.get(user_id, {})
+    user_progress = strip_epoch(progress_data.get(user_id, {}))
     
     flashcards = load_flashcards()
     challenges = load_challenges()
@@ -100,7 +101,7 @@ def export_user_progress_only(user_id: str = "default_user") -> Dict[str, Any]:
     Export only user progress data (for privacy-focused exports).
     """
     progress_data = load_progress()
-    user_progress = progress_data.get(user_id, {})
+    user_progress = strip_epoch(progress_data.get(user_id, {}))
     
     export_data = {
         'export_info': {
@@ -136,36 +137,48 @@ def import_data_from_export(export_data: Dict[str, Any], user_id: str = "default
         # Import progress data
         if 'user_progress' in export_data:
             progress_data = load_progress()
-            progress_data[user_id] = export_data['user_progress']
+            progress_data[user_id] = stamp_record(export_data['user_progress'], user_id)
+            
+            write_progress(progress_data)
             
-            with open('data/progress.json', 'w') as f:
-                json.dump(progress_data, f, indent=2)
+            # Keep the XP ledger balance in line with the imported total
+            set_balance(user_id, export_data['user_progress'].get('total_xp', 0))
+            invalidate_due_index(user_id)
         
         # Import content data if present
         if 'content_data' in export_data:
             content_data = export_data['content_data']
             
             if 'flashcards' in content_data:
-                with open('data/flashcards.json', 'w') as f:
-                    json.dump(content_data['flashcards'], f, indent=2)
+                from .flashcard_service import save_flashcards
+                save_flashcards(content_data['flashcards'])
             
             if 'challenges' in content_data:
                 with open('data/challenges.json', 'w') as f:
                     json.dump(content_data['challenges'], f, indent=2)
+                sync_source('challenges', content_data['challenges'])
             
             if 'courses' in content_data:
                 with open('data/courses.json', 'w') as f:
                     json.dump(content_data['courses'], f, indent=2)
+                sync_source('courses', content_data['courses'])
         
         # Import chat history if present
         if 'chat_history' in export_data:
             with open('data/chats.json', 'w') as f:
                 json.dump(export_data['chat_history'], f, indent=2)
+            sync_source('chats', export_data['chat_history'])
         
         # Import settings if present
         if 'settings' in export_data:
+            # Whether this machine runs code is not something an import may change
+            settings = dict(export_data['settings'])
+            settings.pop('code_execution_enabled', None)
+            current = load_settings()
+            if 'code_execution_enabled' in current:
+                settings['code_execution_enabled'] = current['code_execution_enabled']
             with open('data/settings.json', 'w') as f:
-                json.dump(export_data['settings'], f, indent=2)
+                json.dump(settings, f, indent=2)
         
         return {
             'success': True,
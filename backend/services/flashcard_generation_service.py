@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Any, Optional
+
+from services.ai_service import extract_flashcards
+from services.flashcard_service import load_flashcards, add_flashcards
+
+# Path to data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+LESSON_FLASHCARDS_CACHE_FILE = os.path.join(DATA_DIR, 'lesson_flashcards_cache.json')
+
+# Bump to ignore cached extractions made with an older prompt
+EXTRACTION_VERSION = 1
+
+MAX_CARDS_PER_LESSON = 10
+
+# Course difficulty -> flashcard difficulty
+DIFFICULTY_MAP = {'beginner': 'easy', 'intermediate': 'medium', 'advanced': 'hard'}
+
+_cache_lock = threading.Lock()
+
+def normalize_term(term: str) -> str:
+    """Key used to detect duplicate cards: lowercase, punctuation and extra spaces removed"""
+    return re.sub(r'\s+', ' ', re.sub(r'[^\w\s]', ' ', term.lower())).strip()
+
+def _fingerprint(lesson: Dict[str, Any]) -> str:
+    """Hash the parts of a lesson the flashcards are extracted from."""
+    source = json.dumps({
+        'version': EXTRACTION_VERSION,
+        'title': lesson.get('title', ''),
+        'content': lesson.get('content', '')
+    }, sort_keys=True)
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+def load_extraction_cache() -> Dict[str, Any]:
+    if not os.path.exists(LESSON_FLASHCARDS_CACHE_FILE):
+        return {}
+    try:
+        with open(LESSON_FLASHCARDS_CACHE_FILE, 'r') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return {}
+
+def save_extraction_cache(cache: Dict[str, Any]):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(LESSON_FLASHCARDS_CACHE_FILE, 'w') as f:
+        json.dump(cache, f, indent=2)
+
+def parse_flashcard_pairs(response: str) -> List[Dict[str, str]]:
+    """Term/definition pairs from the model's JSON answer; malformed entries are dropped"""
+    try:
+        data = json.loads(response)
+    except (json.JSONDecodeError, TypeError):
+        match = re.search(r'\{.*\}', response or '', re.DOTALL)
+        if not match:
+            raise ValueError('Model did not return JSON')
+        data = json.loads(match.group(0))
+
+    items = data.get('flashcards', []) if isinstance(data, dict) else data
+    pairs = []
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        term = str(item.get('term', '')).strip()
+        definition = str(item.get('definition', '')).strip()
+        if term and definition:
+            pairs.append({'term': term, 'definition': definition})
+    return pairs[:MAX_CARDS_PER_LESSON]
+
+def _extract_lesson(course: Dict[str, Any], lesson: Dict[str, Any]) -> List[Dict[str, str]]:
+    """One model call for one lesson (runs on a worker thread)"""
+    subject = course.get('language') or course.get('title', 'general')
+    response = extract_flashcards(lesson.get('title', ''), lesson.get('content', ''), subject, MAX_CARDS_PER_LESSON)
+    return parse_flashcard_pairs(response)
+
+def generate_flashcards_from_course(course_id: str, lesson_id: Optional[str] = None,
+                                    max_concurrency: int = 3) -> Dict[str, Any]:
+    """
+    Extract flashcards from one lesson or every lesson of a course with content.
+    Lessons run in parallel (at most max_concurrency model calls at a time); extractions
+    are cached per lesson content, so unchanged lessons cost nothing on a re-run.
+    New cards are deduplicated by normalized term against the deck and each other,
+    then inserted in one write. Raises ValueError for an unknown course or lesson.
+    """
+    from services.course_service import CourseService
+
+    started = time.perf_counter()
+    course = CourseService().get_course_by_id(course_id)
+    if not course:
+        raise ValueError('Course not found')
+    lessons = course.get('lessons', [])
+    if lesson_id is not None:
+        lessons = [lesson for lesson in lessons if lesson.get('id') == lesson_id]
+        if not lessons:
+            raise ValueError('Lesson not found')
+    lessons = [lesson for lesson in lessons if lesson.get('content', '').strip()]
+
+    # Serve what we can from the cache; only the rest goes to the model
+    with _cache_lock:
+        cache = load_extraction_cache()
+    results = {}
+    pending = []
+    for lesson in lessons:
+        cached = cache.get(f"{course_id}/{lesson['id']}")
+        if cached and cached.get('fingerprint') == _fingerprint(lesson):
+            results[lesson['id']] = {'pairs': cached['pairs'], 'cached': True, 'error': None}
+        else:
+            pending.append(lesson)
+
+    if pending:
+        with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+            futures = [(lesson, executor.submit(_extract_lesson, course, lesson)) for lesson in pending]
+            for lesson, future in futures:
+                try:
+                    results[lesson['id']] = {'pairs': future.result(), 'cached': False, 'error': None}
+                except Exception as e:
+                    results[lesson['id']] = {'pairs': [], 'cached': False, 'error': str(e)}
+
+        with _cache_lock:
+            cache = load_extraction_cache()
+            for lesson in pending:
+                result = results[lesson['id']]
+                if result['error'] is None:
+                    cache[f"{course_id}/{lesson['id']}"] = {'fingerprint': _fingerprint(lesson), 'pairs': result['pairs']}
+            save_extraction_cache(cache)
+
+    # Deduplicate against the deck and within the batch, then insert once
+    seen_terms = {normalize_term(card.get('term', '')) for card in load_flashcards()}
+    language = course.get('language') or course.get('title', '')
+    difficulty = DIFFICULTY_MAP.get(str(course.get('difficulty', '')).lower(), 'medium')
+
+    new_cards = []
+    lesson_reports = []
+    for lesson in lessons:
+        result = results[lesson['id']]
+        created = 0
+        for pair in result['pairs']:
+            key = normalize_term(pair['term'])
+            if not key or key in seen_terms:
+                continue
+            seen_terms.add(key)
+            new_cards.append({
+                'term': pair['term'],
+                'definition': pair['definition'],
+                'language': language,
+                'topic': lesson.get('title', ''),
+                'difficulty': difficulty,
+                'source': {'course_id': course_id, 'lesson_id': lesson['id']}
+            })
+            created += 1
+        lesson_reports.append({
+            'lesson_id': lesson['id'],
+            'title': lesson.get('title', ''),
+            'cached': result['cached'],
+            'extracted': len(result['pairs']),
+            'created': created,
+            'error': result['error']
+        })
+
+    add_flashcards(new_cards)
+
+    return {
+        'success': True,
+        'course_id': course_id,
+        'created': len(new_cards),
+        'duplicates_skipped': sum(report['extracted'] for report in lesson_reports) - len(new_cards),
+        'model_calls': len(pending),
+        'lessons': lesson_reports,
+        'flashcards': new_cards,
+        'elapsed_seconds': round(time.perf_counter() - started, 2)
+    }
@@ -1,54 +1,246 @@
 import json
 import os
-from typing import List, Dict, Any
+import threading
+from bisect import bisect_left, bisect_right, insort
+from typing import List, Dict, Any, Optional
 
-DATA_PATH = os.path.join(os.path.dirname(__file__), '../data/flashcards.json')
+from .search_service import sync_source, index_flashcards, remove_flashcard
+from .review_service import flashcards_added, flashcard_removed, deck_replaced
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+DATA_PATH = os.path.join(DATA_DIR, 'flashcards.json')
+LOG_PATH = os.path.join(DATA_DIR, 'flashcards_log.jsonl')
+SEQUENCE_PATH = os.path.join(DATA_DIR, 'flashcards_sequence.json')
+
+# Fields with a secondary index (matched case-insensitively)
+INDEXED_FIELDS = ('language', 'topic', 'difficulty')
+
+# The deck is the snapshot in flashcards.json plus the changes appended to the log
+# since; the snapshot is rewritten once the log holds this many changes
+COMPACT_AFTER_CHANGES = 500
+
+DEFAULT_PAGE_SIZE = 50
+
+# In-memory repository, loaded on first use
+_lock = threading.RLock()
+_state = None
+
+def _index_key(value: Any) -> str:
+    return str(value or '').strip().lower()
+
+def _new_state() -> Dict[str, Any]:
+    return {
+        'cards': {},                                    # id -> card
+        'ids': [],                                      # all ids, sorted
+        'indexes': {field: {} for field in INDEXED_FIELDS},  # field -> value -> sorted ids
+        'next_id': 1,
+        'log_changes': 0
+    }
+
+def _index_card(state: Dict[str, Any], card: Dict[str, Any]):
+    insort(state['ids'], card['id'])
+    for field in INDEXED_FIELDS:
+        insort(state['indexes'][field].setdefault(_index_key(card.get(field)), []), card['id'])
+
+def _remove_id(ids: List[int], card_id: int):
+    position = bisect_left(ids, card_id)
+    if position < len(ids) and ids[position] == card_id:
+        del ids[position]
+
+def _unindex_card(state: Dict[str, Any], card: Dict[str, Any]):
+    _remove_id(state['ids'], card['id'])
+    for field in INDEXED_FIELDS:
+        _remove_id(state['indexes'][field].get(_index_key(card.get(field)), []), card['id'])
+
+def _put(state: Dict[str, Any], card: Dict[str, Any]):
+    old = state['cards'].get(card['id'])
+    if old is not None:
+        _unindex_card(state, old)
+    state['cards'][card['id']] = card
+    _index_card(state, card)
+    state['next_id'] = max(state['next_id'], card['id'] + 1)
+
+def _delete(state: Dict[str, Any], card_id: int):
+    card = state['cards'].pop(card_id, None)
+    if card is not None:
+        _unindex_card(state, card)
+    state['next_id'] = max(state['next_id'], card_id + 1)
+
+def _load_state() -> Dict[str, Any]:
+    """Build the repository from the snapshot, the change log and the id sequence"""
+    global _state
+    if _state is not None:
+        return _state
+
+    state = _new_state()
+    if os.path.exists(DATA_PATH):
+        with open(DATA_PATH, 'r') as f:
+            for card in json.load(f):
+                _put(state, card)
+    if os.path.exists(LOG_PATH):
+        with open(LOG_PATH, 'r') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    change = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from an interrupted write
+                    continue
+                if change['op'] == 'put':
+                    _put(state, change['card'])
+                else:
+                    _delete(state, change['id'])
+                state['log_changes'] += 1
+    if os.path.exists(SEQUENCE_PATH):
+        with open(SEQUENCE_PATH, 'r') as f:
+            state['next_id'] = max(state['next_id'], json.load(f).get('next_id', 1))
+
+    _state = state
+    return _state
+
+def _write_snapshot(state: Dict[str, Any]):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    cards = [state['cards'][card_id] for card_id in state['ids']]
+    temp_file = DATA_PATH + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump(cards, f, indent=2)
+    os.replace(temp_file, DATA_PATH)
+    # Deleted ids are only remembered by the log, so keep the sequence past them
+    with open(SEQUENCE_PATH, 'w') as f:
+        json.dump({'next_id': state['next_id']}, f)
+    if os.path.exists(LOG_PATH):
+        os.remove(LOG_PATH)
+    state['log_changes'] = 0
+
+def _log_changes(state: Dict[str, Any], changes: List[Dict[str, Any]]):
+    """Append changes in one write; compact the log into the snapshot once it grows large"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(LOG_PATH, 'a') as f:
+        f.write(''.join(json.dumps(change) + '\n' for change in changes))
+    state['log_changes'] += len(changes)
+    if state['log_changes'] >= COMPACT_AFTER_CHANGES:
+        _write_snapshot(state)
 
 def load_flashcards() -> List[Dict[str, Any]]:
-    with open(DATA_PATH, 'r') as f:
-        return json.load(f)
+    """All cards in id order"""
+    with _lock:
+        state = _load_state()
+        return [state['cards'][card_id] for card_id in state['ids']]
 
 def save_flashcards(flashcards: List[Dict[str, Any]]):
-    with open(DATA_PATH, 'w') as f:
-        json.dump(flashcards, f, indent=2)
+    """Replace the whole deck (used by imports)"""
+    global _state
+    with _lock:
+        previous = _load_state()
+        state = _new_state()
+        state['next_id'] = previous['next_id']
+        for card in flashcards:
+            _put(state, card)
+        _write_snapshot(state)
+        _state = state
+        deck_replaced()
+    sync_source('flashcards', flashcards)
 
 def get_all_flashcards() -> List[Dict[str, Any]]:
     return load_flashcards()
 
+def flashcard_ids() -> List[int]:
+    """Ids of all cards, sorted"""
+    with _lock:
+        return list(_load_state()['ids'])
+
+def get_flashcard(flashcard_id: int) -> Optional[Dict[str, Any]]:
+    with _lock:
+        return _load_state()['cards'].get(flashcard_id)
+
+def query_flashcards(language: Optional[str] = None, topic: Optional[str] = None, difficulty: Optional[str] = None,
+                     cursor: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE) -> Dict[str, Any]:
+    """
+    A page of cards matching all given filters, in id order, starting after the
+    'cursor' id. Served from the secondary indexes: the smallest matching index is
+    scanned from the cursor and the other filters are checked on each card.
+    """
+    filters = {field: _index_key(value) for field, value in
+               (('language', language), ('topic', topic), ('difficulty', difficulty)) if value}
+    with _lock:
+        state = _load_state()
+        candidates = [state['indexes'][field].get(value, []) for field, value in filters.items()]
+        ids = min(candidates, key=len) if candidates else state['ids']
+
+        cards = []
+        position = bisect_right(ids, cursor) if cursor is not None else 0
+        while position < len(ids) and len(cards) <= limit:
+            card = state['cards'][ids[position]]
+            if all(_index_key(card.get(field)) == value for field, value in filters.items()):
+                cards.append(card)
+            position += 1
+
+    has_more = len(cards) > limit
+    cards = cards[:limit]
+    return {
+        'cards': cards,
+        'limit': limit,
+        'next_cursor': cards[-1]['id'] if has_more else None
+    }
+
 def add_flashcard(flashcard: Dict[str, Any]) -> Dict[str, Any]:
-    flashcards = load_flashcards()
-    flashcard['id'] = max([f.get('id', 0) for f in flashcards] or [0]) + 1
-    flashcards.append(flashcard)
-    save_flashcards(flashcards)
+    with _lock:
+        state = _load_state()
+        flashcard['id'] = state['next_id']
+        _put(state, flashcard)
+        _log_changes(state, [{'op': 'put', 'card': flashcard}])
+        flashcards_added([flashcard['id']])
+    index_flashcards([flashcard])
     return flashcard
 
+def add_flashcards(flashcards: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Insert many cards with a single append to the change log"""
+    if not flashcards:
+        return []
+    with _lock:
+        state = _load_state()
+        for flashcard in flashcards:
+            flashcard['id'] = state['next_id']
+            _put(state, flashcard)
+        _log_changes(state, [{'op': 'put', 'card': flashcard} for flashcard in flashcards])
+        flashcards_added([flashcard['id'] for flashcard in flashcards])
+    index_flashcards(flashcards)
+    return flashcards
+
 def update_flashcard(flashcard_id: int, updated: Dict[str, Any]) -> Dict[str, Any]:
-    flashcards = load_flashcards()
-    for i, f in enumerate(flashcards):
-        if f.get('id') == flashcard_id:
-            flashcards[i].update(updated)
-            save_flashcards(flashcards)
-            return flashcards[i]
-    raise ValueError('Flashcard not found')
+    with _lock:
+        state = _load_state()
+        card = state['cards'].get(flashcard_id)
+        if card is None:
+            raise ValueError('Flashcard not found')
+        card = {**card, **updated, 'id': flashcard_id}
+        _put(state, card)
+        _log_changes(state, [{'op': 'put', 'card': card}])
+    index_flashcards([card])
+    return card
 
 def delete_flashcard(flashcard_id: int):
-    flashcards = load_flashcards()
-    new_flashcards = [f for f in flashcards if f.get('id') != flashcard_id]
-    if len(new_flashcards) == len(flashcards):
-        raise ValueError('Flashcard not found')
-    save_flashcards(new_flashcards)
+    with _lock:
+        state = _load_state()
+        if flashcard_id not in state['cards']:
+            raise ValueError('Flashcard not found')
+        _delete(state, flashcard_id)
+        _log_changes(state, [{'op': 'delete', 'id': flashcard_id}])
+        flashcard_removed(flashcard_id)
+    remove_flashcard(flashcard_id)
 
 def mark_flashcard_learned(user_id: str, flashcard_id: int) -> Dict[str, Any]:
     """Mark a flashcard as learned and award XP."""
     from .xp_service import award_xp_for_flashcard
-    
+
     # Award XP for learning flashcard
     result = award_xp_for_flashcard(user_id, flashcard_id, 10)
-    
+
     return {
         'success': True,
         'new_achievements': result['new_achievements'],
         'achievement_xp_earned': result['achievement_xp_earned'],
         'total_xp_earned': result['total_xp_earned'],
         'updated_progress': result['progress']
-    } 
\ No newline at end of file
+    }
@@ -0,0 +1,382 @@
+import json
+import os
+import heapq
+import math
+import random
+import time
+from itertools import islice
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from .activity_service import current_streak, streak_lapses_at
+from .ledger_service import ledger_lock, iter_entries, get_balance, has_balance, RESET, RESTORE
+
+# Path to data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+LEADERBOARD_SNAPSHOT_FILE = os.path.join(DATA_DIR, 'leaderboard_snapshot.json')
+
+# Boards users are ranked on
+BOARDS = ('total_xp', 'weekly_xp', 'streak')
+
+# Write a snapshot on the first update after this many seconds
+SNAPSHOT_INTERVAL_SECONDS = 300
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, levels: int):
+        self.key = key
+        self.next = [None] * levels     # following node on each level (None past the end)
+        self.width = [1] * levels       # positions skipped by each link
+
+class _SkipList:
+    """Sorted keys in an indexable skip list: insert, remove and position lookups in O(log n)."""
+
+    MAX_LEVELS = 32
+
+    def __init__(self):
+        self._head = _Node(None, self.MAX_LEVELS)
+        self._size = 0
+        self._levels = 1    # levels in use; links above them are not maintained
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _path(self, key, inclusive: bool) -> tuple:
+        """Last node before key on each level, and the 1-based position of each of them"""
+        chain = [None] * self._levels
+        positions = [0] * self._levels
+        node = self._head
+        position = 0
+        for level in reversed(range(self._levels)):
+            following = node.next[level]
+            while following is not None and (following.key <= key if inclusive else following.key < key):
+                position += node.width[level]
+                node = following
+                following = node.next[level]
+            chain[level] = node
+            positions[level] = position
+        return chain, positions
+
+    def bisect_left(self, key) -> int:
+        """Number of keys below key"""
+        node = self._head
+        position = 0
+        for level in reversed(range(self._levels)):
+            while node.next[level] is not None and node.next[level].key < key:
+                position += node.width[level]
+                node = node.next[level]
+        return position
+
+    def insert(self, key):
+        levels = min(self.MAX_LEVELS, 1 - int(math.log(1.0 - random.random(), 2)))
+        for level in range(self._levels, levels):
+            self._head.next[level] = None
+            self._head.width[level] = self._size + 1
+        self._levels = max(self._levels, levels)
+        chain, positions = self._path(key, inclusive=True)
+        node = _Node(key, levels)
+        position = positions[0] + 1
+        for level in range(levels):
+            previous = chain[level]
+            node.next[level] = previous.next[level]
+            previous.next[level] = node
+            node.width[level] = previous.width[level] - (position - positions[level]) + 1
+            previous.width[level] = position - positions[level]
+        for level in range(levels, self._levels):
+            chain[level].width[level] += 1
+        self._size += 1
+
+    def remove(self, key):
+        chain, _ = self._path(key, inclusive=False)
+        node = chain[0].next[0]
+        if node is None or node.key != key:
+            raise KeyError(key)
+        for level in range(len(node.next)):
+            previous = chain[level]
+            previous.width[level] += node.width[level] - 1
+            previous.next[level] = node.next[level]
+        for level in range(len(node.next), self._levels):
+            chain[level].width[level] -= 1
+        self._size -= 1
+
+    def iter_from(self, start: int):
+        """Keys from 0-based position start on, in order"""
+        if start >= self._size:
+            return
+        node = self._head
+        remaining = start + 1
+        for level in reversed(range(self._levels)):
+            while node.next[level] is not None and node.width[level] <= remaining:
+                remaining -= node.width[level]
+                node = node.next[level]
+        while node is not None:
+            yield node.key
+            node = node.next[0]
+
+class RankIndex:
+    """Users ordered by one score, highest first, with O(log n) updates and rank lookups."""
+
+    def __init__(self):
+        self._keys = _SkipList()    # (-score, user_id)
+        self._scores = {}           # user_id -> score
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def users(self) -> List[str]:
+        return list(self._scores)
+
+    def score(self, user_id: str) -> Optional[int]:
+        return self._scores.get(user_id)
+
+    def update(self, user_id: str, score: int):
+        old = self._scores.get(user_id)
+        if old == score:
+            return
+        if old is not None:
+            self._keys.remove((-old, user_id))
+        self._keys.insert((-score, user_id))
+        self._scores[user_id] = score
+
+    def position(self, user_id: str) -> Optional[int]:
+        """0-based position in the ordering (ties broken by user_id)"""
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        return self._keys.bisect_left((-score, user_id))
+
+    def rank(self, user_id: str) -> Optional[int]:
+        """1-based rank; users with the same score share a rank"""
+        score = self._scores.get(user_id)
+        if score is None:
+            return None
+        return self._keys.bisect_left((-score, '')) + 1
+
+    def slice(self, start: int, end: int) -> List[Dict[str, Any]]:
+        entries = []
+        start = max(0, start)
+        if end <= start or start >= len(self._keys):
+            return entries
+        for neg_score, user_id in islice(self._keys.iter_from(start), end - start):
+            entries.append({
+                'user_id': user_id,
+                'score': -neg_score,
+                'rank': self._keys.bisect_left((neg_score, '')) + 1
+            })
+        return entries
+
+# In-memory boards, built on first use. Guarded by the ledger lock so XP updates
+# (which arrive while the ledger is being written) apply in ledger order.
+_state = None
+
+def _current_week(now: Optional[datetime] = None) -> str:
+    year, week, _ = (now or datetime.now()).isocalendar()
+    return f"{year}-W{week:02d}"
+
+def load_snapshot() -> Dict[str, Any]:
+    """Load the last leaderboard snapshot"""
+    if not os.path.exists(LEADERBOARD_SNAPSHOT_FILE):
+        return {}
+    try:
+        with open(LEADERBOARD_SNAPSHOT_FILE, 'r') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return {}
+
+def _load_state() -> Dict[str, Any]:
+    """
+    Build the boards once: total XP from the ledger (progress.json for users not in it yet),
+    streaks from the activity calendars in progress.json, weekly XP from the last snapshot
+    plus the ledger entries written after it.
+    """
+    global _state
+    if _state is not None:
+        return _state
+
+    from .achievement_service import load_progress
+
+    state = {
+        'boards': {board: RankIndex() for board in BOARDS},
+        'week': _current_week(),
+        'ledger_entries': 0,
+        'last_snapshot': time.time(),
+        'streak_lapses': {},    # user_id -> timestamp at which their streak drops to 0
+        'lapse_queue': []       # heap of (timestamp, user_id); stale items are skipped
+    }
+
+    snapshot = load_snapshot()
+    weekly = {}
+    if snapshot.get('week') == state['week']:
+        weekly = {user_id: scores.get('weekly_xp', 0) for user_id, scores in snapshot.get('users', {}).items()}
+    start = snapshot.get('ledger_entries', 0)
+
+    entries = iter_entries(start)
+    for entry in entries:
+        if entry['action'] == RESET:
+            weekly[entry['user_id']] = 0
+        elif entry['action'] != RESTORE and _current_week(datetime.fromisoformat(entry['timestamp'])) == state['week']:
+            weekly[entry['user_id']] = weekly.get(entry['user_id'], 0) + entry['amount']
+    state['ledger_entries'] = start + len(entries)
+
+    for user_id, user_progress in load_progress().items():
+        # The ledger may be ahead of progress.json while an award is being saved
+        total_xp = get_balance(user_id) if has_balance(user_id) else user_progress.get('total_xp', 0)
+        state['boards']['total_xp'].update(user_id, total_xp)
+        _set_streak(state, user_id, user_progress)
+        state['boards']['weekly_xp'].update(user_id, max(0, weekly.get(user_id, 0)))
+
+    _state = state
+    return _state
+
+def _roll_week(state: Dict[str, Any]):
+    """Start a new weekly board when the week changes"""
+    week = _current_week()
+    if week != state['week']:
+        weekly = RankIndex()
+        for user_id in state['boards']['total_xp'].users():
+            weekly.update(user_id, 0)
+        state['boards']['weekly_xp'] = weekly
+        state['week'] = week
+
+def _set_streak(state: Dict[str, Any], user_id: str, user_progress: Dict[str, Any]):
+    """Put a user's current streak on the board and remember when it lapses"""
+    streak = current_streak(user_progress)
+    state['boards']['streak'].update(user_id, streak)
+    lapses_at = streak_lapses_at(user_progress) if streak else None
+    if lapses_at is None:
+        state['streak_lapses'].pop(user_id, None)
+    else:
+        state['streak_lapses'][user_id] = lapses_at
+        heapq.heappush(state['lapse_queue'], (lapses_at, user_id))
+
+def _lapse_streaks(state: Dict[str, Any]):
+    """Drop to 0 the streaks of users who have missed a full day since their last activity"""
+    now = time.time()
+    queue = state['lapse_queue']
+    while queue and queue[0][0] <= now:
+        lapses_at, user_id = heapq.heappop(queue)
+        if state['streak_lapses'].get(user_id) == lapses_at:
+            del state['streak_lapses'][user_id]
+            state['boards']['streak'].update(user_id, 0)
+
+def _save_snapshot(state: Dict[str, Any]):
+    boards = state['boards']
+    users = {
+        user_id: {board: boards[board].score(user_id) or 0 for board in BOARDS}
+        for user_id in boards['total_xp'].users()
+    }
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(LEADERBOARD_SNAPSHOT_FILE, 'w') as f:
+        json.dump({
+            'saved_at': datetime.now().isoformat(),
+            'week': state['week'],
+            'ledger_entries': state['ledger_entries'],
+            'users': users
+        }, f, indent=2)
+    state['last_snapshot'] = time.time()
+
+def _maybe_snapshot(state: Dict[str, Any]):
+    if time.time() - state['last_snapshot'] >= SNAPSHOT_INTERVAL_SECONDS:
+        _save_snapshot(state)
+
+def record_ledger_entry(entry: Dict[str, Any]):
+    """Apply one ledger entry to the boards (called by the ledger for every entry it writes)"""
+    with ledger_lock:
+        if _state is None:
+            # Not built yet: the entry is already in the ledger and will be read at build time
+            return
+        state = _state
+        _roll_week(state)
+        user_id = entry['user_id']
+        boards = state['boards']
+        boards['total_xp'].update(user_id, entry['balance'])
+        if entry['action'] == RESET:
+            boards['weekly_xp'].update(user_id, 0)
+            boards['streak'].update(user_id, 0)
+            state['streak_lapses'].pop(user_id, None)
+        elif entry['action'] == RESTORE:
+            # Weekly XP from before the reset is not brought back
+            pass
+        else:
+            weekly = (boards['weekly_xp'].score(user_id) or 0) + entry['amount']
+            boards['weekly_xp'].update(user_id, max(0, weekly))
+            if boards['streak'].score(user_id) is None:
+                boards['streak'].update(user_id, 0)
+        state['ledger_entries'] += 1
+        _maybe_snapshot(state)
+
+def record_streak(user_id: str, user_progress: Dict[str, Any]):
+    """Update a user's position on the streak board from their activity calendar"""
+    with ledger_lock:
+        if _state is None:
+            return
+        _roll_week(_state)
+        _set_streak(_state, user_id, user_progress)
+        for board in ('total_xp', 'weekly_xp'):
+            if _state['boards'][board].score(user_id) is None:
+                _state['boards'][board].update(user_id, 0)
+
+def invalidate_boards():
+    """Drop the in-memory boards so they are rebuilt on next use (after a reset of every user)"""
+    global _state
+    with ledger_lock:
+        _state = None
+
+def _get_board(board: str) -> RankIndex:
+    if board not in BOARDS:
+        raise ValueError(f"Unknown leaderboard '{board}' (expected one of {', '.join(BOARDS)})")
+    state = _load_state()
+    _roll_week(state)
+    _lapse_streaks(state)
+    return state['boards'][board]
+
+def get_top(board: str = 'total_xp', limit: int = 10, offset: int = 0) -> Dict[str, Any]:
+    """Top users on a board"""
+    with ledger_lock:
+        index = _get_board(board)
+        return {
+            'board': board,
+            'entries': index.slice(offset, offset + limit),
+            'total_users': len(index)
+        }
+
+def get_rank(user_id: str, board: str = 'total_xp') -> Dict[str, Any]:
+    """A user's rank and score on a board (rank is None for users with no progress)"""
+    with ledger_lock:
+        index = _get_board(board)
+        return {
+            'board': board,
+            'user_id': user_id,
+            'rank': index.rank(user_id),
+            'score': index.score(user_id),
+            'total_users': len(index)
+        }
+
+def get_around(user_id: str, board: str = 'total_xp', radius: int = 5) -> Dict[str, Any]:
+    """The users ranked just above and below a user"""
+    with ledger_lock:
+        index = _get_board(board)
+        position = index.position(user_id)
+        entries = [] if position is None else index.slice(position - radius, position + radius + 1)
+        return {
+            'board': board,
+            'user_id': user_id,
+            'rank': index.rank(user_id),
+            'entries': entries,
+            'total_users': len(index)
+        }
+
+def snapshot_leaderboard() -> Dict[str, Any]:
+    """Write a snapshot of the boards now"""
+    with ledger_lock:
+        state = _load_state()
+        _roll_week(state)
+        _lapse_streaks(state)
+        _save_snapshot(state)
+        return {
+            'success': True,
+            'week': state['week'],
+            'ledger_entries': state['ledger_entries'],
+            'users': len(state['boards']['total_xp'])
+        }
@@ -0,0 +1,281 @@
+import json
+import os
+import sys
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+# Path to data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+XP_LEDGER_FILE = os.path.join(DATA_DIR, 'xp_ledger.jsonl')
+
+# Actions that undo an earlier award from the same source, which may then be earned again
+REVERSING_ACTIONS = {'forgotten': 'learned'}
+
+# Bookkeeping actions that set a balance rather than award XP for an activity
+OPENING_BALANCE = 'opening_balance'
+RESET = 'reset'
+ADJUSTMENT = 'adjustment'
+# Undoes a RESET: the balance returns and awards earned before the reset count as earned again
+RESTORE = 'restore'
+BOOKKEEPING_ACTIONS = (OPENING_BALANCE, RESET, ADJUSTMENT, RESTORE)
+
+# In-memory state derived from the append-only ledger. Reentrant so the leaderboard,
+# which is updated while an entry is written, can share it.
+ledger_lock = threading.RLock()
+_state = None
+
+def _new_state() -> Dict[str, Any]:
+    return {
+        'offsets': [],      # offset of every entry, in ledger order
+        'by_user': {},      # user_id -> [entry number]
+        'balances': {},     # user_id -> running XP balance
+        'active_keys': {},  # user_id -> idempotency keys currently in effect
+        'reset_keys': {}    # user_id -> keys that were in effect before the last reset
+    }
+
+def ledger_key(user_id: str, source_type: str, source_id: Any, action: str) -> str:
+    """Idempotency key of an award: one per user, source and action"""
+    return f"{user_id}:{source_type}:{source_id}:{action}"
+
+def _apply_entry(state: Dict[str, Any], entry: Dict[str, Any], offset: int):
+    """Fold one ledger entry into the derived state (used both when writing and when replaying)"""
+    user_id = entry['user_id']
+    number = len(state['offsets'])
+    state['offsets'].append(offset)
+    state['by_user'].setdefault(user_id, []).append(number)
+
+    keys = state['active_keys'].setdefault(user_id, set())
+    if entry['action'] == RESET:
+        state['reset_keys'][user_id] = set(keys)
+        keys.clear()
+    elif entry['action'] == RESTORE:
+        keys.update(state['reset_keys'].pop(user_id, set()))
+    elif entry['action'] not in BOOKKEEPING_ACTIONS:
+        _update_keys(keys, user_id, entry['source_type'], entry['source_id'], entry['action'])
+
+    state['balances'][user_id] = state['balances'].get(user_id, 0) + entry['amount']
+
+def _update_keys(keys: set, user_id: str, source_type: str, source_id: Any, action: str):
+    """Idempotency keys in effect after an award"""
+    keys.add(ledger_key(user_id, source_type, source_id, action))
+    reversed_action = REVERSING_ACTIONS.get(action)
+    if reversed_action:
+        keys.discard(ledger_key(user_id, source_type, source_id, reversed_action))
+    for reversing, reversed_action in REVERSING_ACTIONS.items():
+        if reversed_action == action:
+            keys.discard(ledger_key(user_id, source_type, source_id, reversing))
+
+def _award_allowed(keys: set, user_id: str, source_type: str, source_id: Any, action: str) -> bool:
+    """False for a duplicate, or for reversing an award that is not in effect"""
+    if ledger_key(user_id, source_type, source_id, action) in keys:
+        return False
+    reversed_action = REVERSING_ACTIONS.get(action)
+    return not reversed_action or ledger_key(user_id, source_type, source_id, reversed_action) in keys
+
+def _replay(path: str) -> Dict[str, Any]:
+    """Rebuild the derived state with one scan of the ledger"""
+    state = _new_state()
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            offset = 0
+            for line in f:
+                if line.strip():
+                    try:
+                        _apply_entry(state, json.loads(line), offset)
+                    except json.JSONDecodeError:
+                        # A torn final line from an interrupted write
+                        pass
+                offset += len(line)
+    return state
+
+def _load_state() -> Dict[str, Any]:
+    global _state
+    if _state is None:
+        _state = _replay(XP_LEDGER_FILE)
+    return _state
+
+def _append(state: Dict[str, Any], user_id: str, source_type: str, source_id: Any, action: str,
+            amount: int) -> Dict[str, Any]:
+    entry = {
+        'timestamp': datetime.now().isoformat(),
+        'user_id': user_id,
+        'source_type': source_type,
+        'source_id': source_id,
+        'action': action,
+        'amount': amount,
+        'balance': state['balances'].get(user_id, 0) + amount
+    }
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(XP_LEDGER_FILE, 'ab') as f:
+        offset = f.tell()
+        f.write((json.dumps(entry) + '\n').encode('utf-8'))
+    _apply_entry(state, entry, offset)
+
+    from .leaderboard_service import record_ledger_entry
+    from .analytics_service import record_ledger_entry as roll_up_ledger_entry
+    record_ledger_entry(entry)
+    roll_up_ledger_entry(entry)
+    return entry
+
+def record_xp(user_id: str, source_type: str, source_id: Any, action: str, amount: int,
+              opening_balance: int = 0) -> Optional[Dict[str, Any]]:
+    """
+    Append an XP award to the ledger unless it was already recorded.
+    Returns the ledger entry, or None for a duplicate (or for reversing an award that is not in effect).
+    Deductions never take the balance below 0; the entry holds the amount actually applied.
+    opening_balance seeds a user's balance the first time they appear in the ledger.
+    """
+    with ledger_lock:
+        state = _load_state()
+        if not _award_allowed(state['active_keys'].get(user_id, set()), user_id, source_type, source_id, action):
+            return None
+
+        if user_id not in state['balances'] and opening_balance:
+            _append(state, user_id, 'progress', user_id, OPENING_BALANCE, opening_balance)
+
+        balance = state['balances'].get(user_id, 0)
+        return _append(state, user_id, source_type, source_id, action, max(amount, -balance))
+
+def preview_xp(user_id: str, awards: List[tuple], opening_balance: int = 0) -> Dict[str, Any]:
+    """
+    What record_xp would do for (source_type, source_id, action, amount) awards made in order,
+    without writing anything: {'amounts': [amount applied, or None for a duplicate], 'balance'}.
+    Hold ledger_lock from the preview through the record_xp calls so the outcome cannot change.
+    """
+    with ledger_lock:
+        state = _load_state()
+        keys = set(state['active_keys'].get(user_id, set()))
+        balance = state['balances'].get(user_id, opening_balance)
+        amounts = []
+        for source_type, source_id, action, amount in awards:
+            if not _award_allowed(keys, user_id, source_type, source_id, action):
+                amounts.append(None)
+                continue
+            applied = max(amount, -balance)
+            balance += applied
+            _update_keys(keys, user_id, source_type, source_id, action)
+            amounts.append(applied)
+        return {'amounts': amounts, 'balance': balance}
+
+def set_balance(user_id: str, balance: int, action: str = ADJUSTMENT) -> Dict[str, Any]:
+    """
+    Record a bookkeeping entry that moves a user's balance to an exact value
+    (imports use ADJUSTMENT; RESET also makes every award earnable again).
+    """
+    with ledger_lock:
+        state = _load_state()
+        return _append(state, user_id, 'progress', user_id, action, balance - state['balances'].get(user_id, 0))
+
+def restore_balance(user_id: str, balance: int) -> Dict[str, Any]:
+    """Undo a user's last reset in the ledger, bringing their balance back to the given value"""
+    with ledger_lock:
+        state = _load_state()
+        return _append(state, user_id, 'progress', user_id, RESTORE, balance - state['balances'].get(user_id, 0))
+
+def get_balance(user_id: str) -> int:
+    """Current XP balance of a user, read from the cached running total"""
+    with ledger_lock:
+        return _load_state()['balances'].get(user_id, 0)
+
+def has_balance(user_id: str) -> bool:
+    """Whether the user has any ledger entries yet"""
+    with ledger_lock:
+        return user_id in _load_state()['balances']
+
+def ledger_users() -> List[str]:
+    """Users with any ledger entries"""
+    with ledger_lock:
+        return list(_load_state()['balances'])
+
+def iter_entries(start: int = 0) -> List[Dict[str, Any]]:
+    """All ledger entries from entry number 'start' on, in ledger order"""
+    with ledger_lock:
+        offsets = _load_state()['offsets']
+        if start >= len(offsets):
+            return []
+        entries = []
+        with open(XP_LEDGER_FILE, 'rb') as f:
+            f.seek(offsets[start])
+            for line in f:
+                if line.strip():
+                    try:
+                        entries.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        pass
+        return entries
+
+def query_ledger(user_id: str, offset: int = 0, limit: int = 50) -> Dict[str, Any]:
+    """Get a page of a user's ledger entries, newest first"""
+    with ledger_lock:
+        state = _load_state()
+        numbers = state['by_user'].get(user_id, [])
+        total = len(numbers)
+        start = max(0, total - offset - limit)
+        end = max(0, total - offset)
+        page = [state['offsets'][n] for n in reversed(numbers[start:end])]
+        entries = []
+        if page:
+            with open(XP_LEDGER_FILE, 'rb') as f:
+                for entry_offset in page:
+                    f.seek(entry_offset)
+                    entries.append(json.loads(f.readline()))
+        balance = state['balances'].get(user_id, 0)
+
+    return {
+        'entries': entries,
+        'balance': balance,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'next_offset': offset + limit if offset + limit < total else None
+    }
+
+def audit_ledger(fix: bool = False) -> Dict[str, Any]:
+    """
+    Replay the whole ledger and compare the rebuilt balances with the cached
+    balances and with total_xp in progress.json.
+    With fix=True, the cache is replaced and progress total_xp/level are rewritten from the ledger.
+    """
+    from .achievement_service import load_progress, save_progress, calculate_level
+
+    global _state
+    with ledger_lock:
+        rebuilt = _replay(XP_LEDGER_FILE)
+        cached = _load_state()['balances']
+        progress = load_progress()
+
+        mismatches = {}
+        for user_id in set(rebuilt['balances']) | set(cached):
+            ledger_balance = rebuilt['balances'].get(user_id, 0)
+            cached_balance = cached.get(user_id, 0)
+            progress_xp = progress.get(user_id, {}).get('total_xp')
+            if cached_balance != ledger_balance or (progress_xp is not None and progress_xp != ledger_balance):
+                mismatches[user_id] = {
+                    'ledger_balance': ledger_balance,
+                    'cached_balance': cached_balance,
+                    'progress_total_xp': progress_xp
+                }
+
+        if fix:
+            _state = rebuilt
+            changed = False
+            for user_id, mismatch in mismatches.items():
+                if user_id in progress and mismatch['progress_total_xp'] != mismatch['ledger_balance']:
+                    progress[user_id]['total_xp'] = mismatch['ledger_balance']
+                    progress[user_id]['level'] = calculate_level(mismatch['ledger_balance'])
+                    changed = True
+            if changed:
+                save_progress(progress)
+
+    return {
+        'success': True,
+        'entries': len(rebuilt['offsets']),
+        'users': len(rebuilt['balances']),
+        'mismatches': mismatches,
+        'fixed': fix and bool(mismatches)
+    }
+
+if __name__ == '__main__':
+    # python -m services.ledger_service [--fix]
+    print(json.dumps(audit_ledger(fix='--fix' in sys.argv), indent=2))
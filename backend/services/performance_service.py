@@ -0,0 +1,208 @@
+import math
+import random
+from typing import Dict, List, Any, Optional
+
+from services.sandbox_service import run_in_sandbox
+from services.test_suite_service import get_test_suite
+
+# Input sizes the solution is timed on
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+# Total sandbox time allowed for one timing run
+PERFORMANCE_TIMEOUT_SECONDS = 20
+
+# A solution counts as efficient if it is at most this many times slower than the reference
+SLOWDOWN_TOLERANCE = 3.0
+
+# Candidate growth models, ordered from fastest to slowest
+COMPLEXITY_MODELS = [
+    ('O(1)', lambda n: 1.0),
+    ('O(log n)', lambda n: math.log2(n)),
+    ('O(sqrt n)', lambda n: math.sqrt(n)),
+    ('O(n)', lambda n: float(n)),
+    ('O(n log n)', lambda n: n * math.log2(n)),
+    ('O(n^2)', lambda n: float(n) ** 2),
+    ('O(n^3)', lambda n: float(n) ** 3)
+]
+COMPLEXITY_RANK = {name: rank for rank, (name, _) in enumerate(COMPLEXITY_MODELS)}
+
+def _size_of(value: Any) -> int:
+    """Rough size of an argument, used to pick the richest example to scale from."""
+    if isinstance(value, (list, tuple, set, str, dict)):
+        return len(value) + sum(_size_of(item) for item in value if isinstance(item, (list, tuple, set)))
+    return 0
+
+def _is_collection(value: Any) -> bool:
+    return isinstance(value, (list, tuple, set, str))
+
+def _sample_like(value: Any, rng: random.Random, low: int, high: int) -> Any:
+    """Generate a random value with the same type as an example element."""
+    if isinstance(value, bool):
+        return rng.random() < 0.5
+    if isinstance(value, int):
+        return rng.randint(low, high)
+    if isinstance(value, float):
+        return rng.uniform(low, high)
+    if isinstance(value, str):
+        return value if len(value) != 1 else rng.choice('abcdefghijklmnopqrstuvwxyz')
+    return value
+
+def _int_range(values: List[Any], n: int) -> tuple:
+    """Value range for generated ints, based on the example's ints and widened with n."""
+    ints = [v for v in values if isinstance(v, int) and not isinstance(v, bool)]
+    low = min(ints) if ints else 0
+    high = max(ints) if ints else 9
+    return low, max(high, low + n)
+
+def _scale_collection(value: Any, n: int, rng: random.Random) -> Any:
+    """Grow a collection to size n while keeping its element types."""
+    if isinstance(value, str):
+        alphabet = sorted(set(value)) or ['a']
+        return ''.join(rng.choice(alphabet) for _ in range(n))
+
+    if isinstance(value, set):
+        low, high = _int_range(list(value), n)
+        return {rng.randint(low, high) for _ in range(n)}
+
+    items = list(value)
+    if items and all(isinstance(item, (list, tuple)) for item in items):
+        # Grids scale to roughly n cells in total
+        side = max(1, int(math.sqrt(n)))
+        cells = [cell for row in items for cell in row]
+        distinct = sorted(set(cells), key=repr)
+        if cells and len(distinct) <= 4:
+            # Few distinct cell values (e.g. land/water maps): sample from them
+            rows = [[rng.choice(distinct) for _ in range(side)] for _ in range(side)]
+        else:
+            low, high = _int_range(cells, side)
+            template = cells[0] if cells else 0
+            rows = [[_sample_like(template, rng, low, high) for _ in range(side)] for _ in range(side)]
+        row_type = type(items[0])
+        return type(value)(row_type(row) for row in rows)
+
+    low, high = _int_range(items, n)
+    template = items[0] if items else 0
+    return type(value)(_sample_like(template, rng, low, high) for _ in range(n))
+
+def generate_scaled_args(suite: Dict[str, Any], n: int, seed: int = 0) -> Optional[tuple]:
+    """
+    Build an argument tuple of size n from the types of the suite's largest example.
+    Collections grow to n elements; if there are none, integer arguments are set to n.
+    Returns None if the suite has nothing that can be scaled.
+    """
+    if not suite['cases']:
+        return None
+
+    rng = random.Random(seed * 1000003 + n)
+    base = max(suite['cases'], key=lambda case: sum(_size_of(arg) for arg in case['args']))['args']
+
+    if any(_is_collection(arg) for arg in base):
+        return tuple(_scale_collection(arg, n, rng) if _is_collection(arg) else arg for arg in base)
+
+    if any(isinstance(arg, int) and not isinstance(arg, bool) for arg in base):
+        return tuple(n if isinstance(arg, int) and not isinstance(arg, bool) else arg for arg in base)
+
+    return None
+
+def fit_complexity(timings: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Fit runtime growth to the candidate models.
+    Uses least squares on relative error so small and large sizes weigh the same.
+    """
+    points = [(t['n'], t['seconds']) for t in timings if t.get('seconds')]
+    if len(points) < 3:
+        return {'complexity': 'unknown', 'growth_exponent': None}
+
+    best_name = 'unknown'
+    best_error = None
+    for name, model in COMPLEXITY_MODELS:
+        ratios = [model(n) / seconds for n, seconds in points]
+        scale = sum(ratios) / sum(r * r for r in ratios)
+        error = sum((1 - scale * r) ** 2 for r in ratios)
+        if best_error is None or error < best_error:
+            best_name, best_error = name, error
+
+    # Log-log slope between the two largest sizes
+    (n1, t1), (n2, t2) = points[-2], points[-1]
+    exponent = math.log(t2 / t1) / math.log(n2 / n1) if n2 != n1 else 0.0
+
+    return {'complexity': best_name, 'growth_exponent': round(exponent, 2)}
+
+def time_solution(code: str, suite: Dict[str, Any], sizes: List[int] = None,
+                  timeout: float = PERFORMANCE_TIMEOUT_SECONDS) -> Dict[str, Any]:
+    """
+    Time a solution on scaled inputs in the sandbox and fit its complexity.
+    Sizes that did not finish before the timeout are reported with seconds=None.
+    """
+    sizes = sizes or DEFAULT_SIZES
+    inputs = [(n, generate_scaled_args(suite, n)) for n in sizes]
+    inputs = [(n, args) for n, args in inputs if args is not None]
+    if not inputs:
+        return {'timings': [], 'complexity': 'unknown', 'growth_exponent': None,
+                'error': 'Examples have no scalable arguments'}
+
+    outcome = run_in_sandbox(code, suite['function_name'], [{'args': repr(args)} for _, args in inputs],
+                             timed=True, timeout=timeout)
+    results = outcome.get('results', [])
+
+    timings = []
+    for i, (n, _) in enumerate(inputs):
+        result = results[i] if i < len(results) else {}
+        timings.append({'n': n, 'seconds': result.get('seconds'), 'error': result.get('error')})
+
+    report = {'timings': timings, 'error': outcome.get('error')}
+    report.update(fit_complexity(timings))
+    return report
+
+def grade_performance(code: str, suite: Dict[str, Any], reference_code: Optional[str] = None,
+                      sizes: List[int] = None) -> Dict[str, Any]:
+    """
+    Grade an accepted solution's performance against the reference solution.
+    'efficient' is None when there is no usable reference to compare against.
+    """
+    report = time_solution(code, suite, sizes)
+    report['reference'] = None
+    report['slowdown'] = None
+    report['efficient'] = None
+
+    if not reference_code:
+        return report
+
+    reference = time_solution(reference_code, suite, sizes)
+    report['reference'] = reference
+
+    # Compare at the largest size both finished
+    user_times = {t['n']: t['seconds'] for t in report['timings'] if t['seconds']}
+    reference_times = {t['n']: t['seconds'] for t in reference['timings'] if t['seconds']}
+    common = sorted(set(user_times) & set(reference_times))
+    if not common:
+        # The reference finished sizes the user's code could not
+        if reference_times and len(user_times) < len(reference_times):
+            report['efficient'] = False
+        return report
+
+    n = common[-1]
+    report['slowdown'] = round(user_times[n] / reference_times[n], 2)
+
+    user_rank = COMPLEXITY_RANK.get(report['complexity'])
+    reference_rank = COMPLEXITY_RANK.get(reference['complexity'])
+    finished_all = len(user_times) >= len(reference_times)
+    report['efficient'] = finished_all and (
+        report['slowdown'] <= SLOWDOWN_TOLERANCE
+        or (user_rank is not None and reference_rank is not None and user_rank <= reference_rank)
+    )
+    return report
+
+def grade_challenge_submission(challenge: Dict[str, Any], user_code: str,
+                               sizes: List[int] = None) -> Dict[str, Any]:
+    """Grade a submission's performance using the challenge's compiled suite and reference solution."""
+    from services.challenge_service import get_reference_solution
+
+    suite = get_test_suite(challenge)
+    if not suite['cases']:
+        return {'timings': [], 'complexity': 'unknown', 'growth_exponent': None,
+                'reference': None, 'slowdown': None, 'efficient': None,
+                'error': 'Challenge has no compiled test cases'}
+
+    reference_code = get_reference_solution(challenge, suite['fingerprint'])
+    return grade_performance(user_code, suite, reference_code, sizes)
@@ -0,0 +1,144 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Any
+
+from services.challenge_service import (
+    generate_challenge, load_challenges, save_challenges, get_solution, extract_code_block,
+    load_reference_solutions, save_reference_solutions
+)
+from services.test_suite_service import compile_test_suite, get_test_suite
+from services.sandbox_service import run_test_suite, code_execution_enabled, CODE_EXECUTION_DISABLED
+
+# Path to data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+REJECTED_CHALLENGES_FILE = os.path.join(DATA_DIR, 'rejected_challenges.jsonl')
+
+# Languages whose reference solutions can be run in the sandbox
+VALIDATED_LANGUAGES = {'python'}
+
+def log_rejected_challenge(candidate: Dict[str, Any], reasons: List[str]):
+    """Append a rejected candidate and why it was rejected to the rejection log"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(REJECTED_CHALLENGES_FILE, 'a') as f:
+        f.write(json.dumps({
+            'timestamp': datetime.now().isoformat(),
+            'title': candidate.get('title', ''),
+            'reasons': reasons,
+            'challenge': candidate
+        }, default=str) + '\n')
+
+def validate_candidate(candidate: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Check a generated challenge by running an AI reference solution against its examples.
+    Model-written code never runs unless code execution is enabled (see sandbox_service).
+    Returns {'accepted', 'reasons', 'reference_code', 'test_results'}.
+    """
+    if not code_execution_enabled():
+        return {'accepted': False, 'reasons': [CODE_EXECUTION_DISABLED], 'reference_code': '', 'test_results': []}
+    if candidate.get('language', '').lower() not in VALIDATED_LANGUAGES:
+        return {'accepted': False, 'reasons': [f"Cannot validate {candidate.get('language')} challenges"],
+                'reference_code': '', 'test_results': []}
+
+    suite = compile_test_suite(candidate)
+    if suite['errors']:
+        reasons = [f"Example {e['example']}: {e['error']}" if e['example'] is not None else e['error']
+                   for e in suite['errors']]
+        return {'accepted': False, 'reasons': reasons, 'reference_code': '', 'test_results': []}
+    if not suite['cases']:
+        return {'accepted': False, 'reasons': ['Challenge has no examples'], 'reference_code': '', 'test_results': []}
+
+    reference_code = extract_code_block(get_solution(candidate))
+    outcome = run_test_suite(reference_code, suite)
+
+    if outcome['error']:
+        reasons = [f"Reference solution failed to run: {outcome['error']}"]
+    else:
+        reasons = [f"Example {i}: expected {test['expected_output']} but reference returned {test['actual_output']}"
+                   for i, test in enumerate(outcome['test_results']) if not test['pass']]
+
+    return {
+        'accepted': outcome['correct'],
+        'reasons': reasons,
+        'reference_code': reference_code,
+        'test_results': outcome['test_results']
+    }
+
+def _generate_and_validate(difficulty: str, topic: str, language: str) -> Dict[str, Any]:
+    """Generate one candidate and validate it (runs on a worker thread)"""
+    candidate = generate_challenge(difficulty=difficulty, topic=topic, language=language)
+    candidate.pop('id', None)
+    return {'challenge': candidate, **validate_candidate(candidate)}
+
+def generate_validated_challenges(difficulty: str = "easy", topic: str = "algorithms", language: str = "python",
+                                  count: int = 3, max_concurrency: int = 3) -> Dict[str, Any]:
+    """
+    Generate several candidate challenges in parallel and publish only those whose examples
+    agree with a reference solution. Rejected candidates are logged with their reasons.
+    """
+    started = time.perf_counter()
+
+    with ThreadPoolExecutor(max_workers=max(1, max_concurrency)) as executor:
+        futures = [executor.submit(_generate_and_validate, difficulty, topic, language) for _ in range(count)]
+        outcomes = []
+        for future in futures:
+            try:
+                outcomes.append(future.result())
+            except Exception as e:
+                outcomes.append({'challenge': {}, 'accepted': False, 'reasons': [f"Generation failed: {str(e)}"],
+                                 'reference_code': '', 'test_results': []})
+
+    # Publish accepted candidates in one write, skipping duplicates within the batch
+    challenges = load_challenges()
+    existing_titles = {c.get('title', '').lower() for c in challenges}
+    next_id = max([c.get('id', 0) for c in challenges], default=0) + 1
+    reference_solutions = load_reference_solutions()
+
+    published = []
+    rejected = []
+    for outcome in outcomes:
+        candidate = outcome['challenge']
+        if outcome['accepted'] and candidate.get('title', '').lower() in existing_titles:
+            outcome['accepted'] = False
+            outcome['reasons'] = ['Duplicate of an existing challenge']
+
+        if not outcome['accepted']:
+            log_rejected_challenge(candidate, outcome['reasons'])
+            rejected.append({'title': candidate.get('title', ''), 'reasons': outcome['reasons']})
+            continue
+
+        candidate['id'] = next_id
+        candidate['completed'] = False
+        next_id += 1
+        existing_titles.add(candidate['title'].lower())
+        challenges.append(candidate)
+        published.append(candidate)
+
+        # Keep the validated reference so performance grading does not regenerate it
+        reference_solutions[str(candidate['id'])] = {
+            'code': outcome['reference_code'],
+            'fingerprint': compile_test_suite(candidate)['fingerprint']
+        }
+
+    if published:
+        save_challenges(challenges)
+        save_reference_solutions(reference_solutions)
+        for challenge in published:
+            get_test_suite(challenge)
+
+    elapsed = time.perf_counter() - started
+    accepted_per_minute = round(len(published) / elapsed * 60, 2) if elapsed > 0 else 0
+    print(f"Published {len(published)}/{count} generated challenges ({accepted_per_minute} accepted/min)")
+    return {
+        'published': published,
+        'rejected': rejected,
+        'stats': {
+            'candidates': count,
+            'accepted': len(published),
+            'rejected': len(rejected),
+            'elapsed_seconds': round(elapsed, 2),
+            'accepted_per_minute': accepted_per_minute
+        }
+    }
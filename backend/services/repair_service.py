@@ -0,0 +1,142 @@
+import json
+import os
+import sys
+from typing import Dict, List, Any, Optional
+
+from .achievement_service import (
+    ACHIEVEMENTS, ACHIEVEMENT_INDEX, load_progress, save_progress, new_user_progress, calculate_level,
+    _requirements_met
+)
+from .challenge_service import CHALLENGES_FILE
+from .activity_service import longest_run
+
+def _load_challenges_by_id() -> Dict[int, Dict[str, Any]]:
+    """Read challenges.json as-is (no dedup or completion rewrite) keyed by id"""
+    if not os.path.exists(CHALLENGES_FILE):
+        return {}
+    with open(CHALLENGES_FILE, 'r') as f:
+        return {c.get('id'): c for c in json.load(f)}
+
+def repair_user_record(user_progress: Dict[str, Any], challenges_by_id: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Recompute a user's derived aggregates from their raw data, in place.
+    Returns the fields whose values changed as {field: [old, new]}.
+    """
+    defaults = new_user_progress()
+    for key, value in defaults.items():
+        user_progress.setdefault(key, value)
+    achievement_progress = user_progress['achievement_progress']
+    stats = user_progress['stats']
+    for key, value in defaults['achievement_progress'].items():
+        achievement_progress.setdefault(key, value)
+    for key, value in defaults['stats'].items():
+        stats.setdefault(key, value)
+
+    before = {
+        'achievement_progress': dict(achievement_progress),
+        'stats': {k: v for k, v in stats.items()},
+        'achievements': list(user_progress['achievements']),
+        'level': user_progress['level'],
+        'longest_streak': user_progress['longest_streak']
+    }
+
+    # Challenges completed come from the completed_challenges list
+    completed = list(dict.fromkeys(user_progress['completed_challenges']))
+    user_progress['completed_challenges'] = completed
+    achievement_progress['challenges_completed'] = len(completed)
+    stats['total_challenges_completed'] = len(completed)
+
+    # Topics and difficulties come from the completed challenges
+    topic_counts = {}
+    difficulty_counts = {}
+    for challenge_id in completed:
+        challenge = challenges_by_id.get(challenge_id)
+        if challenge:
+            if challenge.get('topic'):
+                topic_counts[challenge['topic']] = topic_counts.get(challenge['topic'], 0) + 1
+            if challenge.get('difficulty'):
+                difficulty_counts[challenge['difficulty']] = difficulty_counts.get(challenge['difficulty'], 0) + 1
+    topics_covered = set(topic_counts)
+    difficulties_tried = set(difficulty_counts)
+
+    stats['topic_counts'] = topic_counts
+    stats['difficulty_counts'] = difficulty_counts
+    stats['favorite_topic'] = max(topic_counts, key=topic_counts.get) if topic_counts else ''
+    stats['favorite_difficulty'] = max(difficulty_counts, key=difficulty_counts.get) if difficulty_counts else ''
+
+    stats['topics_covered'] = sorted(topics_covered)
+    stats['total_topics_covered'] = len(topics_covered)
+    achievement_progress['different_topics'] = len(topics_covered)
+
+    stats['difficulties_tried'] = sorted(difficulties_tried)
+    stats['total_difficulties_tried'] = len(difficulties_tried)
+    achievement_progress['different_difficulties'] = len(difficulties_tried)
+
+    # Counters without a raw source are the source of truth for their stats
+    stats['total_flashcards_learned'] = achievement_progress['flashcards_learned']
+    stats['total_perfect_solutions'] = achievement_progress['perfect_solutions']
+    stats['total_lessons_completed'] = achievement_progress['lessons_completed']
+    stats['total_courses_completed'] = achievement_progress['courses_completed']
+    achievement_progress['streak_days'] = user_progress['streak']
+    user_progress['longest_streak'] = max(user_progress['longest_streak'], longest_run(user_progress))
+
+    # Unlock anything the counters now satisfy and resync the incremental checker
+    unlocked = set(user_progress['achievements'])
+    for achievement_id, achievement in ACHIEVEMENTS.items():
+        if achievement_id not in unlocked and _requirements_met(achievement, achievement_progress):
+            user_progress['achievements'].append(achievement_id)
+    user_progress['achievement_checked'] = {metric: achievement_progress.get(metric, 0) for metric in ACHIEVEMENT_INDEX}
+
+    user_progress['level'] = calculate_level(user_progress['total_xp'])
+
+    after = {
+        'achievement_progress': achievement_progress,
+        'stats': stats,
+        'achievements': user_progress['achievements'],
+        'level': user_progress['level'],
+        'longest_streak': user_progress['longest_streak']
+    }
+    changes = {}
+    for section in ('achievement_progress', 'stats'):
+        for key, value in after[section].items():
+            if before[section].get(key) != value:
+                changes[f'{section}.{key}'] = [before[section].get(key), value]
+    for key in ('achievements', 'level', 'longest_streak'):
+        if before[key] != after[key]:
+            changes[key] = [before[key], after[key]]
+    return changes
+
+def repair_progress(user_id: Optional[str] = None, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Recompute materialized aggregates for one user (or all users) from raw data.
+    This is the offline counterpart of the incremental updates done on every activity;
+    run it after imports, manual edits or a suspected drift.
+    """
+    progress = load_progress()
+    challenges_by_id = _load_challenges_by_id()
+
+    user_ids: List[str] = [user_id] if user_id is not None else list(progress.keys())
+    repaired = {}
+    for uid in user_ids:
+        if uid not in progress:
+            continue
+        changes = repair_user_record(progress[uid], challenges_by_id)
+        if changes:
+            repaired[uid] = changes
+
+    if repaired and not dry_run:
+        save_progress(progress)
+
+    return {
+        'success': True,
+        'dry_run': dry_run,
+        'users_checked': len([uid for uid in user_ids if uid in progress]),
+        'users_repaired': len(repaired),
+        'changes': repaired
+    }
+
+if __name__ == '__main__':
+    # python -m services.repair_service [user_id] [--dry-run]
+    args = [arg for arg in sys.argv[1:] if arg != '--dry-run']
+    result = repair_progress(args[0] if args else None, dry_run='--dry-run' in sys.argv)
+    print(json.dumps(result, indent=2))
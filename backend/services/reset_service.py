@@ -1,169 +1,75 @@
-import json
-from typing import Dict, Any
-from datetime import datetime
-
-def load_progress() -> Dict[str, Any]:
-    """Load user progress from JSON file."""
-    try:
-        with open('data/progress.json', 'r') as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
-
-def save_progress(progress: Dict[str, Any]):
-    """Save user progress to JSON file."""
-    with open('data/progress.json', 'w') as f:
-        json.dump(progress, f, indent=2)
+from typing import Dict, Any, Optional
+from .ledger_service import set_balance, restore_balance, ledger_users, RESET
+from .enrollment_service import discard_pending_progress
+from .epoch_service import bump_user_epoch, bump_global_epoch, restore_epoch, undo_deadline, current_epoch
+from .achievement_service import load_progress, new_user_progress
+from .leaderboard_service import record_streak, invalidate_boards
 
 def reset_user_progress(user_id: str = "default_user") -> Dict[str, Any]:
     """
     Reset all progress data for a user while preserving content data.
-    This resets XP, level, streak, achievements, and progress tracking.
+    This resets XP, level, streak, achievements, and course progress tracking.
+    Stored records are not rewritten: the user moves to a new epoch and records
+    from older epochs read as empty. The reset can be undone within the undo window.
     """
-    progress = load_progress()
-    
-    # Reset progress data for the user
-    progress[user_id] = {
-        'total_xp': 0,
-        'completed_challenges': [],
-        'completed_courses': [],
-        'completed_lessons': [],
-        'level': 1,
-        'streak': 0,
-        'longest_streak': 0,
-        'last_active_date': datetime.now().isoformat(),
-        'achievements': [],
-        'achievement_progress': {
-            'challenges_completed': 0,
-            'flashcards_learned': 0,
-            'courses_completed': 0,
-            'lessons_completed': 0,
-            'streak_days': 0,
-            'perfect_solutions': 0,
-            'different_topics': 0,
-            'different_difficulties': 0
-        },
-        'stats': {
-            'total_challenges_completed': 0,
-            'total_flashcards_learned': 0,
-            'total_courses_completed': 0,
-            'total_lessons_completed': 0,
-            'total_perfect_solutions': 0,
-            'total_topics_covered': 0,
-            'total_difficulties_tried': 0,
-            'average_challenge_time': 0,
-            'favorite_topic': '',
-            'favorite_difficulty': ''
-        }
-    }
-    
-    save_progress(progress)
-    
-    # Also reset course and challenge progress
-    reset_course_progress()
-    reset_challenge_progress()
-    
+    reset = bump_user_epoch(user_id)
+    discard_pending_progress(user_id)
+
+    # Zero the XP ledger too, so previously earned awards can be earned again
+    set_balance(user_id, 0, RESET)
+
+    reset_data = new_user_progress()
+    reset_data['epoch'] = current_epoch(user_id)
+
     return {
         'success': True,
         'message': f'Progress reset successfully for user {user_id}',
-        'reset_data': progress[user_id]
+        'reset_data': reset_data,
+        'undo_until': undo_deadline(reset).isoformat()
     }
 
-def reset_course_progress():
+def reset_all_users_progress() -> Dict[str, Any]:
     """
-    Reset all course and lesson progress while preserving course content.
+    Reset progress data for all users in the system.
+    One global epoch bump makes every stored record stale; the ledger gets a
+    reset entry per user so balances and leaderboards follow.
     """
-    try:
-        with open('data/courses.json', 'r') as f:
-            courses = json.load(f)
-        
-        # Reset progress for each course and lesson
-        for course in courses:
-            course['progress'] = 0
-            course['completed'] = False
-            course['totalXP'] = 0
-            course['dailyStreak'] = 0
-            
-            # Reset progress for each lesson
-            for lesson in course.get('lessons', []):
-                lesson['completed'] = False
-                lesson['progress'] = 0
-        
-        # Save the updated courses
-        with open('data/courses.json', 'w') as f:
-            json.dump(courses, f, indent=2)
-            
-    except Exception as e:
-        print(f"Error resetting course progress: {e}")
+    reset = bump_global_epoch()
+    discard_pending_progress()
 
-def reset_challenge_progress():
-    """
-    Reset all challenge completion status while preserving challenge content.
-    """
-    try:
-        with open('data/challenges.json', 'r') as f:
-            challenges = json.load(f)
-        
-        # Reset completion status for each challenge
-        for challenge in challenges:
-            challenge['completed'] = False
-        
-        # Save the updated challenges
-        with open('data/challenges.json', 'w') as f:
-            json.dump(challenges, f, indent=2)
-            
-    except Exception as e:
-        print(f"Error resetting challenge progress: {e}")
+    users = ledger_users()
+    for user_id in users:
+        set_balance(user_id, 0, RESET)
+    invalidate_boards()
 
-def reset_all_users_progress() -> Dict[str, Any]:
+    return {
+        'success': True,
+        'message': f'Progress reset successfully for {len(users)} users',
+        'users_reset': users,
+        'undo_until': undo_deadline(reset).isoformat()
+    }
+
+def undo_reset(user_id: Optional[str] = None) -> Dict[str, Any]:
     """
-    Reset progress data for all users in the system.
+    Undo the last reset of a user (or the last reset of all users when user_id is None)
+    if it is inside the undo window. Progress made since that reset is discarded.
+    Raises ValueError if there is nothing to undo.
     """
+    restore_epoch(user_id)
+
+    # Records from the restored epoch are current again; bring the ledger in line
     progress = load_progress()
-    
-    for user_id in progress.keys():
-        progress[user_id] = {
-            'total_xp': 0,
-            'completed_challenges': [],
-            'completed_courses': [],
-            'completed_lessons': [],
-            'level': 1,
-            'streak': 0,
-            'longest_streak': 0,
-            'last_active_date': datetime.now().isoformat(),
-            'achievements': [],
-            'achievement_progress': {
-                'challenges_completed': 0,
-                'flashcards_learned': 0,
-                'courses_completed': 0,
-                'lessons_completed': 0,
-                'streak_days': 0,
-                'perfect_solutions': 0,
-                'different_topics': 0,
-                'different_difficulties': 0
-            },
-            'stats': {
-                'total_challenges_completed': 0,
-                'total_flashcards_learned': 0,
-                'total_courses_completed': 0,
-                'total_lessons_completed': 0,
-                'total_perfect_solutions': 0,
-                'total_topics_covered': 0,
-                'total_difficulties_tried': 0,
-                'average_challenge_time': 0,
-                'favorite_topic': '',
-                'favorite_difficulty': ''
-            }
-        }
-    
-    save_progress(progress)
-    
-    # Also reset course and challenge progress
-    reset_course_progress()
-    reset_challenge_progress()
-    
+    users = [user_id] if user_id else sorted(set(progress) | set(ledger_users()))
+    for restored_user in users:
+        record = progress.get(restored_user, {})
+        restore_balance(restored_user, record.get('total_xp', 0))
+        if user_id:
+            record_streak(restored_user, record)
+    if not user_id:
+        invalidate_boards()
+
     return {
         'success': True,
-        'message': f'Progress reset successfully for {len(progress)} users',
-        'users_reset': list(progress.keys())
-    } 
\ No newline at end of file
+        'message': f'Reset undone for user {user_id}' if user_id else f'Reset undone for {len(users)} users',
+        'users_restored': users
+    }
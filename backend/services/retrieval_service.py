@@ -0,0 +1,437 @@
+import hashlib
+import json
+import math
+import os
+import queue
+import re
+import threading
+import time
+from typing import Dict, List, Any
+
+from .search_service import tokenize, get_documents, ensure_synced, BM25_K1, BM25_B
+
+# Path to data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+RETRIEVAL_INDEX_FILE = os.path.join(DATA_DIR, 'retrieval_index.json')
+CHUNK_EMBEDDINGS_FILE = os.path.join(DATA_DIR, 'chunk_embeddings.json')
+SETTINGS_FILE = os.path.join(DATA_DIR, 'settings.json')
+
+# Documents the tutor draws on
+RETRIEVAL_TYPES = ('lesson', 'challenge')
+
+# Chunk size and the share of the prompt retrieved material may take, in estimated tokens
+CHUNK_TOKENS = 300
+DEFAULT_TOP_K = 4
+DEFAULT_TOKEN_BUDGET = 1000
+CHARS_PER_TOKEN = 4
+
+# Chunks scoring below this fraction of the best match are left out
+MIN_RELATIVE_SCORE = 0.35
+
+# Chunks less similar than this to the question are not retrieved by embedding
+MIN_EMBEDDING_SIMILARITY = 0.5
+
+# Reciprocal rank fusion constant for combining BM25 and embedding rankings
+RRF_K = 60
+
+# After a failed embedding call, embeddings are not tried again for this long
+EMBEDDING_RETRY_SECONDS = 300
+
+# Bump when chunking changes so persisted chunks are rebuilt
+CHUNKER_VERSION = 1
+
+# Words too common to say anything about relevance
+STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'can', 'do', 'does', 'for', 'from', 'how', 'i', 'in',
+    'is', 'it', 'me', 'my', 'of', 'on', 'or', 'so', 'that', 'the', 'this', 'to', 'what', 'when', 'where',
+    'which', 'who', 'why', 'with', 'you', 'your', 'explain', 'please', 'tell'
+}
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English and code)"""
+    return len(text or '') // CHARS_PER_TOKEN + 1
+
+def embedding_model() -> str:
+    """Ollama embedding model from data/settings.json ("tutor_embedding_model"); empty disables embeddings"""
+    from .ai_service import EMBEDDING_MODEL
+    try:
+        with open(SETTINGS_FILE, 'r') as f:
+            return str(json.load(f).get('tutor_embedding_model', EMBEDDING_MODEL) or '')
+    except (FileNotFoundError, json.JSONDecodeError):
+        return EMBEDDING_MODEL
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+_HEADING = re.compile(r'^#{1,6}\s')
+
+def _blocks(text: str) -> List[str]:
+    """Paragraphs and headings of markdown text; fenced code blocks stay whole"""
+    blocks, current, in_code = [], [], False
+    for line in text.splitlines():
+        if line.strip().startswith('```'):
+            in_code = not in_code
+        if not in_code and (not line.strip() or _HEADING.match(line)):
+            if current:
+                blocks.append('\n'.join(current))
+                current = []
+            if line.strip():
+                blocks.append(line)
+            continue
+        current.append(line)
+    if current:
+        blocks.append('\n'.join(current))
+    return blocks
+
+def chunk_text(text: str, max_tokens: int = CHUNK_TOKENS) -> List[str]:
+    """
+    Split markdown into chunks of about max_tokens. A heading starts a new chunk,
+    paragraphs are packed together, and oversized paragraphs are cut at line breaks.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks, current = [], ''
+
+    def close():
+        nonlocal current
+        if current.strip():
+            chunks.append(current.strip())
+        current = ''
+
+    for block in _blocks(text):
+        if _HEADING.match(block):
+            close()
+        while len(block) > max_chars:
+            cut = block.rfind('\n', 0, max_chars)
+            cut = cut if cut > max_chars // 2 else max_chars
+            close()
+            chunks.append(block[:cut].strip())
+            block = block[cut:]
+        if len(current) + len(block) > max_chars:
+            close()
+        current = f"{current}\n\n{block}" if current else block
+    close()
+    # A heading with nothing under it says nothing on its own
+    return [chunk for chunk in chunks if '\n' in chunk or not _HEADING.match(chunk)]
+
+_lock = threading.RLock()
+_state = None
+_reconciler = None
+
+def _new_state() -> Dict[str, Any]:
+    return {
+        'docs': {},         # doc_id -> {'hash', 'chunks': [chunk ids]}
+        'chunks': {},       # chunk_id -> {'doc_id', 'type', 'source', 'text', 'hash', 'length', 'terms'}
+        'postings': {},     # term -> {chunk_id: term frequency}
+        'total_length': 0
+    }
+
+def _add_chunk(state: Dict[str, Any], chunk_id: str, chunk: Dict[str, Any]):
+    state['chunks'][chunk_id] = chunk
+    for term, frequency in chunk['terms'].items():
+        state['postings'].setdefault(term, {})[chunk_id] = frequency
+    state['total_length'] += chunk['length']
+
+def _remove_doc(state: Dict[str, Any], doc_id: str):
+    entry = state['docs'].pop(doc_id, None)
+    for chunk_id in (entry or {}).get('chunks', []):
+        chunk = state['chunks'].pop(chunk_id, None)
+        if chunk is None:
+            continue
+        for term in chunk['terms']:
+            postings = state['postings'].get(term, {})
+            postings.pop(chunk_id, None)
+            if not postings:
+                state['postings'].pop(term, None)
+        state['total_length'] -= chunk['length']
+
+def _load_state() -> Dict[str, Any]:
+    global _state
+    if _state is not None:
+        return _state
+    state = _new_state()
+    if os.path.exists(RETRIEVAL_INDEX_FILE):
+        try:
+            with open(RETRIEVAL_INDEX_FILE, 'r') as f:
+                stored = json.load(f)
+            if stored.get('version') == CHUNKER_VERSION:
+                state['docs'] = stored.get('docs', {})
+                for chunk_id, chunk in stored.get('chunks', {}).items():
+                    _add_chunk(state, chunk_id, chunk)
+        except (json.JSONDecodeError, KeyError, TypeError):
+            state = _new_state()
+    _state = state
+    return _state
+
+def _save_state(state: Dict[str, Any]):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    temp_file = RETRIEVAL_INDEX_FILE + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump({'version': CHUNKER_VERSION, 'docs': state['docs'], 'chunks': state['chunks']}, f)
+    os.replace(temp_file, RETRIEVAL_INDEX_FILE)
+
+def _chunk_document(doc_id: str, doc: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    meta = doc.get('meta', {})
+    if doc['type'] == 'lesson':
+        source = f"{meta.get('course_title', '')} › {doc['title']}".strip(' ›')
+    else:
+        source = f"Challenge: {doc['title']}"
+    chunks = {}
+    for position, text in enumerate(chunk_text(doc.get('text', ''))):
+        terms = {}
+        for term in tokenize(f"{doc['title']}\n{text}"):
+            terms[term] = terms.get(term, 0) + 1
+        chunks[f"{doc_id}#{position}"] = {
+            'doc_id': doc_id,
+            'type': doc['type'],
+            'source': source,
+            'text': text,
+            'hash': _text_hash(text),
+            'length': sum(terms.values()),
+            'terms': terms
+        }
+    return chunks
+
+def update_documents(changed: Dict[str, Dict[str, Any]], removed: List[str]):
+    """
+    Re-chunk changed lesson and challenge documents and drop removed ones.
+    Called by the search index whenever content is saved; new chunks are queued
+    for embedding in the background.
+    """
+    changed = {doc_id: doc for doc_id, doc in changed.items() if doc['type'] in RETRIEVAL_TYPES}
+    removed = [doc_id for doc_id in removed if doc_id.split(':', 1)[0] in RETRIEVAL_TYPES]
+    if not changed and not removed:
+        return
+    new_chunks = []
+    with _lock:
+        state = _load_state()
+        for doc_id in removed:
+            _remove_doc(state, doc_id)
+        for doc_id, doc in changed.items():
+            _remove_doc(state, doc_id)
+            chunks = _chunk_document(doc_id, doc)
+            for chunk_id, chunk in chunks.items():
+                _add_chunk(state, chunk_id, chunk)
+            state['docs'][doc_id] = {'hash': doc['hash'], 'chunks': list(chunks)}
+            new_chunks.extend(chunks.values())
+        _save_state(state)
+    _queue_embeddings(new_chunks)
+
+def _reconcile():
+    """Bring the chunk index in line with the search index (e.g. after the chunk file was removed)"""
+    ensure_synced()
+    documents = get_documents(RETRIEVAL_TYPES)
+    with _lock:
+        state = _load_state()
+        changed = {doc_id: doc for doc_id, doc in documents.items()
+                   if state['docs'].get(doc_id, {}).get('hash') != doc['hash']}
+        removed = [doc_id for doc_id in state['docs'] if doc_id not in documents]
+    update_documents(changed, removed)
+    _queue_missing_embeddings()
+
+def _ensure_reconciled():
+    """Reconcile once per process, on a background thread so no request waits for it"""
+    global _reconciler
+    with _lock:
+        if _reconciler is None:
+            _reconciler = threading.Thread(target=_reconcile, name='retrieval-reconcile', daemon=True)
+            _reconciler.start()
+
+# Chunk embeddings, keyed by chunk text hash so unchanged text is never embedded twice.
+# Each entry records the model that made it; an entry from another model counts as missing.
+
+_embeddings = None
+_embedding_queue = queue.Queue()
+_embedder = None
+_embeddings_failed_at = 0.0
+_queued_model = None    # model the missing chunks were last queued for
+
+def _load_embeddings() -> Dict[str, Any]:
+    global _embeddings
+    if _embeddings is None:
+        try:
+            with open(CHUNK_EMBEDDINGS_FILE, 'r') as f:
+                _embeddings = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            _embeddings = {}
+    return _embeddings
+
+def _has_embedding(embeddings: Dict[str, Any], text_hash: str, model: str) -> bool:
+    return embeddings.get(text_hash, {}).get('model') == model
+
+def embeddings_available() -> bool:
+    """Whether an embedding model is set and no embedding call failed in the last EMBEDDING_RETRY_SECONDS"""
+    return bool(embedding_model()) and time.time() - _embeddings_failed_at > EMBEDDING_RETRY_SECONDS
+
+def mark_embeddings_failed():
+    """Record a failed embedding call so no caller tries again before the retry delay"""
+    global _embeddings_failed_at
+    _embeddings_failed_at = time.time()
+
+def _queue_missing_embeddings():
+    """Queue every chunk without an embedding from the current model (all of them after a model change)"""
+    global _queued_model
+    model = embedding_model()
+    with _lock:
+        embeddings = _load_embeddings()
+        missing = [chunk for chunk in _load_state()['chunks'].values()
+                   if not _has_embedding(embeddings, chunk['hash'], model)]
+        _queued_model = model
+    _queue_embeddings(missing)
+
+def _queue_embeddings(chunks: List[Dict[str, Any]]):
+    global _embedder
+    if not chunks or not embedding_model():
+        return
+    for chunk in chunks:
+        _embedding_queue.put((chunk['hash'], f"{chunk['source']}\n{chunk['text']}"))
+    with _lock:
+        if _embedder is None or not _embedder.is_alive():
+            _embedder = threading.Thread(target=_embed_loop, name='retrieval-embedder', daemon=True)
+            _embedder.start()
+
+def _embed_loop():
+    """Embed queued chunks until the queue is empty, saving the cache after each batch"""
+    global _queued_model
+    from .ai_service import embed_text
+
+    while True:
+        try:
+            text_hash, text = _embedding_queue.get(timeout=1)
+        except queue.Empty:
+            return
+        batch = {}
+        while True:
+            model = embedding_model()
+            if model and not _has_embedding(_load_embeddings(), text_hash, model) and text_hash not in batch:
+                try:
+                    batch[text_hash] = {'model': model, 'vector': embed_text(text, model)}
+                except Exception as e:
+                    print(f"Embedding failed, retrieval falls back to keywords: {e}")
+                    mark_embeddings_failed()
+                    _queued_model = None
+                    # Drop the rest; the next retrieval after the retry delay queues them again
+                    while not _embedding_queue.empty():
+                        _embedding_queue.get_nowait()
+            try:
+                text_hash, text = _embedding_queue.get_nowait()
+            except queue.Empty:
+                break
+        if batch:
+            with _lock:
+                embeddings = _load_embeddings()
+                embeddings.update(batch)
+                live = {chunk['hash'] for chunk in _load_state()['chunks'].values()}
+                for stale_hash in [h for h in embeddings if h not in live]:
+                    del embeddings[stale_hash]
+                os.makedirs(DATA_DIR, exist_ok=True)
+                temp_file = CHUNK_EMBEDDINGS_FILE + '.tmp'
+                with open(temp_file, 'w') as f:
+                    json.dump(embeddings, f)
+                os.replace(temp_file, CHUNK_EMBEDDINGS_FILE)
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+def _keyword_ranking(state: Dict[str, Any], query: str) -> Dict[str, float]:
+    terms = [term for term in dict.fromkeys(tokenize(query)) if term not in STOPWORDS]
+    total_chunks = len(state['chunks']) or 1
+    average_length = (state['total_length'] / total_chunks) or 1
+    scores = {}
+    for term in terms:
+        postings = state['postings'].get(term, {})
+        idf = math.log(1 + (total_chunks - len(postings) + 0.5) / (len(postings) + 0.5))
+        for chunk_id, frequency in postings.items():
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * state['chunks'][chunk_id]['length'] / average_length)
+            scores[chunk_id] = scores.get(chunk_id, 0) + idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+    if not scores:
+        return {}
+    best = max(scores.values())
+    return {chunk_id: score for chunk_id, score in scores.items() if score >= best * MIN_RELATIVE_SCORE}
+
+def _embedding_ranking(state: Dict[str, Any], query: str, candidates: int) -> Dict[str, float]:
+    """Cosine similarity of the best chunks; empty when embeddings are off, missing or failing"""
+    from .ai_service import embed_text
+
+    if not embeddings_available():
+        return {}
+    model = embedding_model()
+    if model != _queued_model:
+        # The model changed (or a failure dropped the queue): embed the chunks again with this one
+        _queue_missing_embeddings()
+    embeddings = _load_embeddings()
+    vectors = {chunk_id: embeddings[chunk['hash']]['vector'] for chunk_id, chunk in state['chunks'].items()
+               if _has_embedding(embeddings, chunk['hash'], model)}
+    if not vectors:
+        return {}
+    try:
+        query_vector = embed_text(query, model)
+    except Exception as e:
+        print(f"Query embedding failed, using keywords only: {e}")
+        mark_embeddings_failed()
+        return {}
+    scores = {chunk_id: similarity for chunk_id, similarity in
+              ((chunk_id, cosine_similarity(query_vector, vector)) for chunk_id, vector in vectors.items())
+              if similarity >= MIN_EMBEDDING_SIMILARITY}
+    return dict(sorted(scores.items(), key=lambda item: item[1], reverse=True)[:candidates])
+
+def retrieve(query: str, top_k: int = DEFAULT_TOP_K, token_budget: int = DEFAULT_TOKEN_BUDGET) -> List[Dict[str, Any]]:
+    """
+    The chunks most relevant to a question, best first, limited to top_k chunks and
+    token_budget estimated tokens. BM25 and embedding rankings are combined by reciprocal
+    rank fusion when chunk embeddings exist; otherwise BM25 alone decides.
+    """
+    _ensure_reconciled()
+    with _lock:
+        state = _load_state()
+        rankings = [_keyword_ranking(state, query)]
+    rankings.append(_embedding_ranking(state, query, top_k * 3))
+
+    fused = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(sorted(ranking, key=ranking.get, reverse=True)):
+            fused[chunk_id] = fused.get(chunk_id, 0) + 1 / (RRF_K + rank + 1)
+
+    selected, used = [], 0
+    with _lock:
+        for chunk_id in sorted(fused, key=fused.get, reverse=True):
+            chunk = state['chunks'].get(chunk_id)
+            if chunk is None:
+                continue
+            cost = estimate_tokens(chunk['text'])
+            if used + cost > token_budget:
+                continue
+            selected.append({'id': chunk_id, 'doc_id': chunk['doc_id'], 'source': chunk['source'],
+                             'text': chunk['text'], 'score': round(fused[chunk_id], 5)})
+            used += cost
+            if len(selected) >= top_k:
+                break
+    return selected
+
+def build_context(chunks: List[Dict[str, Any]]) -> str:
+    """Retrieved chunks formatted for the tutor prompt"""
+    return '\n\n---\n\n'.join(f"[{chunk['source']}]\n{chunk['text']}" for chunk in chunks)
+
+def retrieve_context(query: str, top_k: int = DEFAULT_TOP_K, token_budget: int = DEFAULT_TOKEN_BUDGET) -> str:
+    """Retrieved excerpts ready for the tutor prompt; empty if nothing relevant is found or retrieval fails"""
+    try:
+        return build_context(retrieve(query, max(0, top_k), max(0, token_budget)))
+    except Exception as e:
+        print(f"Retrieval failed, answering without course material: {e}")
+        return ''
+
+def retrieval_status() -> Dict[str, Any]:
+    with _lock:
+        state = _load_state()
+        embeddings = _load_embeddings()
+        model = embedding_model()
+        return {
+            'documents': len(state['docs']),
+            'chunks': len(state['chunks']),
+            'embedded_chunks': sum(1 for chunk in state['chunks'].values()
+                                   if _has_embedding(embeddings, chunk['hash'], model)),
+            'embedding_model': embedding_model() or None,
+            'embeddings_available': embeddings_available(),
+            'pending_embeddings': _embedding_queue.qsize()
+        }
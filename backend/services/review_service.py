@@ -0,0 +1,222 @@
+import threading
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Any, Optional
+
+from .epoch_service import current_epoch
+
+# SM-2 parameters
+INITIAL_EASE = 2.5
+MINIMUM_EASE = 1.3
+PASSING_QUALITY = 3     # answers rated 3-5 count as recalled
+MAX_QUALITY = 5
+
+# XP for the first successful review of a card (same award as marking it learned)
+FLASHCARD_XP = 10
+
+# A user's schedule is stored in their progress record as
+#   'flashcard_schedule': {card_id: {'ease', 'interval', 'repetitions', 'lapses', 'due', 'last_review'}}
+# with 'interval' in days and 'due' an ISO timestamp.
+
+def schedule_review(state: Optional[Dict[str, Any]], quality: int, now: datetime) -> Dict[str, Any]:
+    """The next schedule of a card after a review graded 0-5 (SM-2)"""
+    state = dict(state or {'ease': INITIAL_EASE, 'interval': 0, 'repetitions': 0, 'lapses': 0})
+    if quality < PASSING_QUALITY:
+        state['repetitions'] = 0
+        state['interval'] = 1
+        state['lapses'] = state.get('lapses', 0) + 1
+    else:
+        state['repetitions'] += 1
+        if state['repetitions'] == 1:
+            state['interval'] = 1
+        elif state['repetitions'] == 2:
+            state['interval'] = 6
+        else:
+            state['interval'] = round(state['interval'] * state['ease'])
+    miss = MAX_QUALITY - quality
+    state['ease'] = round(max(MINIMUM_EASE, state['ease'] + 0.1 - miss * (0.08 + miss * 0.02)), 2)
+    state['due'] = (now + timedelta(days=state['interval'])).isoformat(timespec='seconds')
+    state['last_review'] = now.isoformat(timespec='seconds')
+    return state
+
+class DueIndex:
+    """
+    A user's reviewed cards ordered by due time, and the ids of the cards in the deck they
+    have never reviewed, both with O(log n) updates. Cards deleted from the deck are dropped.
+    """
+
+    def __init__(self, schedule: Dict[str, Dict[str, Any]], deck_ids: List[int]):
+        deck = set(deck_ids)
+        self._due = {int(card_id): state['due'] for card_id, state in schedule.items() if int(card_id) in deck}
+        self._keys = sorted((due, card_id) for card_id, due in self._due.items())
+        self._new = [card_id for card_id in deck_ids if card_id not in self._due]    # sorted
+
+    def __contains__(self, card_id: int) -> bool:
+        return card_id in self._due
+
+    def update(self, card_id: int, due: str):
+        old = self._due.get(card_id)
+        if old is not None:
+            del self._keys[bisect_left(self._keys, (old, card_id))]
+        else:
+            _remove_id(self._new, card_id)
+        insort(self._keys, (due, card_id))
+        self._due[card_id] = due
+
+    def add_card(self, card_id: int):
+        """A card was added to the deck"""
+        if card_id not in self._due:
+            position = bisect_left(self._new, card_id)
+            if position == len(self._new) or self._new[position] != card_id:
+                self._new.insert(position, card_id)
+
+    def remove_card(self, card_id: int):
+        """A card was deleted from the deck"""
+        due = self._due.pop(card_id, None)
+        if due is not None:
+            del self._keys[bisect_left(self._keys, (due, card_id))]
+        _remove_id(self._new, card_id)
+
+    def due_count(self, now: str) -> int:
+        return bisect_right(self._keys, (now, float('inf')))
+
+    def iter_due(self, now: str) -> Iterator[int]:
+        """Ids of the cards due at 'now', most overdue first"""
+        for position in range(self.due_count(now)):
+            yield self._keys[position][1]
+
+    def iter_new(self) -> Iterator[int]:
+        """Ids of the cards never reviewed, in id order"""
+        yield from self._new
+
+def _remove_id(ids: List[int], card_id: int):
+    position = bisect_left(ids, card_id)
+    if position < len(ids) and ids[position] == card_id:
+        del ids[position]
+
+# user_id -> (epoch, DueIndex); rebuilt when the user's epoch changes (reset or undo).
+# Deck changes are applied to every cached index; _deck_changes counts them so an index
+# built while the deck changed is not cached.
+_indexes = {}
+_deck_changes = 0
+_lock = threading.Lock()
+
+def _get_index(user_id: str, user_progress: Optional[Dict[str, Any]] = None) -> DueIndex:
+    from .flashcard_service import flashcard_ids
+
+    epoch = current_epoch(user_id)
+    with _lock:
+        cached = _indexes.get(user_id)
+        if cached and cached[0] == epoch:
+            return cached[1]
+        deck_changes = _deck_changes
+    if user_progress is None:
+        from .achievement_service import load_progress
+        user_progress = load_progress().get(user_id, {})
+    index = DueIndex(user_progress.get('flashcard_schedule', {}), flashcard_ids())
+    with _lock:
+        if deck_changes == _deck_changes:
+            _indexes[user_id] = (epoch, index)
+    return index
+
+def invalidate_due_index(user_id: str):
+    """Forget a user's cached index (after their progress record is replaced, e.g. by an import)"""
+    with _lock:
+        _indexes.pop(user_id, None)
+
+def flashcards_added(card_ids: List[int]):
+    """Called by the flashcard repository when cards are added"""
+    global _deck_changes
+    with _lock:
+        _deck_changes += 1
+        for _, index in _indexes.values():
+            for card_id in card_ids:
+                index.add_card(card_id)
+
+def flashcard_removed(card_id: int):
+    """Called by the flashcard repository when a card is deleted"""
+    global _deck_changes
+    with _lock:
+        _deck_changes += 1
+        for _, index in _indexes.values():
+            index.remove_card(card_id)
+
+def deck_replaced():
+    """Called by the flashcard repository when the whole deck is replaced (imports)"""
+    global _deck_changes
+    with _lock:
+        _deck_changes += 1
+        _indexes.clear()
+
+def get_due_flashcards(user_id: str, limit: int = 20, include_new: bool = True) -> Dict[str, Any]:
+    """
+    The next cards to review: due cards first (most overdue first), then cards the
+    user has never reviewed, up to limit.
+    """
+    from .flashcard_service import get_flashcard
+
+    now = datetime.now().isoformat(timespec='seconds')
+    index = _get_index(user_id)
+
+    cards = []
+    for card_id in index.iter_due(now):
+        if len(cards) >= limit:
+            break
+        card = get_flashcard(card_id)
+        if card:
+            cards.append({**card, 'new': False})
+    if include_new:
+        for card_id in index.iter_new():
+            if len(cards) >= limit:
+                break
+            card = get_flashcard(card_id)
+            if card:
+                cards.append({**card, 'new': True})
+
+    return {
+        'user_id': user_id,
+        'cards': cards,
+        'due_count': index.due_count(now),
+        'limit': limit
+    }
+
+def review_flashcard(user_id: str, flashcard_id: int, quality: int) -> Dict[str, Any]:
+    """
+    Grade a review (0 = blackout ... 5 = perfect recall), reschedule the card and award
+    XP for the first successful review, all in one write of progress.json.
+    Raises ValueError for a bad grade or an unknown card.
+    """
+    from .achievement_service import load_progress, save_progress, new_user_progress, apply_streak
+    from .flashcard_service import get_flashcard
+    from .xp_service import apply_award_to_record
+
+    if not 0 <= quality <= MAX_QUALITY:
+        raise ValueError(f"quality must be between 0 and {MAX_QUALITY}")
+    if get_flashcard(flashcard_id) is None:
+        raise ValueError('Flashcard not found')
+
+    progress = load_progress()
+    user_progress = progress.setdefault(user_id, new_user_progress())
+    schedule = user_progress.setdefault('flashcard_schedule', {})
+    state = schedule_review(schedule.get(str(flashcard_id)), quality, datetime.now())
+    schedule[str(flashcard_id)] = state
+
+    award = None
+    if quality >= PASSING_QUALITY:
+        award = apply_award_to_record(user_id, user_progress, FLASHCARD_XP, 'flashcard', flashcard_id, 'learned',
+                                      'flashcard_learned', 1)
+    if not award or award['duplicate']:
+        # Reviewing counts as activity for the streak even without XP
+        apply_streak(user_progress, user_id=user_id)
+
+    save_progress(progress)
+    _get_index(user_id, user_progress).update(flashcard_id, state['due'])
+
+    return {
+        'success': True,
+        'flashcard_id': flashcard_id,
+        'schedule': state,
+        'xp_earned': award['total_xp_earned'] if award else 0,
+        'new_achievements': award['new_achievements'] if award else [],
+        'updated_progress': user_progress
+    }
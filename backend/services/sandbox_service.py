@@ -0,0 +1,317 @@
+import functools
+import json
+import math
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+from typing import Dict, List, Any, Optional
+from urllib.parse import urlparse
+
+# Path to data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+SETTINGS_FILE = os.path.join(DATA_DIR, 'settings.json')
+
+# Running code is off unless data/settings.json has "code_execution_enabled": true, and
+# even then only for requests made on this machine by a local page (never by a remote
+# host, nor by another website open in the user's browser). The child is a separate
+# interpreter in isolated mode (-I) with an empty environment, a throwaway working
+# directory and caps on memory, CPU time and file size, but it is NOT isolated from the
+# filesystem or the network: only enable it on a machine where that is acceptable.
+LOCAL_HOSTS = {'127.0.0.1', '::1', 'localhost'}
+CODE_EXECUTION_DISABLED = 'Running code needs "code_execution_enabled" in settings and a request from this machine'
+
+# Limits applied to every run
+SANDBOX_TIMEOUT_SECONDS = 10
+SANDBOX_MEMORY_BYTES = 512 * 1024 * 1024
+SANDBOX_FILE_BYTES = 1024 * 1024
+
+# Runs inside the child interpreter. Reads a job from stdin, then forks a worker that
+# loads and calls the solution. The worker closes the result channel and drops the nonce
+# before the solution's code runs, and its stdout and stderr go to /dev/null. The harness
+# process never runs solution code: it times each call from outside (from the go signal
+# to the worker's reply), compares outputs with the expected values itself, and is the
+# only writer of the nonce-tagged result lines. It also marks itself non-dumpable so the
+# worker cannot open its file descriptors through /proc. Timings include one pipe round
+# trip (tens of microseconds), the same for the solution and the reference.
+# Arguments, outputs and expected values travel as Python literals so tuples and sets keep their types.
+_HARNESS = r"""
+import ast, copy, json, os, sys, time
+
+def run_worker(job, commands, reports):
+    # Commands: b"g" calls the function on the prepared arguments, b"n" moves to the next case
+    commands = os.fdopen(commands, "rb", buffering=0)
+    reports = os.fdopen(reports, "w")
+
+    def report(message):
+        reports.write(json.dumps(message) + "\n")
+        reports.flush()
+
+    namespace = {"__name__": "__solution__"}
+    try:
+        exec(compile(job["code"], "<solution>", "exec"), namespace)
+        func = namespace[job["function_name"]]
+    except Exception as e:
+        report({"load_error": f"{type(e).__name__}: {e}"})
+        return
+    for case in job["cases"]:
+        args = ast.literal_eval(case["args"])
+        while True:
+            call_args = copy.deepcopy(args)
+            report({"ready": True})
+            if commands.read(1) != b"g":
+                break
+            try:
+                actual = func(*call_args)
+                report({"returned": True} if job.get("timed") else {"output": repr(actual)})
+            except Exception as e:
+                report({"error": f"{type(e).__name__}: {e}"})
+
+def matches(output, expected):
+    try:
+        return ast.literal_eval(output) == ast.literal_eval(expected)
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        return False
+
+def main():
+    job = json.loads(sys.stdin.read())
+    channel = os.fdopen(job.pop("channel"), "w")
+    nonce = job.pop("nonce")
+    try:
+        import ctypes
+        ctypes.CDLL(None).prctl(4, 0, 0, 0, 0)    # PR_SET_DUMPABLE, 0
+    except (OSError, AttributeError):
+        pass
+
+    commands_read, commands_write = os.pipe()
+    reports_read, reports_write = os.pipe()
+    worker = os.fork()
+    if worker == 0:
+        channel.close()
+        nonce = None
+        os.close(0)
+        os.close(commands_write)
+        os.close(reports_read)
+        try:
+            run_worker(job, commands_read, reports_write)
+        finally:
+            os._exit(0)
+    os.close(commands_read)
+    os.close(reports_write)
+    commands = os.fdopen(commands_write, "wb", buffering=0)
+    reports = os.fdopen(reports_read, "r")
+
+    def send(message):
+        channel.write(json.dumps({**message, "nonce": nonce}) + "\n")
+        channel.flush()
+
+    def receive():
+        line = reports.readline()
+        if not line:
+            return None    # the worker exited
+        try:
+            message = json.loads(line)
+        except ValueError:
+            return {}
+        return message if isinstance(message, dict) else {}
+
+    def command(code):
+        try:
+            commands.write(code)
+        except BrokenPipeError:
+            pass
+
+    timed = job.get("timed")
+    max_runs = job.get("max_runs", 5)
+    min_total = job.get("min_total", 0.05)
+    message = receive()
+    if message is not None and "load_error" in message:
+        send({"error": message["load_error"]})
+        return
+
+    results = []
+    for case in job["cases"]:
+        entry = {}
+        best = None
+        total = 0.0
+        runs = 0
+        while (message is not None and message.get("ready") and "error" not in entry
+               and (runs == 0 or (timed and runs < max_runs and total < min_total))):
+            start = time.perf_counter()
+            command(b"g")
+            reply = receive()
+            elapsed = time.perf_counter() - start
+            if reply is None:
+                message = None
+                break
+            runs += 1
+            total += elapsed
+            best = elapsed if best is None else min(best, elapsed)
+            if "error" in reply:
+                entry["error"] = str(reply["error"])
+            elif not timed:
+                entry["actual_output"] = str(reply.get("output", ""))
+            message = receive()
+        if runs == 0 and "error" not in entry:
+            # Anything but a ready worker means the solution broke the protocol
+            entry["error"] = "Solution process exited" if message is None else "Solution interfered with the harness"
+            message = None
+        elif message is None and "error" not in entry:
+            entry["error"] = "Solution process exited"
+        if "error" in entry:
+            entry["pass"] = False
+        elif timed:
+            entry["seconds"] = best
+            entry["runs"] = runs
+        elif "expected" in case:
+            entry["pass"] = matches(entry["actual_output"], case["expected"])
+        results.append(entry)
+        send({"partial": entry})
+        if message is None:
+            break
+        command(b"n")
+        message = receive()
+
+    send({"results": results})
+    os.kill(worker, 9)
+
+main()
+"""
+
+def code_execution_enabled() -> bool:
+    try:
+        with open(SETTINGS_FILE, 'r') as f:
+            return json.load(f).get('code_execution_enabled') is True
+    except (FileNotFoundError, json.JSONDecodeError, AttributeError):
+        return False
+
+def code_execution_allowed(client_host: Optional[str], origin: Optional[str] = None) -> bool:
+    """Whether a request may run code: execution is enabled and the request comes from a local client and page"""
+    if not code_execution_enabled() or client_host not in LOCAL_HOSTS:
+        return False
+    return not origin or urlparse(origin).hostname in LOCAL_HOSTS
+
+def _limit_resources(timeout: float):
+    """Cap memory, CPU and file size of the child process (POSIX only)."""
+    try:
+        import resource
+        # Past the wall-clock timeout, so a CPU-bound run is reported as timed out, not killed by SIGXCPU
+        cpu_seconds = math.ceil(timeout) + 1
+        resource.setrlimit(resource.RLIMIT_AS, (SANDBOX_MEMORY_BYTES, SANDBOX_MEMORY_BYTES))
+        resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+        resource.setrlimit(resource.RLIMIT_FSIZE, (SANDBOX_FILE_BYTES, SANDBOX_FILE_BYTES))
+    except (ImportError, ValueError, OSError):
+        pass
+
+def _kill_group(process: subprocess.Popen):
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError, AttributeError):
+        process.kill()
+
+def run_in_sandbox(code: str, function_name: str, cases: List[Dict[str, Any]],
+                   timed: bool = False, timeout: float = SANDBOX_TIMEOUT_SECONDS) -> Dict[str, Any]:
+    """
+    Run a function from untrusted code in a resource-limited Python subprocess (see the
+    limits above: this guards against runaway code, not against hostile file or network access).
+    Callers check code_execution_allowed for the request first; nothing runs while it is disabled.
+    Each case has 'args' (a Python literal of the argument tuple) and optionally 'expected'.
+    Returns {'results': [...]} or {'error': ..., 'results': [...completed so far]}.
+    """
+    if not code_execution_enabled():
+        return {'error': CODE_EXECUTION_DISABLED, 'results': []}
+    nonce = secrets.token_hex(16)
+    read_fd, write_fd = os.pipe()
+    job = json.dumps({
+        'code': code,
+        'function_name': function_name,
+        'cases': cases,
+        'timed': timed,
+        'channel': write_fd,
+        'nonce': nonce
+    })
+
+    lines = []
+    with tempfile.TemporaryDirectory() as workdir, os.fdopen(read_fd, 'r') as channel:
+        try:
+            process = subprocess.Popen(
+                [sys.executable, '-I', '-c', _HARNESS],
+                start_new_session=True,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                text=True,
+                cwd=workdir,
+                env={'PATH': os.environ.get('PATH', '')},
+                pass_fds=(write_fd,),
+                preexec_fn=functools.partial(_limit_resources, timeout) if os.name == 'posix' else None
+            )
+        finally:
+            # Only the child may hold the write end, so the reader sees EOF when it exits
+            os.close(write_fd)
+
+        # Read the channel while the child runs so a full pipe cannot stall it
+        def read():
+            try:
+                lines.extend(channel)
+            except (ValueError, OSError):
+                pass
+        reader = threading.Thread(target=read, daemon=True)
+        reader.start()
+        try:
+            process.communicate(input=job, timeout=timeout)
+            timed_out = False
+        except subprocess.TimeoutExpired:
+            timed_out = True
+        finally:
+            # The harness and its worker share a process group; nothing in it outlives the run
+            _kill_group(process)
+            process.wait()
+        # A process the solution spawned could keep the pipe open; don't wait on it
+        reader.join(1)
+
+    partial = []
+    for line in list(lines):
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if not isinstance(message, dict) or message.pop('nonce', None) != nonce:
+            continue
+        if 'partial' in message:
+            partial.append(message['partial'])
+        elif 'results' in message or 'error' in message:
+            message.setdefault('results', partial)
+            return message
+
+    if timed_out:
+        return {'error': f'Timed out after {timeout} seconds', 'results': partial}
+    return {'error': 'Sandbox exited without a result', 'results': partial}
+
+def run_test_suite(code: str, suite: Dict[str, Any], timeout: float = SANDBOX_TIMEOUT_SECONDS) -> Dict[str, Any]:
+    """
+    Run code against the compiled cases of a test suite.
+    Returns {'correct', 'test_results', 'error'} in the same shape the verifier uses.
+    """
+    cases = [{'args': repr(case['args']), 'expected': repr(case['expected'])} for case in suite['cases']]
+    outcome = run_in_sandbox(code, suite['function_name'], cases, timeout=timeout)
+    results = outcome.get('results', [])
+
+    test_results = []
+    for i, case in enumerate(suite['cases']):
+        result = results[i] if i < len(results) else {'error': outcome.get('error', 'Not run'), 'pass': False}
+        test_results.append({
+            'input': ', '.join(repr(arg) for arg in case['args']),
+            'expected_output': repr(case['expected']),
+            'actual_output': result.get('actual_output', result.get('error', '')),
+            'pass': result.get('pass', False)
+        })
+
+    return {
+        'correct': bool(test_results) and not outcome.get('error') and all(t['pass'] for t in test_results),
+        'test_results': test_results,
+        'error': outcome.get('error')
+    }
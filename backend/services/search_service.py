@@ -0,0 +1,353 @@
+import atexit
+import hashlib
+import html
+import json
+import math
+import os
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from typing import Dict, List, Any, Iterable, Optional
+
+# Path to data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+SEARCH_INDEX_FILE = os.path.join(DATA_DIR, 'search_index.json')
+
+# Searchable document types; courses and lessons are indexed from the same source
+DOCUMENT_TYPES = ('course', 'lesson', 'challenge', 'flashcard', 'chat')
+SOURCE_TYPES = {'courses': ('course', 'lesson'), 'challenges': ('challenge',),
+                'flashcards': ('flashcard',), 'chats': ('chat',)}
+
+# BM25 parameters; title terms count as if they appeared TITLE_WEIGHT times
+BM25_K1 = 1.2
+BM25_B = 0.75
+TITLE_WEIGHT = 3
+
+# Query terms also match longer terms starting with them, at a lower weight
+PREFIX_WEIGHT = 0.5
+MIN_PREFIX_LENGTH = 3
+MAX_PREFIX_EXPANSIONS = 20
+
+SNIPPET_CHARS = 160
+
+# Bump when tokenization changes so persisted indexes are rebuilt
+INDEX_VERSION = 1
+
+# The index is written to disk at most this often (and at exit)
+FLUSH_INTERVAL_SECONDS = 30
+
+_WORD = re.compile(r'[A-Za-z0-9_]+')
+_CAMEL = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+')
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lowercase terms from markdown or code. Identifiers are kept whole and also split
+    on snake_case and camelCase, so 'list_comprehension' and 'getElementById' match their parts.
+    """
+    tokens = []
+    for word in _WORD.findall(text or ''):
+        whole = word.lower()
+        tokens.append(whole)
+        parts = [part.lower() for chunk in word.split('_') for part in _CAMEL.findall(chunk)]
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part != whole)
+    return tokens
+
+_lock = threading.RLock()
+_state = None
+_synced = False
+_dirty = False
+_last_flush = 0.0
+
+def _new_state() -> Dict[str, Any]:
+    return {
+        'docs': {},         # doc_id -> {'type', 'id', 'title', 'text', 'meta', 'hash', 'length', 'terms'}
+        'postings': {},     # term -> {doc_id: weighted term frequency}
+        'vocabulary': [],   # all terms, sorted, for prefix matching
+        'total_length': 0
+    }
+
+def _add_postings(state: Dict[str, Any], doc_id: str, doc: Dict[str, Any]):
+    for term, frequency in doc['terms'].items():
+        postings = state['postings'].get(term)
+        if postings is None:
+            postings = state['postings'][term] = {}
+            insort(state['vocabulary'], term)
+        postings[doc_id] = frequency
+    state['total_length'] += doc['length']
+
+def _remove(state: Dict[str, Any], doc_id: str):
+    doc = state['docs'].pop(doc_id, None)
+    if doc is None:
+        return
+    for term in doc['terms']:
+        postings = state['postings'].get(term, {})
+        postings.pop(doc_id, None)
+        if not postings:
+            state['postings'].pop(term, None)
+            position = bisect_left(state['vocabulary'], term)
+            if position < len(state['vocabulary']) and state['vocabulary'][position] == term:
+                del state['vocabulary'][position]
+    state['total_length'] -= doc['length']
+
+def _load_state() -> Dict[str, Any]:
+    """Load the persisted index; postings are rebuilt from stored term counts without re-tokenizing"""
+    global _state, _last_flush
+    if _state is not None:
+        return _state
+    state = _new_state()
+    if os.path.exists(SEARCH_INDEX_FILE):
+        try:
+            with open(SEARCH_INDEX_FILE, 'r') as f:
+                stored = json.load(f)
+            if stored.get('version') == INDEX_VERSION:
+                for doc_id, doc in stored.get('docs', {}).items():
+                    state['docs'][doc_id] = doc
+                    _add_postings(state, doc_id, doc)
+        except (json.JSONDecodeError, KeyError, TypeError):
+            state = _new_state()
+    _state = state
+    _last_flush = time.time()
+    return _state
+
+def _flush(force: bool = False):
+    global _dirty, _last_flush
+    if not _dirty or (not force and time.time() - _last_flush < FLUSH_INTERVAL_SECONDS):
+        return
+    os.makedirs(DATA_DIR, exist_ok=True)
+    temp_file = SEARCH_INDEX_FILE + '.tmp'
+    with open(temp_file, 'w') as f:
+        json.dump({'version': INDEX_VERSION, 'docs': _state['docs']}, f)
+    os.replace(temp_file, SEARCH_INDEX_FILE)
+    _dirty = False
+    _last_flush = time.time()
+
+def flush_index():
+    """Write pending index changes to disk now"""
+    with _lock:
+        if _state is not None:
+            _flush(force=True)
+
+atexit.register(flush_index)
+
+def _document(doc_type: str, doc_id: Any, title: str, text: str, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    return {'type': doc_type, 'id': doc_id, 'title': title or '', 'text': text or '', 'meta': meta or {}}
+
+def _content_hash(doc: Dict[str, Any]) -> str:
+    source = json.dumps([doc['title'], doc['text'], doc['meta']], sort_keys=True, default=str)
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+def _upsert(state: Dict[str, Any], doc: Dict[str, Any]) -> bool:
+    """Index one document unless it is unchanged; returns True if the index changed"""
+    global _dirty
+    doc_id = f"{doc['type']}:{doc['id']}"
+    content_hash = _content_hash(doc)
+    existing = state['docs'].get(doc_id)
+    if existing and existing['hash'] == content_hash:
+        return False
+    _remove(state, doc_id)
+
+    terms = {}
+    for term in tokenize(doc['text']):
+        terms[term] = terms.get(term, 0) + 1
+    for term in tokenize(doc['title']):
+        terms[term] = terms.get(term, 0) + TITLE_WEIGHT
+    stored = {**doc, 'hash': content_hash, 'length': sum(terms.values()), 'terms': terms}
+    state['docs'][doc_id] = stored
+    _add_postings(state, doc_id, stored)
+    _dirty = True
+    return True
+
+# Source data -> documents
+
+def _course_documents(courses: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    docs = []
+    for course in courses:
+        docs.append(_document('course', course.get('id'), course.get('title', ''),
+                              course.get('description', ''), {'difficulty': course.get('difficulty', '')}))
+        for lesson in course.get('lessons', []):
+            text = f"{lesson.get('description', '')}\n{lesson.get('content', '')}"
+            docs.append(_document('lesson', lesson.get('id'), lesson.get('title', ''), text,
+                                  {'course_id': course.get('id'), 'course_title': course.get('title', '')}))
+    return docs
+
+def _challenge_documents(challenges: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [_document('challenge', challenge.get('id'), challenge.get('title', ''),
+                      f"{challenge.get('description', '')}\n{challenge.get('template', '')}",
+                      {'difficulty': challenge.get('difficulty', ''), 'topic': challenge.get('topic', ''),
+                       'language': challenge.get('language', '')})
+            for challenge in challenges]
+
+def _flashcard_documents(flashcards: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [_document('flashcard', card.get('id'), card.get('term', ''), card.get('definition', ''),
+                      {'topic': card.get('topic', ''), 'language': card.get('language', ''),
+                       'difficulty': card.get('difficulty', '')})
+            for card in flashcards]
+
+def _chat_documents(chats: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [_document('chat', chat.get('id'), chat.get('name', ''),
+                      '\n'.join(str(message.get('content', '')) for message in chat.get('messages', [])))
+            for chat in chats]
+
+_SOURCE_DOCUMENTS = {
+    'courses': _course_documents,
+    'challenges': _challenge_documents,
+    'flashcards': _flashcard_documents,
+    'chats': _chat_documents
+}
+
+def sync_source(source: str, items: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Bring one source ('courses', 'challenges', 'flashcards', 'chats') in line with its
+    full current contents. Only new or changed documents are tokenized; missing ones are removed.
+    Called by the services whenever they save a source.
+    """
+    docs = _SOURCE_DOCUMENTS[source](items)
+    with _lock:
+        state = _load_state()
+        changed = [doc for doc in docs if doc['id'] is not None and _upsert(state, doc)]
+        current = {f"{doc['type']}:{doc['id']}" for doc in docs}
+        stale = [doc_id for doc_id, doc in state['docs'].items()
+                 if doc['type'] in SOURCE_TYPES[source] and doc_id not in current]
+        for doc_id in stale:
+            _remove(state, doc_id)
+        if changed or stale:
+            global _dirty
+            _dirty = True
+            _flush()
+        changed_docs = {f"{doc['type']}:{doc['id']}": state['docs'][f"{doc['type']}:{doc['id']}"] for doc in changed}
+
+    if changed_docs or stale:
+        # Tutor retrieval chunks the same lesson and challenge documents
+        from .retrieval_service import update_documents
+        update_documents(changed_docs, stale)
+    return {'changed': len(changed), 'removed': len(stale)}
+
+def index_flashcards(flashcards: List[Dict[str, Any]]):
+    """Index added or updated flashcards"""
+    with _lock:
+        state = _load_state()
+        for doc in _flashcard_documents(flashcards):
+            _upsert(state, doc)
+        _flush()
+
+def remove_flashcard(flashcard_id: int):
+    """Drop a deleted flashcard from the index"""
+    global _dirty
+    with _lock:
+        _remove(_load_state(), f"flashcard:{flashcard_id}")
+        _dirty = True
+        _flush()
+
+def _load_sources() -> Dict[str, List[Dict[str, Any]]]:
+    from .course_service import CourseService
+    from .challenge_service import load_challenges
+    from .flashcard_service import load_flashcards
+    from .chat_service import load_chats
+
+    return {
+        'courses': CourseService().get_all_courses(),
+        'challenges': load_challenges(),
+        'flashcards': load_flashcards(),
+        'chats': load_chats()
+    }
+
+def ensure_synced():
+    """On first use, reconcile the persisted index with the data files (changes made while the server was down)"""
+    global _synced
+    if _synced:
+        return
+    for source, items in _load_sources().items():
+        sync_source(source, items)
+    _synced = True
+
+def get_documents(types: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Indexed documents of the given types by doc id ('lesson:<id>'), with their content hash"""
+    wanted = set(types)
+    with _lock:
+        return {doc_id: doc for doc_id, doc in _load_state()['docs'].items() if doc['type'] in wanted}
+
+def rebuild_index() -> Dict[str, Any]:
+    """Re-tokenize every document from scratch"""
+    global _state, _dirty
+    with _lock:
+        _state = _new_state()
+        _dirty = True
+    counts = {source: sync_source(source, items)['changed'] for source, items in _load_sources().items()}
+    flush_index()
+    return {'success': True, 'documents': counts}
+
+def _expand(state: Dict[str, Any], term: str) -> Dict[str, float]:
+    """Index terms a query term matches: itself, plus longer terms it is a prefix of"""
+    matches = {term: 1.0} if term in state['postings'] else {}
+    if len(term) >= MIN_PREFIX_LENGTH:
+        vocabulary = state['vocabulary']
+        position = bisect_left(vocabulary, term)
+        expansions = 0
+        while position < len(vocabulary) and vocabulary[position].startswith(term) and expansions < MAX_PREFIX_EXPANSIONS:
+            if vocabulary[position] != term:
+                matches[vocabulary[position]] = PREFIX_WEIGHT
+                expansions += 1
+            position += 1
+    return matches
+
+def _snippet(text: str, terms: List[str]) -> str:
+    """A short piece of text around the first query match, with matches wrapped in <mark>"""
+    lowered = text.lower()
+    positions = [lowered.find(term) for term in terms if term and lowered.find(term) >= 0]
+    start = max(0, min(positions) - SNIPPET_CHARS // 3) if positions else 0
+    piece = ' '.join(text[start:start + SNIPPET_CHARS].split())
+    piece = html.escape(piece)
+    if terms:
+        pattern = re.compile('|'.join(re.escape(term) for term in sorted(set(terms), key=len, reverse=True)),
+                             re.IGNORECASE)
+        piece = pattern.sub(lambda match: f"<mark>{match.group(0)}</mark>", piece)
+    return ('…' if start > 0 else '') + piece + ('…' if start + SNIPPET_CHARS < len(text) else '')
+
+def search(query: str, types: Optional[List[str]] = None, limit: int = 20) -> Dict[str, Any]:
+    """
+    BM25-ranked search across courses, lessons, challenges, flashcards and chats.
+    Raises ValueError for unknown types.
+    """
+    types = [t for t in (types or []) if t]
+    unknown = [t for t in types if t not in DOCUMENT_TYPES]
+    if unknown:
+        raise ValueError(f"Unknown types: {', '.join(unknown)} (expected {', '.join(DOCUMENT_TYPES)})")
+    wanted = set(types or DOCUMENT_TYPES)
+    query_terms = list(dict.fromkeys(tokenize(query)))
+
+    ensure_synced()
+    with _lock:
+        state = _load_state()
+        total_docs = len(state['docs']) or 1
+        average_length = (state['total_length'] / total_docs) or 1
+        scores = {}
+        matched_terms = {}
+        for query_term in query_terms:
+            for term, weight in _expand(state, query_term).items():
+                postings = state['postings'][term]
+                idf = math.log(1 + (total_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, frequency in postings.items():
+                    doc = state['docs'][doc_id]
+                    if doc['type'] not in wanted:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * doc['length'] / average_length)
+                    scores[doc_id] = scores.get(doc_id, 0) + weight * idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+                    matched_terms.setdefault(doc_id, set()).add(term)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+        results = []
+        for doc_id, score in ranked:
+            doc = state['docs'][doc_id]
+            terms = sorted(matched_terms[doc_id])
+            results.append({
+                'type': doc['type'],
+                'id': doc['id'],
+                'title': doc['title'],
+                'score': round(score, 4),
+                'snippet': _snippet(doc['text'] or doc['title'], terms),
+                'meta': doc['meta']
+            })
+
+    return {'query': query, 'types': sorted(wanted), 'total': len(scores), 'results': results}
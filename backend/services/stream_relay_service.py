@@ -0,0 +1,198 @@
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Dict, Iterator, Any, Optional
+
+# A relay runs a tutor generation on its own thread and keeps its latest chunks in a
+# ring buffer, so a client whose connection drops can reconnect with Last-Event-ID and
+# continue from the exact chunk instead of the model generating the answer again.
+RING_EVENTS = 4096
+
+# Comment lines sent while no chunk arrives, so proxies keep the connection open
+HEARTBEAT_SECONDS = 15
+
+# The generation is cancelled once no client has been attached for this long. Cancelling
+# ends the stream for clients at once; the model itself is stopped when it produces its
+# next chunk, since a running generator can only be closed from its own thread.
+GRACE_SECONDS = 30
+
+# Finished streams stay available for reconnects this long
+RETAIN_SECONDS = 120
+
+# Response headers for SSE: no caching and no proxy buffering of the event stream
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Stream states
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'error'
+CANCELLED = 'cancelled'
+
+class StreamRelay:
+    """One generation, its buffered chunks and the clients attached to it."""
+
+    def __init__(self, source: Iterator[str]):
+        self.id = uuid.uuid4().hex
+        self.state = RUNNING
+        self.error = None
+        self.events = deque(maxlen=RING_EVENTS)    # (sequence number, text)
+        self.next_seq = 1
+        self.attached = 0
+        self.detached_at = time.monotonic()        # no client yet counts as detached
+        self.finished_at = None
+        self._source = source
+        self._condition = threading.Condition()
+
+    def start(self):
+        threading.Thread(target=self._produce, name=f"stream-{self.id}", daemon=True).start()
+        self._watch_grace()
+
+    def _watch_grace(self):
+        """Cancel the stream if it is still unattached when the grace period runs out"""
+        timer = threading.Timer(GRACE_SECONDS + 0.1, self._check_grace)
+        timer.daemon = True
+        timer.start()
+
+    def _check_grace(self):
+        with self._condition:
+            abandoned = self.attached == 0 and time.monotonic() - self.detached_at > GRACE_SECONDS
+        if abandoned:
+            self.cancel()
+
+    def _finish(self, state: str, error: Optional[str] = None) -> bool:
+        """End the stream for its clients; False if it had already ended"""
+        with self._condition:
+            if self.state != RUNNING:
+                return False
+            self.state = state
+            self.error = error
+            self.finished_at = time.monotonic()
+            self._condition.notify_all()
+            return True
+
+    def _produce(self):
+        try:
+            for text in self._source:
+                with self._condition:
+                    cancelled = self.state != RUNNING
+                    if not cancelled:
+                        self.events.append((self.next_seq, text))
+                        self.next_seq += 1
+                        self._condition.notify_all()
+                if cancelled:
+                    # Cancelled while the model was working on this chunk. Closing the
+                    # source stops the model and lets wrappers save the partial answer.
+                    self._source.close()
+                    return
+            self._finish(DONE)
+        except Exception as e:
+            print(f"Stream {self.id} failed: {e}")
+            self._finish(FAILED, str(e))
+
+    def cancel(self):
+        """
+        End the stream now: clients get the 'cancelled' event and status() reports it at once.
+        The model stops when its next chunk arrives (see GRACE_SECONDS).
+        """
+        self._finish(CANCELLED)
+
+    def subscribe(self, last_event_id: int = 0) -> Iterator[str]:
+        """
+        SSE frames for every chunk after last_event_id, then new chunks as they arrive,
+        heartbeat comments while waiting and a final 'done', 'error' or 'cancelled' event.
+        """
+        with self._condition:
+            self.attached += 1
+        try:
+            yield f"event: stream\ndata: {json.dumps({'stream_id': self.id})}\n\n"
+            position = last_event_id
+            finished = False
+            while not finished:
+                with self._condition:
+                    oldest = self.events[0][0] if self.events else self.next_seq
+                    if position + 1 < oldest:
+                        # The chunks after position have left the ring buffer
+                        frames = [self._frame('error', {'error': 'Resume point is no longer buffered',
+                                                        'oldest_event_id': f"{self.id}:{oldest}"})]
+                        finished = True
+                    else:
+                        pending = [(seq, text) for seq, text in self.events if seq > position]
+                        if not pending and self.state == RUNNING:
+                            self._condition.wait(HEARTBEAT_SECONDS)
+                            pending = [(seq, text) for seq, text in self.events if seq > position]
+                        frames = [f"id: {self.id}:{seq}\nevent: chunk\ndata: {json.dumps({'text': text})}\n\n"
+                                  for seq, text in pending]
+                        if pending:
+                            position = pending[-1][0]
+                        if self.state != RUNNING and position + 1 >= self.next_seq:
+                            frames.append(self._frame(self.state, {'error': self.error} if self.error else {}))
+                            finished = True
+                        elif not frames:
+                            frames = [": heartbeat\n\n"]
+                for frame in frames:
+                    yield frame
+        finally:
+            with self._condition:
+                self.attached -= 1
+                detached = self.attached == 0 and self.state == RUNNING
+                if detached:
+                    self.detached_at = time.monotonic()
+            if detached:
+                self._watch_grace()
+
+    def _frame(self, event: str, data: Dict[str, Any]) -> str:
+        return f"event: {event}\ndata: {json.dumps({'stream_id': self.id, **data})}\n\n"
+
+    def status(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                'stream_id': self.id,
+                'state': self.state,
+                'events': self.next_seq - 1,
+                'buffered_from': self.events[0][0] if self.events else None,
+                'attached': self.attached,
+                'error': self.error
+            }
+
+_lock = threading.Lock()
+_relays = {}    # stream id -> StreamRelay
+
+def _sweep():
+    """Forget finished streams past their retention"""
+    now = time.monotonic()
+    with _lock:
+        for stream_id in [stream_id for stream_id, relay in _relays.items()
+                          if relay.finished_at is not None and now - relay.finished_at > RETAIN_SECONDS]:
+            del _relays[stream_id]
+
+def start_stream(source: Iterator[str]) -> StreamRelay:
+    """Run a generation in the background and return its relay"""
+    _sweep()
+    relay = StreamRelay(source)
+    with _lock:
+        _relays[relay.id] = relay
+    relay.start()
+    return relay
+
+def get_stream(stream_id: str) -> Optional[StreamRelay]:
+    _sweep()
+    with _lock:
+        return _relays.get(stream_id)
+
+def parse_last_event_id(value: Optional[str]) -> Dict[str, Any]:
+    """'<stream id>:<n>' (or just '<n>') from a Last-Event-ID header; raises ValueError if malformed"""
+    if not value:
+        return {'stream_id': None, 'seq': 0}
+    stream_id, _, seq = value.rpartition(':')
+    try:
+        return {'stream_id': stream_id or None, 'seq': int(seq)}
+    except ValueError:
+        raise ValueError(f"Invalid Last-Event-ID: {value}")
+
+def stream_stats() -> Dict[str, Any]:
+    _sweep()
+    with _lock:
+        relays = list(_relays.values())
+    return {'streams': [relay.status() for relay in relays]}
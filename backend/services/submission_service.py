@@ -0,0 +1,227 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Dict, List, Any, Optional
+
+from .analytics_service import record_submission_event
+
+# Path to data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+SUBMISSIONS_FILE = os.path.join(DATA_DIR, 'submission_history.jsonl')
+CHALLENGE_OPENS_FILE = os.path.join(DATA_DIR, 'challenge_opens.json')
+
+# In-memory index over the append-only log: byte offsets of each record
+_lock = threading.Lock()
+_index = None
+
+def _new_index() -> Dict[str, Any]:
+    return {
+        'offsets': [],          # offset of every record, in log order
+        'by_user': {},          # user_id -> [record number]
+        'by_challenge': {},     # challenge_id -> [record number]
+        'solved': set()         # (user_id, challenge_id) with an accepted submission
+    }
+
+def _index_record(index: Dict[str, Any], record: Dict[str, Any], offset: int):
+    """Add one record to the in-memory index"""
+    number = len(index['offsets'])
+    index['offsets'].append(offset)
+    index['by_user'].setdefault(record['user_id'], []).append(number)
+    index['by_challenge'].setdefault(record['challenge_id'], []).append(number)
+    if record.get('verdict') == 'accepted':
+        index['solved'].add((record['user_id'], record['challenge_id']))
+
+def _load_index() -> Dict[str, Any]:
+    """Build the index with one scan of the log the first time it is needed"""
+    global _index
+    if _index is not None:
+        return _index
+
+    index = _new_index()
+    torn_at = None
+    if os.path.exists(SUBMISSIONS_FILE):
+        with open(SUBMISSIONS_FILE, 'rb') as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # A torn final line from an interrupted write
+                    torn_at = offset
+                elif line.strip():
+                    try:
+                        _index_record(index, json.loads(line), offset)
+                    except json.JSONDecodeError:
+                        pass
+                offset += len(line)
+    if torn_at is not None:
+        # Cut it off so the next append starts on a line of its own
+        with open(SUBMISSIONS_FILE, 'r+b') as f:
+            f.truncate(torn_at)
+    _index = index
+    return _index
+
+def _read_records(offsets: List[int]) -> List[Dict[str, Any]]:
+    """Read records at the given byte offsets"""
+    records = []
+    with open(SUBMISSIONS_FILE, 'rb') as f:
+        for offset in offsets:
+            f.seek(offset)
+            records.append(json.loads(f.readline()))
+    return records
+
+def load_challenge_opens() -> Dict[str, Any]:
+    """Load when each user last opened each challenge"""
+    if not os.path.exists(CHALLENGE_OPENS_FILE):
+        return {}
+    with open(CHALLENGE_OPENS_FILE, 'r') as f:
+        return json.load(f)
+
+def save_challenge_opens(opens: Dict[str, Any]):
+    """Save challenge open times to JSON file"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(CHALLENGE_OPENS_FILE, 'w') as f:
+        json.dump(opens, f, indent=2)
+
+def record_challenge_opened(user_id: str, challenge_id: int) -> str:
+    """Remember when a user opened a challenge so solve time can be measured"""
+    opened_at = datetime.now().isoformat()
+    with _lock:
+        opens = load_challenge_opens()
+        opens.setdefault(user_id, {})[str(challenge_id)] = opened_at
+        save_challenge_opens(opens)
+    return opened_at
+
+def _seconds_since_opened(user_id: str, challenge_id: int, now: datetime) -> Optional[float]:
+    opened_at = load_challenge_opens().get(user_id, {}).get(str(challenge_id))
+    if not opened_at:
+        return None
+    try:
+        return round((now - datetime.fromisoformat(opened_at)).total_seconds(), 3)
+    except (ValueError, TypeError):
+        return None
+
+def _update_average_challenge_time(user_id: str, seconds: float):
+    """Fold one solve time into the user's running average without rescanning the log"""
+    from .challenge_service import load_progress, save_progress
+
+    progress = load_progress()
+    user_progress = progress.get(user_id)
+    if not user_progress:
+        return
+    stats = user_progress.setdefault('stats', {})
+    count = stats.get('timed_challenges_completed', 0) + 1
+    average = stats.get('average_challenge_time', 0)
+    stats['timed_challenges_completed'] = count
+    stats['average_challenge_time'] = round(average + (seconds - average) / count, 3)
+    save_progress(progress)
+
+def record_submission(user_id: str, challenge_id: int, user_code: str, result: Dict[str, Any],
+                      verification_ms: float, source: str = 'verify', timed: bool = True,
+                      topic: str = '') -> Dict[str, Any]:
+    """
+    Append one verification to the submission log and update the indexes and analytics rollups.
+    The first accepted submission of a challenge also updates the user's average solve time.
+    Set timed=False for regrades, where the time since opening is meaningless.
+    """
+    now = datetime.now()
+    if result.get('error'):
+        verdict = 'error'
+    else:
+        verdict = 'accepted' if result.get('correct') else 'failed'
+
+    record = {
+        'timestamp': now.isoformat(),
+        'user_id': user_id,
+        'challenge_id': challenge_id,
+        'topic': topic,
+        'source': source,
+        'code_hash': hashlib.sha256(user_code.encode('utf-8')).hexdigest(),
+        'verdict': verdict,
+        'perfect_solution': bool(result.get('perfect_solution')),
+        'test_results': [{
+            'input': str(test.get('input', '')),
+            'expected_output': str(test.get('expected_output', '')),
+            'actual_output': str(test.get('actual_output', '')),
+            'pass': bool(test.get('pass', False))
+        } for test in result.get('test_results', [])],
+        'verification_ms': round(verification_ms, 1),
+        'seconds_since_opened': _seconds_since_opened(user_id, challenge_id, now) if timed else None
+    }
+
+    line = (json.dumps(record) + '\n').encode('utf-8')
+    with _lock:
+        index = _load_index()
+        first_solve = verdict == 'accepted' and (user_id, challenge_id) not in index['solved']
+
+        os.makedirs(DATA_DIR, exist_ok=True)
+        with open(SUBMISSIONS_FILE, 'ab') as f:
+            offset = f.tell()
+            try:
+                f.write(line)
+                f.flush()
+            except OSError:
+                # Don't leave a partial line for the next append to land on
+                f.truncate(offset)
+                raise
+        _index_record(index, record, offset)
+
+        if first_solve and record['seconds_since_opened'] is not None:
+            _update_average_challenge_time(user_id, record['seconds_since_opened'])
+
+        record_submission_event(record, first_solve)
+
+    return record
+
+def iter_submissions() -> List[Dict[str, Any]]:
+    """Every submission in log order"""
+    with _lock:
+        _load_index()
+        if not os.path.exists(SUBMISSIONS_FILE):
+            return []
+        records = []
+        with open(SUBMISSIONS_FILE, 'rb') as f:
+            for line in f:
+                if line.strip():
+                    try:
+                        records.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        pass
+        return records
+
+def query_submissions(user_id: Optional[str] = None, challenge_id: Optional[int] = None,
+                      offset: int = 0, limit: int = 20) -> Dict[str, Any]:
+    """
+    Get a page of submissions, newest first, filtered by user and/or challenge.
+    Only the records on the requested page are read from disk.
+    """
+    with _lock:
+        index = _load_index()
+        if user_id is not None and challenge_id is not None:
+            # Filter the shorter list by membership in the longer one
+            by_user = index['by_user'].get(user_id, [])
+            by_challenge = index['by_challenge'].get(challenge_id, [])
+            shorter, longer = sorted((by_user, by_challenge), key=len)
+            longer = set(longer)
+            numbers = [n for n in shorter if n in longer]
+        elif user_id is not None:
+            numbers = index['by_user'].get(user_id, [])
+        elif challenge_id is not None:
+            numbers = index['by_challenge'].get(challenge_id, [])
+        else:
+            numbers = range(len(index['offsets']))
+
+        total = len(numbers)
+        start = max(0, total - offset - limit)
+        end = max(0, total - offset)
+        page = [index['offsets'][n] for n in reversed(list(numbers[start:end]))]
+        submissions = _read_records(page) if page else []
+
+    next_offset = offset + limit if offset + limit < total else None
+    return {
+        'submissions': submissions,
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'next_offset': next_offset
+    }
@@ -0,0 +1,236 @@
+import ast
+import hashlib
+import json
+import os
+from typing import Dict, List, Any, Tuple
+
+# Path to data files
+DATA_DIR = os.path.join(os.path.dirname(__file__), '../data')
+TEST_SUITES_FILE = os.path.join(DATA_DIR, 'test_suites.json')
+
+# Bump whenever the compiled layout changes so stored suites get recompiled
+SUITE_VERSION = 1
+
+# Compiled suites kept in memory, keyed by challenge id
+_suite_cache: Dict[int, Dict[str, Any]] = {}
+
+def load_test_suites() -> Dict[str, Any]:
+    """Load stored test suites from JSON file"""
+    if not os.path.exists(TEST_SUITES_FILE):
+        return {}
+    try:
+        with open(TEST_SUITES_FILE, 'r') as f:
+            return json.load(f)
+    except json.JSONDecodeError:
+        return {}
+
+def save_test_suites(suites: Dict[str, Any]):
+    """Save test suites to JSON file"""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    with open(TEST_SUITES_FILE, 'w') as f:
+        json.dump(suites, f, indent=2)
+
+def parse_signature(template: str) -> Tuple[str, List[str]]:
+    """
+    Extract the function name and positional parameter names from a challenge template.
+    Raises ValueError if the template does not define a function.
+    """
+    try:
+        tree = ast.parse(template)
+    except SyntaxError as e:
+        raise ValueError(f"Template is not valid Python: {e.msg}")
+
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            params = [arg.arg for arg in node.args.posonlyargs + node.args.args]
+            return node.name, params
+
+    raise ValueError("Template does not define a function")
+
+def _split_arguments(text: str) -> List[str]:
+    """Split an argument string on top-level commas, ignoring commas inside brackets or quotes."""
+    parts = []
+    depth = 0
+    quote = None
+    current = ''
+    for i, char in enumerate(text):
+        if quote:
+            current += char
+            if char == quote and text[i - 1] != '\\':
+                quote = None
+            continue
+        if char in '"\'':
+            quote = char
+        elif char in '([{':
+            depth += 1
+        elif char in ')]}':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(current.strip())
+            current = ''
+            continue
+        current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+def _parse_literal(text: str) -> Any:
+    """Parse a single literal, treating bare words as plain strings."""
+    try:
+        return ast.literal_eval(text)
+    except (ValueError, SyntaxError):
+        if any(char in text for char in '()[]{}'):
+            raise ValueError(f"Cannot parse value: {text}")
+        return text
+
+def _parse_input(raw: Any, params: List[str]) -> tuple:
+    """Turn an example input into a tuple of positional arguments matching the signature."""
+    if isinstance(raw, dict) and params and set(raw.keys()) == set(params):
+        return tuple(raw[name] for name in params)
+
+    if not isinstance(raw, str):
+        args = (raw,)
+    elif len(params) == 1:
+        try:
+            args = (ast.literal_eval(raw),)
+        except (ValueError, SyntaxError):
+            args = (_parse_literal(raw.strip()),)
+    else:
+        try:
+            parsed = ast.literal_eval(f"({raw},)")
+            args = tuple(parsed)
+        except (ValueError, SyntaxError):
+            args = tuple(_parse_literal(part) for part in _split_arguments(raw))
+
+    if len(args) != len(params):
+        raise ValueError(f"Expected {len(params)} argument(s) ({', '.join(params)}) but input has {len(args)}")
+    return args
+
+def _parse_output(raw: Any) -> Any:
+    """Turn an example output into a typed expected value."""
+    if not isinstance(raw, str):
+        return raw
+    try:
+        return ast.literal_eval(raw)
+    except (ValueError, SyntaxError):
+        # Plain string outputs like "bab" are the expected value themselves
+        return raw
+
+def _fingerprint(challenge: Dict[str, Any]) -> str:
+    """Hash the parts of a challenge the suite is compiled from."""
+    source = json.dumps({
+        'version': SUITE_VERSION,
+        'template': challenge.get('template', ''),
+        'examples': challenge.get('examples', [])
+    }, sort_keys=True, default=str)
+    return hashlib.sha1(source.encode('utf-8')).hexdigest()
+
+def compile_test_suite(challenge: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compile a challenge's examples into typed argument tuples and expected values.
+    Examples that cannot be compiled are reported in 'errors' instead of 'cases'.
+    """
+    suite = {
+        'challenge_id': challenge.get('id'),
+        'version': SUITE_VERSION,
+        'fingerprint': _fingerprint(challenge),
+        'function_name': '',
+        'params': [],
+        'cases': [],
+        'errors': []
+    }
+
+    try:
+        function_name, params = parse_signature(challenge.get('template', ''))
+    except ValueError as e:
+        suite['errors'].append({'example': None, 'error': str(e)})
+        return suite
+
+    suite['function_name'] = function_name
+    suite['params'] = params
+
+    for index, example in enumerate(challenge.get('examples', [])):
+        try:
+            if 'input' not in example or 'output' not in example:
+                raise ValueError("Example must have 'input' and 'output'")
+            suite['cases'].append({
+                'example': index,
+                'args': _parse_input(example['input'], params),
+                'expected': _parse_output(example['output'])
+            })
+        except ValueError as e:
+            suite['errors'].append({'example': index, 'error': str(e)})
+
+    return suite
+
+def _serialize_suite(suite: Dict[str, Any]) -> Dict[str, Any]:
+    """Store typed values as Python literals so tuples and sets survive the JSON round trip."""
+    stored = suite.copy()
+    stored['cases'] = [{
+        'example': case['example'],
+        'args': repr(case['args']),
+        'expected': repr(case['expected'])
+    } for case in suite['cases']]
+    return stored
+
+def _deserialize_suite(stored: Dict[str, Any]) -> Dict[str, Any]:
+    """Rebuild typed values from a stored suite"""
+    suite = stored.copy()
+    suite['cases'] = [{
+        'example': case['example'],
+        'args': ast.literal_eval(case['args']),
+        'expected': ast.literal_eval(case['expected'])
+    } for case in stored['cases']]
+    return suite
+
+def get_test_suite(challenge: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Get the compiled test suite for a challenge.
+    Uses the in-memory copy, then the stored copy, and only compiles when the challenge changed.
+    """
+    challenge_id = challenge.get('id')
+    fingerprint = _fingerprint(challenge)
+
+    cached = _suite_cache.get(challenge_id)
+    if cached and cached['fingerprint'] == fingerprint:
+        return cached
+
+    suites = load_test_suites()
+    stored = suites.get(str(challenge_id))
+    if stored and stored.get('fingerprint') == fingerprint:
+        try:
+            suite = _deserialize_suite(stored)
+            _suite_cache[challenge_id] = suite
+            return suite
+        except (ValueError, SyntaxError, KeyError):
+            pass
+
+    suite = compile_test_suite(challenge)
+    if challenge_id is not None:
+        suites[str(challenge_id)] = _serialize_suite(suite)
+        save_test_suites(suites)
+        _suite_cache[challenge_id] = suite
+    return suite
+
+def format_call(suite: Dict[str, Any], args: tuple) -> str:
+    """Render a call like 'rotate_array([1, 2, 3], 1)' for a compiled case."""
+    return f"{suite['function_name']}({', '.join(repr(arg) for arg in args)})"
+
+def build_test_cases(challenge: Dict[str, Any], suite: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Build the test cases handed to graders from a compiled suite.
+    Compiled examples carry the exact call and typed expected value; malformed ones keep their raw text.
+    """
+    compiled = {case['example']: case for case in suite['cases']}
+    test_cases = []
+    for index, example in enumerate(challenge.get('examples', [])):
+        test_case = {
+            'input': example.get('input', ''),
+            'output': example.get('output', '')
+        }
+        case = compiled.get(index)
+        if case:
+            test_case['call'] = format_call(suite, case['args'])
+            test_case['expected'] = repr(case['expected'])
+        test_cases.append(test_case)
+    return test_cases
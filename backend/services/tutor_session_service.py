@@ -0,0 +1,170 @@
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Dict, List, Any, Iterator, Optional
+
+from .ai_service import ask_gemma_tutor, ask_gemma_tutor_session, tutor_user_message, TUTOR_SYSTEM_PROMPT
+from .retrieval_service import estimate_tokens
+
+# A session keeps the model state ('context' tokens from Ollama) of one chat between
+# turns, so a follow-up only sends the new question. Sessions live in memory, least
+# recently used first, and expire with the model's keep-alive.
+MAX_SESSIONS = 32
+SESSION_TTL_SECONDS = 30 * 60
+
+# Past this many context tokens a session is restarted from the chat's summary,
+# which keeps follow-ups inside the model's context window
+MAX_SESSION_CONTEXT_TOKENS = 6000
+
+# Time-to-first-token samples kept per mode for the stats endpoint
+TTFT_SAMPLES = 200
+
+# Modes: 'stateless' sends system prompt and history every turn (chat endpoint),
+# 'session_start' builds a session from the history, 'session' continues one
+MODES = ('stateless', 'session_start', 'session')
+
+_lock = threading.Lock()
+_sessions = OrderedDict()   # chat_id -> {'context', 'question_id', 'turns', 'created', 'last_used'}
+_samples = {mode: deque(maxlen=TTFT_SAMPLES) for mode in MODES}
+
+def _expire(now: float):
+    while _sessions:
+        chat_id, session = next(iter(_sessions.items()))
+        if now - session['last_used'] <= SESSION_TTL_SECONDS:
+            break
+        del _sessions[chat_id]
+
+def _usable(session: Dict[str, Any], messages: List[Dict[str, Any]]) -> bool:
+    """
+    A session only continues if the chat went on from where it left off: the session's
+    last question is still there, followed by at most its answer and the new question.
+    Edits, deletions or turns asked elsewhere start a new session.
+    """
+    for position, message in enumerate(messages):
+        if message.get('id') == session['question_id']:
+            between = messages[position + 1:-1]
+            return len(between) <= 1 and all(message.get('sender') == 'tutor' for message in between)
+    return False
+
+def get_session(chat_id: str, messages: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    now = time.time()
+    with _lock:
+        _expire(now)
+        session = _sessions.get(chat_id)
+        if session is None:
+            return None
+        if not _usable(session, messages) or len(session['context']) > MAX_SESSION_CONTEXT_TOKENS:
+            del _sessions[chat_id]
+            return None
+        _sessions.move_to_end(chat_id)
+        return session
+
+def _store_session(chat_id: str, context: List[int], question_id: str, previous: Optional[Dict[str, Any]]):
+    now = time.time()
+    with _lock:
+        _sessions[chat_id] = {
+            'context': context,
+            'question_id': question_id,
+            'turns': (previous or {}).get('turns', 0) + 1,
+            'created': (previous or {}).get('created', now),
+            'last_used': now
+        }
+        _sessions.move_to_end(chat_id)
+        while len(_sessions) > MAX_SESSIONS:
+            _sessions.popitem(last=False)
+
+def end_session(chat_id: str) -> bool:
+    with _lock:
+        return _sessions.pop(chat_id, None) is not None
+
+def _record_sample(mode: str, ttft_ms: float, state: Dict[str, Any]):
+    with _lock:
+        _samples[mode].append({
+            'ttft_ms': ttft_ms,
+            'prompt_eval_count': state.get('prompt_eval_count'),
+            'prompt_eval_duration_ms': state.get('prompt_eval_duration_ms')
+        })
+
+def _timed(stream: Iterator[str], mode: str, state: Dict[str, Any]) -> Iterator[str]:
+    """Pass the stream through, measuring the time to its first chunk"""
+    started = time.perf_counter()
+    ttft_ms = None
+    for chunk in stream:
+        if ttft_ms is None:
+            ttft_ms = round((time.perf_counter() - started) * 1000, 1)
+        yield chunk
+    if ttft_ms is not None:
+        _record_sample(mode, ttft_ms, state)
+
+def _transcript(history: List[Dict[str, str]]) -> str:
+    """History flattened into the first prompt of a session"""
+    lines = []
+    for message in history:
+        if message['role'] == 'system':
+            lines.append(message['content'])
+        else:
+            lines.append(f"{'Student' if message['role'] == 'user' else 'Tutor'}: {message['content']}")
+    return '\n\n'.join(lines)
+
+def stream_chat_answer(chat_id: str, prompt: str, context: str, turn: Dict[str, Any],
+                       use_session: bool = True) -> Dict[str, Any]:
+    """
+    Start answering a chat turn. With use_session, a live session of the chat is continued
+    (only the new question is processed); otherwise one is started from the turn's history.
+    Returns {'mode', 'prompt_tokens' (estimated tokens the model has to process), 'stream'}.
+    """
+    question = tutor_user_message(prompt, context)
+    state = {}
+    if not use_session:
+        return {
+            'mode': 'stateless',
+            'prompt_tokens': estimate_tokens(TUTOR_SYSTEM_PROMPT) + turn['tokens'] + estimate_tokens(question),
+            'stream': _timed(ask_gemma_tutor(prompt, context, turn['history']), 'stateless', state)
+        }
+
+    session = get_session(chat_id, turn['messages'])
+    if session:
+        mode, context_tokens = 'session', session['context']
+        prompt_tokens = estimate_tokens(question)
+    else:
+        mode, context_tokens = 'session_start', None
+        earlier = _transcript(turn['history'])
+        if earlier:
+            question = f"Conversation so far:\n\n{earlier}\n\n{question}"
+        prompt_tokens = estimate_tokens(TUTOR_SYSTEM_PROMPT) + estimate_tokens(question)
+
+    def stream():
+        yield from _timed(ask_gemma_tutor_session(question, state, context_tokens), mode, state)
+        if state.get('context'):
+            _store_session(chat_id, state['context'], turn['message']['id'], session)
+
+    return {'mode': mode, 'prompt_tokens': prompt_tokens, 'stream': stream()}
+
+def _summarize(samples: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if not samples:
+        return {'count': 0}
+    ttfts = sorted(sample['ttft_ms'] for sample in samples)
+    prefill = [sample['prompt_eval_count'] for sample in samples if sample['prompt_eval_count'] is not None]
+    return {
+        'count': len(ttfts),
+        'ttft_ms_mean': round(sum(ttfts) / len(ttfts), 1),
+        'ttft_ms_p50': ttfts[len(ttfts) // 2],
+        'ttft_ms_p95': ttfts[min(len(ttfts) - 1, int(len(ttfts) * 0.95))],
+        'prompt_tokens_mean': round(sum(prefill) / len(prefill), 1) if prefill else None
+    }
+
+def session_stats() -> Dict[str, Any]:
+    """Live sessions and time-to-first-token per mode, to compare follow-ups with the stateless path"""
+    with _lock:
+        _expire(time.time())
+        modes = {mode: _summarize(list(samples)) for mode, samples in _samples.items()}
+        sessions = [{'chat_id': chat_id, 'turns': session['turns'], 'context_tokens': len(session['context']),
+                     'idle_seconds': round(time.time() - session['last_used'])}
+                    for chat_id, session in _sessions.items()]
+    stateless, follow_up = modes['stateless'].get('ttft_ms_mean'), modes['session'].get('ttft_ms_mean')
+    return {
+        'sessions': sessions,
+        'max_sessions': MAX_SESSIONS,
+        'ttft': modes,
+        'follow_up_speedup': round(stateless / follow_up, 2) if stateless and follow_up else None
+    }
@@ -1,6 +1,7 @@
 import time
 from ollama import chat
 import json
+from services.ai_service import MODEL_OPTIONS
 
 
 VERIFICATION_MODEL = "gemma3n"
@@ -52,7 +53,7 @@ TEST CASES:
 
 INSTRUCTIONS:
 1. Analyze the user's code for syntax errors, logic errors, and completeness
-2. For each test case, determine what the code would output given the input
+2. For each test case, determine what the code would output given the input (when a test case has a "call", that is the exact function call to evaluate and "expected" is the exact expected return value)
 3. Compare the expected output with what the code would actually produce
 4. Be strict but fair - if the code is incomplete, has errors, or won't produce the expected output, mark it as failed
 
@@ -87,6 +88,7 @@ IMPORTANT:
         def extract_content():
             ollama_response = chat(
                 model=VERIFICATION_MODEL,
+                options=MODEL_OPTIONS,  # same num_ctx as the tutor, so the model is not reloaded
                 messages=[
                     {"role": "system", "content": (
                         "You are an expert programming evaluator. You analyze code and determine if it correctly solves programming problems. "
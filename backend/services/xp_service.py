@@ -1,382 +1,234 @@
 import json
-from typing import Dict, Any, Optional
+import uuid
+from typing import Dict, List, Any, Optional
 from datetime import datetime
-from .achievement_service import update_achievement_progress, update_streak, calculate_level
+from .ledger_service import record_xp, preview_xp, ledger_lock
+from .activity_service import current_streak
+from .epoch_service import resolve_progress, write_progress
+from .achievement_service import (
+    calculate_level, apply_streak, apply_achievement_progress, apply_progress_counters,
+    unlock_changed_achievements, new_user_progress
+)
 
 def load_progress() -> Dict[str, Any]:
     """Load user progress from JSON file."""
     try:
         with open('data/progress.json', 'r') as f:
-            return json.load(f)
+            return resolve_progress(json.load(f))
     except FileNotFoundError:
         return {}
 
 def save_progress(progress: Dict[str, Any]):
     """Save user progress to JSON file."""
-    with open('data/progress.json', 'w') as f:
-        json.dump(progress, f, indent=2)
+    write_progress(progress)
 
 def award_xp_for_challenge(user_id: str, challenge_id: int, xp_amount: int, challenge_data: Dict[str, Any] = None) -> Dict[str, Any]:
     """Award XP for completing a challenge."""
     from .challenge_service import update_user_progress
     
-    # Use existing challenge service for consistency
-    result = update_user_progress(user_id, challenge_id, xp_amount, challenge_data)
-    
-    # Update streak for any learning activity
-    update_streak(user_id)
-    
-    return result
+    # Use existing challenge service for consistency (it also updates the streak)
+    return update_user_progress(user_id, challenge_id, xp_amount, challenge_data)
 
-def award_xp_for_flashcard(user_id: str, flashcard_id: int, xp_amount: int = 10) -> Dict[str, Any]:
-    """Award XP for learning a flashcard."""
-    progress = load_progress()
-    
-    if user_id not in progress:
-        progress[user_id] = {
-            'total_xp': 0,
-            'completed_challenges': [],
-            'completed_courses': [],
-            'completed_lessons': [],
-            'level': 1,
-            'streak': 0,
-            'longest_streak': 0,
-            'last_active_date': datetime.now().isoformat(),
-            'achievements': [],
-            'achievement_progress': {
-                'challenges_completed': 0,
-                'flashcards_learned': 0,
-                'courses_completed': 0,
-                'lessons_completed': 0,
-                'streak_days': 0,
-                'perfect_solutions': 0,
-                'different_topics': 0,
-                'different_difficulties': 0
-            },
-            'stats': {
-                'total_challenges_completed': 0,
-                'total_flashcards_learned': 0,
-                'total_courses_completed': 0,
-                'total_lessons_completed': 0,
-                'total_perfect_solutions': 0,
-                'total_topics_covered': 0,
-                'total_difficulties_tried': 0,
-                'average_challenge_time': 0,
-                'favorite_topic': '',
-                'favorite_difficulty': ''
-            }
+def apply_award_to_record(user_id: str, user_progress: Dict[str, Any], xp_amount: int, source_type: str,
+                          source_id: Any, action: str, progress_type: Optional[str] = None, value: int = 1,
+                          additional_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Apply one learning activity to a user's progress record in memory:
+    streak, XP, achievement progress and level are all updated on the same record.
+    The XP is recorded in the ledger first; an award that was already recorded changes nothing.
+    The caller saves the record.
+    """
+    entry = record_xp(user_id, source_type, source_id, action, xp_amount, user_progress['total_xp'])
+    if entry is None:
+        return {
+            'progress': user_progress,
+            'new_achievements': [],
+            'achievement_xp_earned': 0,
+            'total_xp_earned': 0,
+            'duplicate': True
         }
     
-    user_progress = progress[user_id]
-    
-    # Update streak first
-    user_progress = update_streak(user_id)
+    # Update streak and today's XP in the activity calendar
+    apply_streak(user_progress, user_id=user_id, xp=entry['amount'])
     
-    # Add XP
-    user_progress['total_xp'] += xp_amount
+    # The ledger balance is the source of truth for XP (never below 0)
+    user_progress['total_xp'] = entry['balance']
     
     # Update achievement progress
-    achievement_result = update_achievement_progress(user_id, 'flashcard_learned', 1)
+    new_achievements = []
+    if progress_type:
+        new_achievements = apply_achievement_progress(user_id, user_progress, progress_type, value, additional_data)
     
     # Recalculate level
     user_progress['level'] = calculate_level(user_progress['total_xp'])
     
-    # Update progress
-    progress[user_id] = user_progress
-    save_progress(progress)
-    
     return {
         'progress': user_progress,
-        'new_achievements': achievement_result['new_achievements'],
-        'achievement_xp_earned': achievement_result['xp_earned'],
-        'total_xp_earned': xp_amount + achievement_result['xp_earned']
+        'new_achievements': new_achievements,
+        'achievement_xp_earned': 0,  # Achievements are cosmetic
+        'total_xp_earned': entry['amount'],
+        'duplicate': False
     }
 
-def deduct_xp_for_flashcard(user_id: str, flashcard_id: int, xp_amount: int = 10) -> Dict[str, Any]:
-    """Deduct XP for forgetting a flashcard."""
+def _apply_award(user_id: str, xp_amount: int, source_type: str, source_id: Any, action: str,
+                 progress_type: Optional[str] = None, value: int = 1,
+                 additional_data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Apply one learning activity in a single read-modify-write of progress.json."""
     progress = load_progress()
+    user_progress = progress.setdefault(user_id, new_user_progress())
     
-    if user_id not in progress:
+    result = apply_award_to_record(user_id, user_progress, xp_amount, source_type, source_id, action,
+                                   progress_type, value, additional_data)
+    if not result['duplicate']:
+        save_progress(progress)
+    return result
+
+def award_xp_for_flashcard(user_id: str, flashcard_id: int, xp_amount: int = 10) -> Dict[str, Any]:
+    """Award XP for learning a flashcard (once until it is forgotten)."""
+    return _apply_award(user_id, xp_amount, 'flashcard', flashcard_id, 'learned', 'flashcard_learned', 1)
+
+def deduct_xp_for_flashcard(user_id: str, flashcard_id: int, xp_amount: int = 10) -> Dict[str, Any]:
+    """Deduct XP for forgetting a flashcard (only if it was learned)."""
+    if user_id not in load_progress():
         return {
             'progress': {},
             'new_achievements': [],
             'achievement_xp_earned': 0,
-            'total_xp_earned': 0
+            'total_xp_earned': 0,
+            'duplicate': False
         }
     
-    user_progress = progress[user_id]
-    
-    # Update streak first
-    user_progress = update_streak(user_id)
-    
-    # Deduct XP (ensure it doesn't go below 0)
-    user_progress['total_xp'] = max(0, user_progress['total_xp'] - xp_amount)
-    
-    # Update achievement progress (decrease flashcard count)
-    achievement_result = update_achievement_progress(user_id, 'flashcard_learned', -1)
-    
-    # Recalculate level
-    user_progress['level'] = calculate_level(user_progress['total_xp'])
-    
-    # Update progress
-    progress[user_id] = user_progress
-    save_progress(progress)
-    
-    return {
-        'progress': user_progress,
-        'new_achievements': achievement_result['new_achievements'],
-        'achievement_xp_earned': achievement_result['xp_earned'],
-        'total_xp_earned': -xp_amount + achievement_result['xp_earned']
-    }
+    # Decrease flashcard count
+    return _apply_award(user_id, -xp_amount, 'flashcard', flashcard_id, 'forgotten', 'flashcard_learned', -1)
 
 def award_xp_for_lesson_completion(user_id: str, course_id: str, lesson_id: str, xp_amount: int) -> Dict[str, Any]:
     """Award XP for completing a lesson."""
-    progress = load_progress()
-    
-    if user_id not in progress:
-        progress[user_id] = {
-            'total_xp': 0,
-            'completed_challenges': [],
-            'completed_courses': [],
-            'completed_lessons': [],
-            'level': 1,
-            'streak': 0,
-            'longest_streak': 0,
-            'last_active_date': datetime.now().isoformat(),
-            'achievements': [],
-            'achievement_progress': {
-                'challenges_completed': 0,
-                'flashcards_learned': 0,
-                'courses_completed': 0,
-                'lessons_completed': 0,
-                'streak_days': 0,
-                'perfect_solutions': 0,
-                'different_topics': 0,
-                'different_difficulties': 0
-            },
-            'stats': {
-                'total_challenges_completed': 0,
-                'total_flashcards_learned': 0,
-                'total_courses_completed': 0,
-                'total_lessons_completed': 0,
-                'total_perfect_solutions': 0,
-                'total_topics_covered': 0,
-                'total_difficulties_tried': 0,
-                'average_challenge_time': 0,
-                'favorite_topic': '',
-                'favorite_difficulty': ''
-            }
-        }
-    
-    user_progress = progress[user_id]
-    
-    # Update streak first
-    user_progress = update_streak(user_id)
-    
-    # Add XP
-    user_progress['total_xp'] += xp_amount
-    
-    # Update achievement progress
     additional_data = {
         'lesson_id': lesson_id,
         'course_id': course_id
     }
-    achievement_result = update_achievement_progress(user_id, 'lesson_completed', 1, additional_data)
-    
-    # Recalculate level
-    user_progress['level'] = calculate_level(user_progress['total_xp'])
-    
-    # Update progress
-    progress[user_id] = user_progress
-    save_progress(progress)
-    
-    return {
-        'progress': user_progress,
-        'new_achievements': achievement_result['new_achievements'],
-        'achievement_xp_earned': achievement_result['xp_earned'],
-        'total_xp_earned': xp_amount + achievement_result['xp_earned']
-    }
+    return _apply_award(user_id, xp_amount, 'lesson', f"{course_id}/{lesson_id}", 'completed',
+                        'lesson_completed', 1, additional_data)
 
 def award_xp_for_course_completion(user_id: str, course_id: str, xp_amount: int) -> Dict[str, Any]:
     """Award XP for completing a course."""
-    progress = load_progress()
-    
-    if user_id not in progress:
-        progress[user_id] = {
-            'total_xp': 0,
-            'completed_challenges': [],
-            'completed_courses': [],
-            'completed_lessons': [],
-            'level': 1,
-            'streak': 0,
-            'longest_streak': 0,
-            'last_active_date': datetime.now().isoformat(),
-            'achievements': [],
-            'achievement_progress': {
-                'challenges_completed': 0,
-                'flashcards_learned': 0,
-                'courses_completed': 0,
-                'lessons_completed': 0,
-                'streak_days': 0,
-                'perfect_solutions': 0,
-                'different_topics': 0,
-                'different_difficulties': 0
-            },
-            'stats': {
-                'total_challenges_completed': 0,
-                'total_flashcards_learned': 0,
-                'total_courses_completed': 0,
-                'total_lessons_completed': 0,
-                'total_perfect_solutions': 0,
-                'total_topics_covered': 0,
-                'total_difficulties_tried': 0,
-                'average_challenge_time': 0,
-                'favorite_topic': '',
-                'favorite_difficulty': ''
-            }
-        }
-    
-    user_progress = progress[user_id]
-    
-    # Update streak first
-    user_progress = update_streak(user_id)
-    
-    # Add XP
-    user_progress['total_xp'] += xp_amount
-    
-    # Update achievement progress
     additional_data = {
         'course_id': course_id
     }
-    achievement_result = update_achievement_progress(user_id, 'course_completed', 1, additional_data)
-    
-    # Recalculate level
-    user_progress['level'] = calculate_level(user_progress['total_xp'])
-    
-    # Update progress
-    progress[user_id] = user_progress
-    save_progress(progress)
-    
-    return {
-        'progress': user_progress,
-        'new_achievements': achievement_result['new_achievements'],
-        'achievement_xp_earned': achievement_result['xp_earned'],
-        'total_xp_earned': xp_amount + achievement_result['xp_earned']
-    }
+    return _apply_award(user_id, xp_amount, 'course', course_id, 'completed', 'course_completed', 1, additional_data)
 
-def award_xp_for_perfect_solution(user_id: str, xp_amount: int = 25) -> Dict[str, Any]:
-    """Award bonus XP for perfect solution."""
-    progress = load_progress()
-    
-    if user_id not in progress:
-        progress[user_id] = {
-            'total_xp': 0,
-            'completed_challenges': [],
-            'completed_courses': [],
-            'completed_lessons': [],
-            'level': 1,
-            'streak': 0,
-            'longest_streak': 0,
-            'last_active_date': datetime.now().isoformat(),
-            'achievements': [],
-            'achievement_progress': {
-                'challenges_completed': 0,
-                'flashcards_learned': 0,
-                'courses_completed': 0,
-                'lessons_completed': 0,
-                'streak_days': 0,
-                'perfect_solutions': 0,
-                'different_topics': 0,
-                'different_difficulties': 0
-            },
-            'stats': {
-                'total_challenges_completed': 0,
-                'total_flashcards_learned': 0,
-                'total_courses_completed': 0,
-                'total_lessons_completed': 0,
-                'total_perfect_solutions': 0,
-                'total_topics_covered': 0,
-                'total_difficulties_tried': 0,
-                'average_challenge_time': 0,
-                'favorite_topic': '',
-                'favorite_difficulty': ''
-            }
-        }
-    
-    user_progress = progress[user_id]
-    
-    # Update streak first
-    user_progress = update_streak(user_id)
-    
-    # Add XP
-    user_progress['total_xp'] += xp_amount
-    
-    # Update achievement progress
-    achievement_result = update_achievement_progress(user_id, 'perfect_solution', 1)
-    
-    # Recalculate level
-    user_progress['level'] = calculate_level(user_progress['total_xp'])
-    
-    # Update progress
-    progress[user_id] = user_progress
-    save_progress(progress)
+def award_xp_for_perfect_solution(user_id: str, xp_amount: int = 25, challenge_id: Optional[int] = None) -> Dict[str, Any]:
+    """Award bonus XP for perfect solution (once per challenge when challenge_id is given)."""
+    source_id = challenge_id if challenge_id is not None else uuid.uuid4().hex
+    return _apply_award(user_id, xp_amount, 'perfect_solution', source_id, 'awarded', 'perfect_solution', 1)
+
+# Activity events accepted by apply_activity_batch:
+# type -> (ledger source type, ledger action, achievement progress type, progress value, default XP)
+ACTIVITY_EVENTS = {
+    'flashcard_learned': ('flashcard', 'learned', 'flashcard_learned', 1, 10),
+    'flashcard_forgotten': ('flashcard', 'forgotten', 'flashcard_learned', -1, 10),
+    'lesson_completed': ('lesson', 'completed', 'lesson_completed', 1, 100),
+    'course_completed': ('course', 'completed', 'course_completed', 1, 200),
+    'perfect_solution': ('perfect_solution', 'awarded', 'perfect_solution', 1, 25)
+}
+
+def _event_source(event: Dict[str, Any]) -> tuple:
+    """Ledger source id and achievement data of an activity event; raises ValueError if ids are missing."""
+    event_type = event['type']
+    if event_type in ('flashcard_learned', 'flashcard_forgotten'):
+        if event.get('flashcard_id') is None:
+            raise ValueError(f"{event_type} needs flashcard_id")
+        return event['flashcard_id'], None
+    if event_type == 'lesson_completed':
+        if not event.get('course_id') or not event.get('lesson_id'):
+            raise ValueError("lesson_completed needs course_id and lesson_id")
+        return f"{event['course_id']}/{event['lesson_id']}", {'lesson_id': event['lesson_id'], 'course_id': event['course_id']}
+    if event_type == 'course_completed':
+        if not event.get('course_id'):
+            raise ValueError("course_completed needs course_id")
+        return event['course_id'], {'course_id': event['course_id']}
+    if event.get('challenge_id') is None:
+        raise ValueError("perfect_solution needs challenge_id")
+    return event['challenge_id'], None
+
+def apply_activity_batch(user_id: str, events: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Apply many activity events for one user in a single transaction.
+    Events are validated and checked against the ledger up front; the streak and achievements
+    are evaluated once for the whole batch, progress.json is written once, and only then are
+    the awards appended to the ledger. Raises ValueError for an unknown event type or missing ids (nothing is applied).
+    """
+    sources = []
+    for index, event in enumerate(events):
+        if event.get('type') not in ACTIVITY_EVENTS:
+            raise ValueError(f"Event {index}: unknown type '{event.get('type')}'")
+        try:
+            sources.append(_event_source(event))
+        except ValueError as e:
+            raise ValueError(f"Event {index}: {e}")
+    
+    awards = []
+    for event, (source_id, _) in zip(events, sources):
+        source_type, action, _, _, default_xp = ACTIVITY_EVENTS[event['type']]
+        xp_amount = event.get('xp_amount')
+        xp_amount = default_xp if xp_amount is None else xp_amount
+        awards.append((source_type, source_id, action, -xp_amount if action == 'forgotten' else xp_amount))
+    
+    # The ledger is only written once progress.json is saved, so a failure partway leaves
+    # neither changed and a retry applies the whole batch; the lock keeps the preview valid
+    with ledger_lock:
+        progress = load_progress()
+        user_progress = progress.setdefault(user_id, new_user_progress())
+        opening_balance = user_progress['total_xp']
+        planned = preview_xp(user_id, awards, opening_balance)
+        
+        results = []
+        xp_earned = 0
+        for index, (event, (_, additional_data), amount) in enumerate(zip(events, sources, planned['amounts'])):
+            if amount is None:
+                results.append({'index': index, 'type': event['type'], 'xp_earned': 0, 'duplicate': True})
+                continue
+            _, _, progress_type, value, _ = ACTIVITY_EVENTS[event['type']]
+            xp_earned += amount
+            apply_progress_counters(user_progress, progress_type, value, additional_data)
+            results.append({'index': index, 'type': event['type'], 'xp_earned': amount, 'duplicate': False})
+        
+        new_achievements = []
+        if any(amount is not None for amount in planned['amounts']):
+            apply_streak(user_progress, user_id=user_id, xp=xp_earned)
+            user_progress['total_xp'] = planned['balance']
+            user_progress['level'] = calculate_level(user_progress['total_xp'])
+            new_achievements = unlock_changed_achievements(user_progress)
+            save_progress(progress)
+            for award, amount in zip(awards, planned['amounts']):
+                if amount is not None:
+                    record_xp(user_id, *award, opening_balance=opening_balance)
     
     return {
         'progress': user_progress,
-        'new_achievements': achievement_result['new_achievements'],
-        'achievement_xp_earned': achievement_result['xp_earned'],
-        'total_xp_earned': xp_amount + achievement_result['xp_earned']
+        'results': results,
+        'applied': sum(1 for result in results if not result['duplicate']),
+        'duplicates': sum(1 for result in results if result['duplicate']),
+        'total_xp_earned': xp_earned,
+        'new_achievements': new_achievements,
+        'achievement_xp_earned': 0  # Achievements are cosmetic
     }
 
 def get_user_progress(user_id: str) -> Dict[str, Any]:
-    """Get user progress with streak update."""
+    """
+    Get user progress. Aggregates are maintained as activities happen, so this is a plain lookup;
+    use repair_service to recompute them from scratch.
+    """
     progress = load_progress()
     
     if user_id not in progress:
         # Initialize new user
-        progress[user_id] = {
-            'total_xp': 0,
-            'completed_challenges': [],
-            'completed_courses': [],
-            'completed_lessons': [],
-            'level': 1,
-            'streak': 0,
-            'longest_streak': 0,
-            'last_active_date': datetime.now().isoformat(),
-            'achievements': [],
-            'achievement_progress': {
-                'challenges_completed': 0,
-                'flashcards_learned': 0,
-                'courses_completed': 0,
-                'lessons_completed': 0,
-                'streak_days': 0,
-                'perfect_solutions': 0,
-                'different_topics': 0,
-                'different_difficulties': 0
-            },
-            'stats': {
-                'total_challenges_completed': 0,
-                'total_flashcards_learned': 0,
-                'total_courses_completed': 0,
-                'total_lessons_completed': 0,
-                'total_perfect_solutions': 0,
-                'total_topics_covered': 0,
-                'total_difficulties_tried': 0,
-                'average_challenge_time': 0,
-                'favorite_topic': '',
-                'favorite_difficulty': ''
-            }
-        }
+        progress[user_id] = new_user_progress()
+        progress[user_id]['last_active_date'] = datetime.now().isoformat()
         save_progress(progress)
-        return progress[user_id]
-    
-    # Update streak for existing user
-    user_progress = update_streak(user_id)
-    
-    # Fix achievement progress by recalculating based on actual data
-    from .achievement_service import fix_achievement_progress
-    fix_achievement_progress(user_id)
     
-    # Reload and return updated progress
-    progress = load_progress()
-    return progress[user_id] 
\ No newline at end of file
+    # A streak lapses once a full day is missed; derive it from the calendar without writing
+    user_progress = progress[user_id]
+    if user_progress.get('activity') is not None:
+        user_progress['streak'] = current_streak(user_progress)
+    return user_progress
@@ -0,0 +1,12 @@
+#!/bin/bash
+
+echo "Repairing user progress aggregates..."
+
+# Navigate to backend directory
+cd backend
+
+# Recompute achievement progress and stats from raw progress data
+# Usage: ./repair_progress.sh [user_id] [--dry-run]
+python3 -m services.repair_service "$@"
+
+echo "Repair finished."